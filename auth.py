@@ -0,0 +1,332 @@
+"""Password hashing and sessions.
+
+Passwords are stored as self-describing strings:
+
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+
+with base64 salt and hash. Rows written before this module hold an unsalted
+hex SHA-256; they still verify and are re-hashed with the current KDF on the
+user's next successful login.
+
+The KDF is deliberately slow, so Authenticator runs it on a bounded worker
+pool and hands out session tokens; the service authenticates every later
+request by its token alone, checked with a dict lookup instead of a hash.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+
+from database import Database
+
+# scrypt needs OpenSSL 1.1+; PBKDF2 is always available
+DEFAULT_KDF = "scrypt" if hasattr(hashlib, "scrypt") else "pbkdf2_sha256"
+SCRYPT_PARAMS = {"n": 2**14, "r": 8, "p": 1}
+PBKDF2_ITERATIONS = 600000
+SALT_BYTES = 16
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def hash_password(password: str, kdf: str = DEFAULT_KDF) -> str:
+    """Hash a password with a fresh salt into its stored form"""
+    salt = os.urandom(SALT_BYTES)
+    if kdf == "scrypt":
+        n, r, p = SCRYPT_PARAMS["n"], SCRYPT_PARAMS["r"], SCRYPT_PARAMS["p"]
+        derived = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=32)
+        return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(derived)}"
+    if kdf == "pbkdf2_sha256":
+        derived = hashlib.pbkdf2_hmac(
+            "sha256", password.encode(), salt, PBKDF2_ITERATIONS
+        )
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(derived)}"
+    raise ValueError(f"Unknown KDF: {kdf}")
+
+
+def dummy_hash(kdf: str = DEFAULT_KDF) -> str:
+    """A stored form no password matches, which costs a full KDF run to check"""
+    salt, derived = _b64(os.urandom(SALT_BYTES)), _b64(os.urandom(32))
+    if kdf == "scrypt":
+        n, r, p = SCRYPT_PARAMS["n"], SCRYPT_PARAMS["r"], SCRYPT_PARAMS["p"]
+        return f"scrypt${n}${r}${p}${salt}${derived}"
+    if kdf == "pbkdf2_sha256":
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt}${derived}"
+    raise ValueError(f"Unknown KDF: {kdf}")
+
+
+def is_legacy_hash(stored: str) -> bool:
+    return "$" not in stored
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """Check a password against any stored form, in constant time"""
+    if is_legacy_hash(stored):
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(candidate, stored)
+
+    kdf, *fields = stored.split("$")
+    if kdf == "scrypt":
+        n, r, p, salt, expected = fields
+        derived = hashlib.scrypt(
+            password.encode(),
+            salt=base64.b64decode(salt),
+            n=int(n),
+            r=int(r),
+            p=int(p),
+            dklen=32,
+        )
+    elif kdf == "pbkdf2_sha256":
+        iterations, salt, expected = fields
+        derived = hashlib.pbkdf2_hmac(
+            "sha256", password.encode(), base64.b64decode(salt), int(iterations)
+        )
+    else:
+        return False
+    return hmac.compare_digest(derived, base64.b64decode(expected))
+
+
+def needs_rehash(stored: str, kdf: str = DEFAULT_KDF) -> bool:
+    """Whether a stored hash is legacy or weaker than the current settings"""
+    if is_legacy_hash(stored):
+        return True
+    scheme, *fields = stored.split("$")
+    if scheme != kdf:
+        return True
+    if kdf == "scrypt":
+        return [int(f) for f in fields[:3]] != [
+            SCRYPT_PARAMS["n"],
+            SCRYPT_PARAMS["r"],
+            SCRYPT_PARAMS["p"],
+        ]
+    return int(fields[0]) != PBKDF2_ITERATIONS
+
+
+def _check_password(
+    password: str, stored: str, kdf: str
+) -> Tuple[bool, Optional[str], float]:
+    """Worker task: verify, re-hash if outdated, and time the KDF work"""
+    started = time.perf_counter()
+    ok = verify_password(password, stored)
+    upgraded = None
+    if ok and needs_rehash(stored, kdf):
+        upgraded = hash_password(password, kdf)
+    return ok, upgraded, time.perf_counter() - started
+
+
+def _timed_hash(password: str, kdf: str) -> Tuple[str, float]:
+    started = time.perf_counter()
+    return hash_password(password, kdf), time.perf_counter() - started
+
+
+class Authenticator:
+    """Runs password hashing off the caller's thread and issues sessions.
+
+    At most ``workers`` hashes run at once and at most ``max_pending`` wait;
+    logins beyond that are refused at once rather than queued without bound.
+    hashlib releases the GIL while hashing, so threads scale across cores;
+    use_processes=True isolates the work in processes instead.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        use_processes: bool = False,
+        session_ttl: float = 900.0,
+        kdf: str = DEFAULT_KDF,
+        purge_interval: float = 60.0,
+    ):
+        self.db = database
+        self.workers = workers or os.cpu_count() or 1
+        self.kdf = kdf
+        # Checked in place of a missing user's hash, so that unknown names
+        # take as long to reject as wrong passwords
+        self._dummy_hash = dummy_hash(kdf)
+        self.session_ttl = session_ttl
+        # Expired sessions are swept by create_session at most this often, so
+        # tokens that are never presented again do not pile up
+        self.purge_interval = purge_interval
+        self._next_purge = time.monotonic() + purge_interval
+        self._executor: Executor = (
+            ProcessPoolExecutor(self.workers)
+            if use_processes
+            else ThreadPoolExecutor(self.workers, thread_name_prefix="medichain-kdf")
+        )
+        if max_pending is None:
+            max_pending = self.workers * 8
+        # One slot per running hash plus one per queued hash
+        self._slots = threading.BoundedSemaphore(self.workers + max_pending)
+        # token -> (username, user_type, expiry on the monotonic clock)
+        self._sessions: Dict[str, Tuple[str, str, float]] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "logins": 0,
+            "failures": 0,
+            "upgrades": 0,
+            "rejected": 0,
+            "hashes": 0,
+            "kdf_seconds": 0.0,
+            "verifications": 0,
+            "latency_seconds": 0.0,
+        }
+        self._started = time.monotonic()
+
+    def _submit(self, fn, *args) -> Optional[Future]:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            return None
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def hash_async(self, password: str) -> Future:
+        """Hash a password in the pool; resolves to None if the pool is full"""
+        result: Future = Future()
+        work = self._submit(_timed_hash, password, self.kdf)
+        if work is None:
+            result.set_result(None)
+            return result
+
+        def done(work: Future):
+            try:
+                password_hash, seconds = work.result()
+                with self._lock:
+                    self._stats["hashes"] += 1
+                    self._stats["kdf_seconds"] += seconds
+                result.set_result(password_hash)
+            except Exception as e:
+                print(f"Error hashing password: {str(e)}")
+                result.set_result(None)
+
+        work.add_done_callback(done)
+        return result
+
+    def register(self, username: str, password: str, user_type: str) -> bool:
+        password_hash = self.hash_async(password).result()
+        if password_hash is None:
+            return False
+        return self.db.add_user(username, password_hash, user_type)
+
+    def authenticate_async(self, username: str, password: str) -> Future:
+        """Verify a login in the pool; resolves to (ok, user_type).
+
+        A successful login against a legacy or outdated hash stores a fresh
+        hash in the same pass. An unknown username is checked against a dummy
+        hash, so it fails no faster than a wrong password.
+        """
+        result: Future = Future()
+        user = self.db.get_user(username)
+        stored = user[1] if user else self._dummy_hash
+
+        started = time.perf_counter()
+        work = self._submit(_check_password, password, stored, self.kdf)
+        if work is None:
+            result.set_result((False, None))
+            return result
+
+        def done(work: Future):
+            try:
+                ok, upgraded, seconds = work.result()
+                ok = ok and user is not None
+                if upgraded is not None:
+                    self.db.update_user_password(username, upgraded)
+                with self._lock:
+                    self._stats["logins" if ok else "failures"] += 1
+                    self._stats["upgrades"] += upgraded is not None
+                    self._stats["hashes"] += 1
+                    self._stats["kdf_seconds"] += seconds
+                    self._stats["verifications"] += 1
+                    self._stats["latency_seconds"] += time.perf_counter() - started
+                result.set_result((True, user[2]) if ok else (False, None))
+            except Exception as e:
+                print(f"Error authenticating user: {str(e)}")
+                result.set_result((False, None))
+
+        work.add_done_callback(done)
+        return result
+
+    def authenticate(self, username: str, password: str) -> Tuple[bool, Optional[str]]:
+        return self.authenticate_async(username, password).result()
+
+    def login(self, username: str, password: str) -> Optional[str]:
+        """Authenticate and return a new session token, or None"""
+        ok, user_type = self.authenticate(username, password)
+        return self.create_session(username, user_type) if ok else None
+
+    def create_session(self, username: str, user_type: str) -> str:
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_purge:
+                self._purge_expired(now)
+            self._sessions[token] = (username, user_type, now + self.session_ttl)
+        return token
+
+    def validate_session(self, token: str) -> Optional[Tuple[str, str]]:
+        """Return (username, user_type) for a live session token"""
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            if session[2] <= time.monotonic():
+                del self._sessions[token]
+                return None
+            return session[0], session[1]
+
+    def end_session(self, token: str):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def purge_sessions(self) -> int:
+        """Drop expired sessions and return how many were removed"""
+        with self._lock:
+            return self._purge_expired(time.monotonic())
+
+    def _purge_expired(self, now: float) -> int:
+        # Callers hold self._lock
+        expired = [t for t, s in self._sessions.items() if s[2] <= now]
+        for token in expired:
+            del self._sessions[token]
+        self._next_purge = now + self.purge_interval
+        return len(expired)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Login counters, mean KDF cost and the pool's logins/sec capacity"""
+        with self._lock:
+            stats = dict(self._stats)
+            sessions = len(self._sessions)
+        mean_kdf = stats["kdf_seconds"] / stats["hashes"] if stats["hashes"] else None
+        mean_latency = (
+            stats["latency_seconds"] / stats["verifications"]
+            if stats["verifications"]
+            else None
+        )
+        uptime = time.monotonic() - self._started
+        return {
+            "logins": stats["logins"],
+            "failures": stats["failures"],
+            "upgrades": stats["upgrades"],
+            "rejected": stats["rejected"],
+            "active_sessions": sessions,
+            "workers": self.workers,
+            "mean_kdf_ms": mean_kdf * 1000 if mean_kdf else None,
+            "mean_latency_ms": mean_latency * 1000 if mean_latency else None,
+            # Each worker completes one hash per mean_kdf seconds
+            "capacity_logins_per_second": self.workers / mean_kdf if mean_kdf else None,
+            "observed_logins_per_second": (
+                (stats["logins"] + stats["failures"]) / uptime if uptime else 0.0
+            ),
+        }
+
+    def close(self):
+        self._executor.shutdown()
@@ -0,0 +1,59 @@
+"""Throughput and peak memory of streaming attachment encryption.
+
+Encrypts and decrypts files of growing size with AttachmentCipher and
+reports MB/s and the peak Python allocation, which should stay near one
+chunk whatever the file size. Needs the cryptography package.
+
+Usage: python benchmarks/bench_attachment_encryption.py [max_mb]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from encryption import AttachmentCipher  # noqa: E402
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    max_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    cipher = AttachmentCipher(os.urandom(32))
+
+    print(f"{'MB':>6} {'enc MB/s':>9} {'dec MB/s':>9} {'peak KiB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, "scan.bin")
+        sealed = os.path.join(tmp, "scan.enc")
+        restored = os.path.join(tmp, "scan.out")
+        size_mb = 1
+        while size_mb <= max_mb:
+            with open(plain, "wb") as f:
+                for _ in range(size_mb):
+                    f.write(os.urandom(2**20))
+
+            encrypt, encrypt_peak = measure(
+                lambda: cipher.encrypt_file(plain, sealed, b"patient")
+            )
+            decrypt, decrypt_peak = measure(
+                lambda: cipher.decrypt_file(sealed, restored, b"patient")
+            )
+            print(
+                f"{size_mb:>6} {size_mb / encrypt:>9.1f} {size_mb / decrypt:>9.1f} "
+                f"{max(encrypt_peak, decrypt_peak) / 1024:>9.0f}"
+            )
+            size_mb *= 4
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Login throughput of the Authenticator worker pool.
+
+Registers users, then fires concurrent logins at pools of increasing size
+and reports achieved logins/sec next to the pool's own capacity estimate.
+
+Usage: python benchmarks/bench_auth.py [logins] [max_workers]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from auth import Authenticator  # noqa: E402
+from database import Database  # noqa: E402
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "auth.db"))
+        setup = Authenticator(db)
+        for i in range(20):
+            setup.register(f"user{i}", f"password{i}", "patient")
+        setup.close()
+
+        print(f"{logins} logins")
+        print(f"{'workers':>8} {'logins/s':>10} {'capacity':>10} {'mean ms':>8}")
+        workers = 1
+        while workers <= max_workers:
+            auth = Authenticator(db, workers=workers, max_pending=logins)
+            started = time.perf_counter()
+            futures = [
+                auth.authenticate_async(f"user{i % 20}", f"password{i % 20}")
+                for i in range(logins)
+            ]
+            assert all(future.result()[0] for future in futures)
+            seconds = time.perf_counter() - started
+            metrics = auth.metrics()
+            print(
+                f"{workers:>8} {logins / seconds:>10.1f} "
+                f"{metrics['capacity_logins_per_second']:>10.1f} "
+                f"{metrics['mean_latency_ms']:>8.1f}"
+            )
+            auth.close()
+            workers *= 2
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Storage saved by deduplication and throughput of the blob store.
+
+Stores a population of attachments in which each unique scan is uploaded
+several times, then reads every blob back with its lazy digest check.
+Compares the bytes put with the bytes on disk.
+
+Usage: python benchmarks/bench_blob_store.py [unique] [copies] [size_kb]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from blob_store import READ_CHUNK, BlobStore  # noqa: E402
+
+
+def main():
+    unique = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    copies = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    size_kb = int(sys.argv[3]) if len(sys.argv) > 3 else 512
+
+    scans = [os.urandom(size_kb * 1024) for _ in range(unique)]
+    uploads = [scan for scan in scans for _ in range(copies)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BlobStore(os.path.join(tmp, "blobs"))
+
+        started = time.perf_counter()
+        refs = [store.put_bytes(scan) for scan in uploads]
+        put = time.perf_counter() - started
+
+        digests = sorted({ref["digest"] for ref in refs})
+        started = time.perf_counter()
+        for digest in digests:
+            with store.open(digest) as reader:
+                while reader.read(READ_CHUNK):
+                    pass
+        read = time.perf_counter() - started
+
+        put_mb = len(uploads) * size_kb / 1024
+        read_mb = len(digests) * size_kb / 1024
+        stored_mb = store.stored_bytes() / 2**20
+        print(f"{len(uploads)} uploads of {unique} unique {size_kb} KiB scans")
+        print(f"put:    {put_mb:.0f} MB, {put_mb / put:.1f} MB/s")
+        print(f"stored: {stored_mb:.0f} MB ({1 - stored_mb / put_mb:.0%} saved)")
+        print(f"read:   {read_mb:.0f} MB, {read_mb / read:.1f} MB/s verified")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Micro-benchmark of block hashing schemes.
+
+Compares the original JSON hashing of the whole block with canonical binary
+headers under each function in HASH_FUNCTIONS, for block creation (payload
+digest plus header hash) and for validation with check_block (header re-hash
+plus payload re-digest, as every verification path does).
+
+Usage: python benchmarks/bench_block_hashing.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from blockchain import (  # noqa: E402
+    HASH_FUNCTIONS,
+    LEGACY_HASH_SCHEME,
+    Block,
+    check_block,
+)
+
+
+def make_payload(notes_size: int):
+    return {
+        "username": "patient-0001",
+        "medical_data": {
+            "diagnosis": "Type 2 diabetes",
+            "treatment": "Metformin 500mg",
+            "notes": "x" * notes_size,
+            "date": "2024-11-10 22:37:30",
+        },
+        "timestamp": "2024-11-10 22:37:30",
+        "record_type": "medical_record",
+    }
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    previous_hash = "ab" * 32
+    schemes = [LEGACY_HASH_SCHEME] + list(HASH_FUNCTIONS)
+
+    print(f"{'payload':>8} {'scheme':<12} {'create us':>10} {'validate us':>12}")
+    for notes_size in (100, 1000, 10000):
+        payload = make_payload(notes_size)
+        for scheme in schemes:
+            block = Block(1, 1731258450.27, payload, previous_hash, hash_scheme=scheme)
+            create = timeit.timeit(
+                lambda: Block(
+                    1, 1731258450.27, payload, previous_hash, hash_scheme=scheme
+                ),
+                number=iterations,
+            )
+            validate = timeit.timeit(
+                lambda: check_block(block, None), number=iterations
+            )
+            print(
+                f"{notes_size:>8} {scheme:<12} "
+                f"{create / iterations * 1e6:>10.2f} "
+                f"{validate / iterations * 1e6:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare the blocks table with the append-only block log.
+
+Appends the same chain to each backend in batches, then times random reads
+by block index and a sequential scan of headers.
+
+Usage: python benchmarks/bench_block_store.py [blocks] [reads]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from blockchain import Blockchain  # noqa: E402
+from database import Database  # noqa: E402
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    reads = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    chain = Blockchain()
+    for i in range(blocks - 1):
+        chain.add_block(
+            {
+                "username": f"p{i % 100}",
+                "medical_data": {"diagnosis": "Hypertension", "treatment": "Rest"},
+                "record_type": "medical_record",
+            }
+        )
+    rng = random.Random(7)
+    targets = [rng.randrange(blocks) for _ in range(reads)]
+
+    print(f"{blocks} blocks, {reads} random reads")
+    print(f"{'store':<8} {'append/s':>10} {'read/s':>10} {'headers/s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for store in ("sqlite", "log"):
+            db = Database(os.path.join(tmp, f"{store}.db"), block_store=store)
+
+            started = time.perf_counter()
+            for start in range(0, blocks, 5000):
+                with db.transaction():
+                    db.add_blocks(chain.chain[start : start + 5000])
+            append = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for index in targets:
+                db.get_block(index)
+            read = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for _ in db.iter_block_headers():
+                pass
+            scan = time.perf_counter() - started
+
+            print(
+                f"{store:<8} {blocks / append:>10.0f} {reads / read:>10.0f} "
+                f"{blocks / scan:>10.0f}"
+            )
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Memory report for in-memory chain representations.
+
+Loads the same stored chain three ways and reports the bytes each holds per
+block, measured with tracemalloc:
+
+    dict blocks     a list of Block objects with a per-instance __dict__,
+                    as the chain was held before Block gained __slots__
+    slotted blocks  a list of the current Block objects
+    compact         CompactChain header arrays, payloads left in the database
+
+Usage: python benchmarks/bench_chain_memory.py [blocks]
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from blockchain import Block, Blockchain, CompactChain  # noqa: E402
+from database import Database  # noqa: E402
+
+
+class DictBlock(Block):
+    """Block with an instance __dict__, like the original class"""
+
+
+def build_chain_db(db_name: str, blocks: int):
+    chain = Blockchain()
+    for i in range(blocks - 1):
+        chain.add_block(
+            {
+                "username": f"p{i % 100}",
+                "medical_data": {
+                    "diagnosis": "Hypertension",
+                    "treatment": "Lisinopril 10mg daily",
+                    "notes": "Follow up in three months",
+                    "date": "2024-11-10",
+                },
+                "timestamp": "2024-11-10 22:37:30",
+                "record_type": "medical_record",
+            }
+        )
+    db = Database(db_name)
+    db.add_blocks(chain.chain)
+    db.close()
+
+
+def measure(load):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = load()
+    seconds = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, seconds
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        build_chain_db(db_name, blocks)
+        db = Database(db_name)
+        tail = Block.from_dict(db.get_latest_block())
+
+        loaders = [
+            (
+                "dict blocks",
+                lambda: [DictBlock.from_dict(row) for row in db.get_blocks(0, blocks)],
+            ),
+            (
+                "slotted blocks",
+                lambda: [Block.from_dict(row) for row in db.get_blocks(0, blocks)],
+            ),
+            ("compact", lambda: CompactChain(db, tail)),
+        ]
+
+        print(f"{blocks} blocks")
+        print(f"{'representation':<16} {'MiB':>8} {'bytes/block':>12} {'load s':>8}")
+        for name, load in loaders:
+            result, size, seconds = measure(load)
+            print(
+                f"{name:<16} {size / 2**20:>8.1f} {size / blocks:>12.0f} "
+                f"{seconds:>8.2f}"
+            )
+            del result
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Throughput of record field encryption in MB/s of plaintext.
+
+Compares re-deriving the key for every record (as the old helpers did) with
+the cached cipher, one record at a time and in batches, across field sizes.
+Needs the cryptography package.
+
+Usage: python benchmarks/bench_field_encryption.py [records]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from encryption import ENCRYPTED_FIELDS, FieldCipher  # noqa: E402
+
+
+def throughput(fn, plaintext_bytes: int) -> float:
+    started = time.perf_counter()
+    fn()
+    return plaintext_bytes / (time.perf_counter() - started) / 2**20
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    secret = os.urandom(32)
+    cipher = FieldCipher(secret)
+
+    print(f"{records} records, MB/s of plaintext")
+    print(
+        f"{'field bytes':>11} {'uncached':>9} {'cached':>9} "
+        f"{'batch enc':>10} {'batch dec':>10}"
+    )
+    for size in (64, 1024, 16384):
+        rows = [
+            (f"patient{i % 100}", {f: "x" * size for f in ENCRYPTED_FIELDS})
+            for i in range(records)
+        ]
+        total = size * len(ENCRYPTED_FIELDS) * records
+
+        uncached = throughput(
+            lambda: [FieldCipher(secret).encrypt_record(u, r) for u, r in rows], total
+        )
+        cached = throughput(
+            lambda: [cipher.encrypt_record(u, r) for u, r in rows], total
+        )
+        sealed = cipher.encrypt_records(rows)
+        for (username, _), record in zip(rows, sealed):
+            record["username"] = username
+        batch_encrypt = throughput(lambda: cipher.encrypt_records(rows), total)
+        batch_decrypt = throughput(
+            lambda: cipher.decrypt_records([dict(r) for r in sealed]), total
+        )
+        print(
+            f"{size:>11} {uncached:>9.1f} {cached:>9.1f} "
+            f"{batch_encrypt:>10.1f} {batch_decrypt:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
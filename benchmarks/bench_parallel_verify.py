@@ -0,0 +1,52 @@
+"""Scaling benchmark for parallel full-chain verification.
+
+Usage: python benchmarks/bench_parallel_verify.py [blocks] [max_workers]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from blockchain import Blockchain  # noqa: E402
+from chain_audit import verify_chain_parallel  # noqa: E402
+from database import Database  # noqa: E402
+
+
+def build_chain_db(db_name: str, blocks: int):
+    chain = Blockchain()
+    for i in range(blocks - 1):
+        chain.add_block({"username": f"p{i % 100}", "record_type": "medical_record"})
+    db = Database(db_name)
+    db.add_blocks(chain.chain)
+    db.close()
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        build_chain_db(db_name, blocks)
+
+        print(f"{blocks} blocks")
+        print(f"{'workers':>8} {'seconds':>9} {'blocks/s':>12} {'speedup':>8}")
+        baseline = None
+        workers = 1
+        while workers <= max_workers:
+            started = time.perf_counter()
+            result = verify_chain_parallel(db_name, 0, blocks, workers=workers)
+            elapsed = time.perf_counter() - started
+            assert result["first_invalid"] is None
+            baseline = baseline or elapsed
+            print(
+                f"{workers:>8} {elapsed:>9.3f} {blocks / elapsed:>12.0f} "
+                f"{baseline / elapsed:>7.2f}x"
+            )
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Before/after benchmark for the Database SQLite profile.
+
+"before" drops the secondary indexes and opens with SQLite's stock settings;
+"after" opens with DEFAULT_PRAGMAS, which also recreates the indexes.
+
+Usage: python benchmarks/bench_sqlite_profile.py [records] [patients]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from database import Database  # noqa: E402
+
+STOCK_PRAGMAS = {
+    "journal_mode": "DELETE",
+    "synchronous": "FULL",
+    "cache_size": -2000,
+    "mmap_size": 0,
+    "temp_store": "DEFAULT",
+}
+
+
+def populate(db_name: str, records: int, patients: int):
+    db = Database(db_name)
+    conn = db.conn
+    conn.executemany(
+        "INSERT INTO users VALUES (?, ?, ?)",
+        [(f"p{i}", "x", "patient") for i in range(patients)]
+        + [(f"d{i}", "x", "doctor") for i in range(patients // 10 or 1)],
+    )
+    conn.executemany(
+        "INSERT INTO access_permissions VALUES (?, ?, ?)",
+        [(f"p{i}", f"d{i % (patients // 10 or 1)}", "2024") for i in range(patients)],
+    )
+    batch = 100000
+    for start in range(0, records, batch):
+        stop = min(start + batch, records)
+        conn.executemany(
+            "INSERT INTO blocks (block_index, block_timestamp, block_data, "
+            "previous_hash, block_hash) VALUES (?, ?, ?, ?, ?)",
+            [(i, 0.0, "{}", "0", "0") for i in range(start, stop)],
+        )
+        conn.executemany(
+            """
+            INSERT INTO medical_records
+            (username, diagnosis, treatment, notes, record_date, block_index)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    f"p{random.randrange(patients)}",
+                    "diagnosis",
+                    "treatment",
+                    "notes",
+                    f"2024-01-01 00:{i % 60:02}:{i % 60:02}",
+                    i,
+                )
+                for i in range(start, stop)
+            ],
+        )
+        conn.commit()
+    db.close()
+
+
+def measure(db: Database, patients: int, lookups: int = 200, inserts: int = 200):
+    rng = random.Random(7)
+    started = time.perf_counter()
+    for _ in range(lookups):
+        db.get_patient_records(f"p{rng.randrange(patients)}")
+    records_ms = (time.perf_counter() - started) * 1000 / lookups
+
+    started = time.perf_counter()
+    for _ in range(lookups):
+        db.conn.execute(
+            "SELECT patient_id FROM access_permissions WHERE provider_id = ?",
+            (f"d{rng.randrange(patients // 10 or 1)}",),
+        ).fetchall()
+    provider_ms = (time.perf_counter() - started) * 1000 / lookups
+
+    started = time.perf_counter()
+    for i in range(inserts):
+        db.add_medical_record(
+            "p0", {"diagnosis": "d", "treatment": "t", "date": "2024"}, block_index=i
+        )
+    insert_ms = (time.perf_counter() - started) * 1000 / inserts
+    return records_ms, provider_ms, insert_ms
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    patients = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    random.seed(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        populate(db_name, records, patients)
+
+        db = Database(db_name, pragmas=STOCK_PRAGMAS)
+        db.conn.execute("DROP INDEX IF EXISTS idx_medical_records_patient_date")
+        db.conn.execute("DROP INDEX IF EXISTS idx_access_permissions_provider")
+        before = measure(db, patients)
+        db.close()
+
+        started = time.perf_counter()
+        db = Database(db_name)
+        index_seconds = time.perf_counter() - started
+        after = measure(db, patients)
+        db.close()
+
+    print(f"{records} records, {patients} patients")
+    print(f"index build on open: {index_seconds:.2f}s")
+    print(f"{'ms per op':<26} {'before':>10} {'after':>10}")
+    labels = ["get_patient_records", "provider -> patients", "add_medical_record"]
+    for label, b, a in zip(labels, before, after):
+        print(f"{label:<26} {b:>10.3f} {a:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Reproducible benchmark suite for the core operations.
+
+Builds a chain of each requested size with a seeded population, then
+measures latency percentiles and throughput of:
+
+    add_medical_record, get_patient_records, search_records, has_access,
+    grant_access,
+    verify_blockchain_integrity (full audit and incremental),
+    UserManager.authenticate_user and Database/HealthcareBlockchain cold start
+
+Results are written as JSON. Given a baseline file from an earlier run, each
+latency is compared with it and the run fails if any grew by more than the
+tolerance. Cold start reopens files the OS has cached, so it measures
+process-side startup rather than disk reads.
+
+Usage:
+    python benchmarks/suite.py [--sizes 10000,100000,1000000] [--out FILE]
+                               [--baseline FILE] [--tolerance 0.25] [--seed 7]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any, Callable, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from blockchain import HealthcareBlockchain  # noqa: E402
+from database import Database  # noqa: E402
+from loadgen import (  # noqa: E402
+    DEFAULT_PASSWORD,
+    generate_population,
+    latency_summary,
+    synthetic_record,
+)
+from user_manager import UserManager  # noqa: E402
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+# Latency fields compared against the baseline; higher is worse. p99 of a
+# few hundred samples is too noisy to gate on
+COMPARED = ("p50_ms", "p90_ms")
+# Changes smaller than this are timer jitter whatever their percentage
+MIN_DELTA_MS = 0.05
+# Full-text queries over loadgen's record vocabulary, from common to rare
+SEARCH_QUERIES = ["metformin", "iron supplements", "review", "influenza", "levo*"]
+
+
+def succeeded(result: Any):
+    """Stop the run rather than time an operation that failed"""
+    if not result:
+        raise RuntimeError("Benchmarked operation failed")
+
+
+def timed(samples: int, operation: Callable[[int], Any]) -> Dict[str, Any]:
+    seconds = []
+    run_started = time.perf_counter()
+    for i in range(samples):
+        started = time.perf_counter()
+        operation(i)
+        seconds.append(time.perf_counter() - started)
+    elapsed = time.perf_counter() - run_started
+    summary = latency_summary(seconds)
+    # Wall-clock throughput, including the loop around each timed call
+    summary["ops_per_second"] = samples / elapsed if elapsed else None
+    return summary
+
+
+def populate(db_name: str, blocks: int, seed: int) -> Dict[str, Any]:
+    """Create a uniform population with blocks - 1 records (plus genesis)"""
+    blockchain = HealthcareBlockchain(db_name)
+    patients = max(100, blocks // 100)
+    population = generate_population(
+        blockchain,
+        patients=patients,
+        providers=max(10, patients // 10),
+        records=blocks - 1,
+        skew=0.0,
+        seed=seed,
+    )
+    blockchain.db.close()
+    return population
+
+
+def cold_start(db_name: str, repeats: int = 20) -> Dict[str, Any]:
+    def open_database(_):
+        db = Database(db_name)
+        db.get_latest_block()
+        db.close()
+
+    def open_blockchain(_):
+        HealthcareBlockchain(db_name).db.close()
+
+    return {
+        "database_open": timed(repeats, open_database),
+        "blockchain_open": timed(repeats, open_blockchain),
+    }
+
+
+def run_size(blocks: int, seed: int, samples: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        started = time.perf_counter()
+        population = populate(db_name, blocks, seed)
+        results["populate_seconds"] = time.perf_counter() - started
+        patients = population["patients"]
+        providers = population["providers"]
+        grants = population["grants"]
+
+        results.update(cold_start(db_name))
+
+        rng = random.Random(seed + 1)
+        blockchain = HealthcareBlockchain(db_name)
+
+        pairs = [(rng.choice(patients), rng.choice(providers)) for _ in range(20000)]
+        results["has_access"] = timed(
+            len(pairs), lambda i: blockchain.has_access(*pairs[i])
+        )
+
+        # Pairs not granted yet, so every grant writes
+        new_grants = []
+        while len(new_grants) < samples:
+            pair = (rng.choice(patients), rng.choice(providers))
+            if pair[1] not in grants[pair[0]] and pair not in new_grants:
+                new_grants.append(pair)
+        results["grant_access"] = timed(
+            samples, lambda i: succeeded(blockchain.grant_access(*new_grants[i]))
+        )
+
+        # Each read comes from a provider with access, or the patient
+        readers = []
+        for _ in range(samples):
+            patient = rng.choice(patients)
+            readers.append((patient, min(grants[patient], default=patient)))
+        results["get_patient_records"] = timed(
+            samples, lambda i: blockchain.get_patient_records(*readers[i])
+        )
+
+        searches = [
+            (rng.choice(providers), rng.choice(SEARCH_QUERIES)) for _ in range(samples)
+        ]
+        results["search_records"] = timed(
+            samples, lambda i: blockchain.search_records(*searches[i])
+        )
+
+        writers = [rng.choice(patients) for _ in range(samples)]
+        results["add_medical_record"] = timed(
+            samples,
+            lambda i: succeeded(
+                blockchain.add_medical_record(writers[i], synthetic_record(rng))
+            ),
+        )
+
+        full = timed(
+            1, lambda _: succeeded(blockchain.verify_blockchain_integrity(True))
+        )
+        full["blocks_per_second"] = len(blockchain.chain) / (full["mean_ms"] / 1000)
+        results["verify_full_audit"] = full
+
+        def verify_incremental(i):
+            blockchain.add_medical_record(
+                writers[i], {"diagnosis": "d", "treatment": "t", "date": "2024"}
+            )
+            succeeded(blockchain.verify_blockchain_integrity())
+
+        results["verify_incremental"] = timed(min(samples, 50), verify_incremental)
+
+        users = UserManager(blockchain.db)
+        results["authenticate_user"] = timed(
+            min(samples, 40),
+            lambda i: succeeded(
+                users.authenticate_user(patients[i], DEFAULT_PASSWORD)[0]
+            ),
+        )
+        users.auth.close()
+        blockchain.db.close()
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """Print each latency next to the baseline and return the regressions"""
+    regressions = []
+    print(f"\n{'size':>8} {'operation':<22} {'metric':<7} {'base':>9} {'now':>9}")
+    for size, operations in results["results"].items():
+        base_operations = baseline.get("results", {}).get(size, {})
+        for name, stats in operations.items():
+            base = base_operations.get(name)
+            if not isinstance(stats, dict) or not isinstance(base, dict):
+                continue
+            for metric in COMPARED:
+                if not base.get(metric):
+                    continue
+                change = stats[metric] / base[metric] - 1
+                flag = ""
+                if (
+                    change > tolerance
+                    and stats[metric] - base[metric] > MIN_DELTA_MS
+                ):
+                    flag = " REGRESSION"
+                    regressions.append(f"{size} {name} {metric} {change:+.0%}")
+                print(
+                    f"{size:>8} {name:<22} {metric:<7} {base[metric]:>9.4f} "
+                    f"{stats[metric]:>9.4f} {change:+6.0%}{flag}"
+                )
+    return regressions
+
+
+def print_results(size: str, operations: Dict[str, Any]):
+    print(f"\n{size} blocks (populated in {operations['populate_seconds']:.1f}s)")
+    print(f"{'operation':<22} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'ops/s':>10}")
+    for name, stats in operations.items():
+        if isinstance(stats, dict):
+            print(
+                f"{name:<22} {stats['p50_ms']:>9.4f} {stats['p90_ms']:>9.4f} "
+                f"{stats['p99_ms']:>9.4f} {stats['ops_per_second']:>10.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the core operations")
+    parser.add_argument(
+        "--sizes", default=",".join(str(size) for size in DEFAULT_SIZES)
+    )
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results file of an earlier run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed latency growth over the baseline (0.25 = 25%%)",
+    )
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "samples": args.samples,
+        },
+        "results": {},
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        operations = run_size(size, args.seed, args.samples)
+        results["results"][str(size)] = operations
+        print_results(str(size), operations)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nWrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regressions over {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
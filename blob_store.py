@@ -0,0 +1,198 @@
+"""Content-addressed, deduplicated store for attachment blobs.
+
+Each blob is kept once under the hex digest of its content, sharded into
+two directory levels (``ab/cd/abcd...``) so no directory grows unbounded.
+Blocks reference a blob by {"digest", "size"} only, so the chain never hashes
+attachment bytes and storing the same scan again costs nothing.
+
+Reads are checked lazily: the digest is recomputed as the blob streams out
+and a mismatch raises when the reader reaches the end. With a cipher (see
+encryption.AttachmentCipher) blobs are encrypted at rest while still being
+addressed by the digest of their plaintext.
+"""
+import hashlib
+import io
+import os
+import pathlib
+import re
+import tempfile
+from typing import Dict, Any, BinaryIO, Iterator
+
+READ_CHUNK = 1024 * 1024
+
+
+class BlobIntegrityError(ValueError):
+    pass
+
+
+class _HashingReader:
+    """Wraps a readable and hashes every byte read through it"""
+
+    def __init__(self, src: BinaryIO, hash_name: str):
+        self.src = src
+        self.hasher = hashlib.new(hash_name)
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.src.read(size)
+        self.hasher.update(data)
+        self.size += len(data)
+        return data
+
+
+class BlobReader:
+    """File-like reader of one blob that verifies its digest at end of stream"""
+
+    def __init__(
+        self, chunks: Iterator[bytes], digest: str, hash_name: str, closer=None
+    ):
+        self._chunks = chunks
+        # Bytes before _offset were already returned; they are dropped when
+        # the next chunk arrives rather than by re-slicing on every read
+        self._buffer = bytearray()
+        self._offset = 0
+        self._hasher = hashlib.new(hash_name)
+        self._closer = closer
+        self.digest = digest
+        self.verified = False
+
+    def _next_chunk(self) -> bool:
+        for chunk in self._chunks:
+            self._hasher.update(chunk)
+            if self._offset:
+                del self._buffer[: self._offset]
+                self._offset = 0
+            self._buffer += chunk
+            return True
+        if not self.verified:
+            if self._hasher.hexdigest() != self.digest:
+                raise BlobIntegrityError(f"Blob {self.digest} is corrupt")
+            self.verified = True
+        return False
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) - self._offset < size:
+            if not self._next_chunk():
+                break
+        end = len(self._buffer)
+        if size >= 0:
+            end = min(end, self._offset + size)
+        with memoryview(self._buffer) as view:
+            data = bytes(view[self._offset : end])
+        self._offset = end
+        return data
+
+    def close(self):
+        if self._closer is not None:
+            self._closer()
+            self._closer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BlobStore:
+    def __init__(self, root: str, hash_name: str = "sha256", cipher=None):
+        self.root = pathlib.Path(root)
+        self.hash_name = hash_name
+        self.cipher = cipher
+        # Digests come from records, so anything but lowercase hex of the
+        # right length (e.g. "../..") must never reach the filesystem
+        hex_length = hashlib.new(hash_name).digest_size * 2
+        self._digest_pattern = re.compile(f"[0-9a-f]{{{hex_length}}}")
+
+    def is_valid_digest(self, digest: Any) -> bool:
+        return isinstance(digest, str) and bool(self._digest_pattern.fullmatch(digest))
+
+    def path_for(self, digest: str) -> pathlib.Path:
+        if not self.is_valid_digest(digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.is_valid_digest(digest) and self.path_for(digest).exists()
+
+    def put_stream(self, src: BinaryIO) -> Dict[str, Any]:
+        """Store a stream and return its reference {"digest", "size"}.
+
+        The content is hashed while it is written to a temporary file, which
+        is then renamed into place, or dropped if the blob is already stored.
+        """
+        staging = self.root / "tmp"
+        staging.mkdir(parents=True, exist_ok=True)
+        reader = _HashingReader(src, self.hash_name)
+        fd, tmp_path = tempfile.mkstemp(dir=staging)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                if self.cipher is not None:
+                    self.cipher.encrypt_stream(reader, tmp)
+                else:
+                    while True:
+                        chunk = reader.read(READ_CHUNK)
+                        if not chunk:
+                            break
+                        tmp.write(chunk)
+            digest = reader.hasher.hexdigest()
+            path = self.path_for(digest)
+            if path.exists():
+                os.remove(tmp_path)
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return {"digest": digest, "size": reader.size}
+
+    def put_file(self, path: str) -> Dict[str, Any]:
+        with open(path, "rb") as src:
+            return self.put_stream(src)
+
+    def put_bytes(self, data: bytes) -> Dict[str, Any]:
+        return self.put_stream(io.BytesIO(data))
+
+    def open(self, digest: str) -> BlobReader:
+        """Open a blob for streaming; raises ValueError for a malformed
+        digest, FileNotFoundError if absent and BlobIntegrityError at end of
+        stream if its content changed"""
+        f = open(self.path_for(digest), "rb")
+        if self.cipher is not None:
+            chunks = self.cipher.iter_decrypt(f)
+        else:
+            chunks = iter(lambda: f.read(READ_CHUNK), b"")
+        return BlobReader(chunks, digest, self.hash_name, closer=f.close)
+
+    def size(self, digest: str) -> int:
+        """Plaintext size of a stored blob; raises FileNotFoundError if absent"""
+        path = self.path_for(digest)
+        if self.cipher is None:
+            return path.stat().st_size
+        with open(path, "rb") as f:
+            return self.cipher.plaintext_size(f)
+
+    def get_bytes(self, digest: str) -> bytes:
+        with self.open(digest) as reader:
+            return reader.read()
+
+    def verify(self, digest: str) -> bool:
+        """Stream a whole blob and report whether it is stored and matches
+        its digest"""
+        try:
+            with self.open(digest) as reader:
+                while reader.read(READ_CHUNK):
+                    pass
+            return True
+        except (FileNotFoundError, ValueError):
+            # A missing blob, BlobIntegrityError or a chunk that failed decryption
+            return False
+
+    def iter_digests(self) -> Iterator[str]:
+        for path in self.root.glob("??/??/*"):
+            yield path.name
+
+    def stored_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self.root.glob("??/??/*"))
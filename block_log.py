@@ -0,0 +1,378 @@
+"""Append-only, memory-mapped block log.
+
+An alternative to the ``blocks`` table for storing the chain (see
+Database(block_store="log")). Blocks are appended to segment files that roll
+over at ``segment_bytes``. Each segment has a companion index of fixed-width
+8-byte end offsets, so block n is located with one array lookup and read
+through ``mmap`` with no query, B-tree walk or header JSON.
+
+Each ``<first block index>.log`` segment holds records of:
+    index (8) timestamp (8) hash scheme (16) previous hash (32) hash (32)
+    payload digest (32) block data (compact JSON, variable)
+and ``<first block index>.idx`` holds one big-endian end offset per record.
+Records are written before their index entry, so a torn write is discarded
+when the log is next opened.
+
+Appends are staged until commit(), which fsyncs them and makes them visible
+to other threads; until then only the appending thread reads them, like an
+uncommitted SQLite transaction, and rollback_to can drop them without
+touching anything another thread is reading.
+"""
+import bisect
+import json
+import mmap
+import os
+import pathlib
+import struct
+import sys
+import threading
+from array import array
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+RECORD_HEADER = struct.Struct(">Qd16s32s32s32s")
+OFFSET = struct.Struct(">Q")
+DEFAULT_SEGMENT_BYTES = 64 * 2**20
+
+
+def _raw_digest(hex_digest: Optional[str]) -> bytes:
+    # The genesis block links to "0" and legacy blocks have no payload digest;
+    # both are stored as all-zero digests
+    return bytes.fromhex((hex_digest or "0").rjust(64, "0"))
+
+
+def _hex_digest(raw: bytes) -> Optional[str]:
+    return raw.hex() if any(raw) else None
+
+
+class _Segment:
+    def __init__(self, directory: pathlib.Path, first: int, read_only: bool):
+        self.first = first
+        self.log_path = directory / f"{first:020d}.log"
+        self.idx_path = directory / f"{first:020d}.idx"
+        mode = "rb" if read_only else "r+b"
+        if not read_only and not self.log_path.exists():
+            self.log_path.touch()
+            self.idx_path.touch()
+        self.log = open(self.log_path, mode, buffering=0)
+        self.idx = open(self.idx_path, mode, buffering=0)
+        self.ends = self._load_ends()
+        self._map: Optional[mmap.mmap] = None
+        if not read_only:
+            self._discard_torn_tail()
+
+    def _load_ends(self) -> array:
+        data = self.idx.read()
+        ends = array("Q")
+        ends.frombytes(data[: len(data) - len(data) % OFFSET.size])
+        if sys.byteorder == "little":
+            ends.byteswap()
+        # Keep the prefix of entries whose records were fully written
+        log_size = os.fstat(self.log.fileno()).st_size
+        previous = 0
+        for count, end in enumerate(ends):
+            if end <= previous or end > log_size:
+                del ends[count:]
+                break
+            previous = end
+        return ends
+
+    def _discard_torn_tail(self):
+        self.idx.truncate(len(self.ends) * OFFSET.size)
+        self.log.truncate(self.size)
+
+    @property
+    def size(self) -> int:
+        return self.ends[-1] if self.ends else 0
+
+    @property
+    def next_index(self) -> int:
+        return self.first + len(self.ends)
+
+    def append(self, records: List[bytes]):
+        offset = self.size
+        self.log.seek(offset)
+        self.log.write(b"".join(records))
+        new_ends = []
+        for record in records:
+            offset += len(record)
+            new_ends.append(offset)
+        self.idx.seek(len(self.ends) * OFFSET.size)
+        self.idx.write(b"".join(OFFSET.pack(end) for end in new_ends))
+        self.ends.extend(new_ends)
+
+    def truncate(self, count: int):
+        """Forget every record after the first count.
+
+        The log file keeps its length so live maps stay valid; the stale bytes
+        are overwritten by later appends or dropped on the next open.
+        """
+        del self.ends[count:]
+        self.idx.truncate(count * OFFSET.size)
+
+    def record(self, index: int) -> Tuple[mmap.mmap, int, int]:
+        """Return a map of the segment and the span of one block's record"""
+        position = index - self.first
+        start = self.ends[position - 1] if position else 0
+        end = self.ends[position]
+        mapped = self._map
+        if mapped is None or len(mapped) < end:
+            # Appends grow the file past the old map; earlier maps stay valid
+            # for readers still holding them and are closed once released
+            mapped = mmap.mmap(self.log.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map = mapped
+        return mapped, start, end
+
+    def close(self):
+        self._map = None
+        self.log.close()
+        self.idx.close()
+
+    def delete(self):
+        self.close()
+        self.log_path.unlink()
+        self.idx_path.unlink()
+
+
+class BlockLog:
+    """Segmented append-only block storage with the block methods of Database.
+
+    Reads return the same dicts as the ``blocks`` table. Appends must extend
+    the chain contiguously; a block whose index is taken is refused, like a
+    duplicate primary key. Appends are durable and visible to other threads
+    once commit() returns.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        read_only: bool = False,
+    ):
+        self.directory = pathlib.Path(directory)
+        self.segment_bytes = segment_bytes
+        self.read_only = read_only
+        if not read_only:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.segments: List[_Segment] = []
+        for log_path in sorted(self.directory.glob("*.log")):
+            segment = _Segment(self.directory, int(log_path.stem), read_only)
+            # A segment only counts if it continues the one before it
+            if not segment.ends or (
+                self.segments and segment.first != self.segments[-1].next_index
+            ):
+                if read_only:
+                    segment.close()
+                else:
+                    segment.delete()
+                continue
+            self.segments.append(segment)
+        self._firsts = [segment.first for segment in self.segments]
+        # Latest block other threads may read, and the thread whose appends
+        # are not committed yet
+        self._committed = self._appended_latest()
+        self._writer: Optional[int] = None
+        self._dirty: List[_Segment] = []
+
+    def __len__(self) -> int:
+        latest = self.get_latest_block_index()
+        return 0 if latest is None else latest - self.first_index + 1
+
+    @property
+    def first_index(self) -> Optional[int]:
+        return self.segments[0].first if self.segments else None
+
+    def _appended_latest(self) -> Optional[int]:
+        return self.segments[-1].next_index - 1 if self.segments else None
+
+    def get_latest_block_index(self) -> Optional[int]:
+        """Latest block visible to this thread: committed, or also its own
+        uncommitted appends"""
+        if self._writer == threading.get_ident():
+            return self._appended_latest()
+        return self._committed
+
+    def mark(self) -> Optional[int]:
+        """Position to pass to rollback_to to undo later appends"""
+        latest = self._appended_latest()
+        return None if latest is None else latest + 1
+
+    def commit(self):
+        """fsync the appends since the last commit, records before their
+        index entries, then let every thread read them"""
+        for segment in self._dirty:
+            os.fsync(segment.log.fileno())
+        for segment in self._dirty:
+            os.fsync(segment.idx.fileno())
+        self._dirty = []
+        self._committed = self._appended_latest()
+        self._writer = None
+
+    def rollback_to(self, mark: Optional[int]):
+        if self._committed is not None and (mark is None or mark <= self._committed):
+            raise ValueError("Cannot roll back committed blocks")
+        while self.segments and (mark is None or self.segments[-1].first >= mark):
+            segment = self.segments.pop()
+            self._firsts.pop()
+            if segment in self._dirty:
+                self._dirty.remove(segment)
+            segment.delete()
+        if self.segments and mark is not None:
+            segment = self.segments[-1]
+            segment.truncate(mark - segment.first)
+        if self._appended_latest() == self._committed:
+            self._writer = None
+
+    def add_block(self, block) -> bool:
+        return self.add_blocks([block])
+
+    def add_blocks(self, blocks) -> bool:
+        """Append already chained blocks; refuses them if they do not continue
+        the stored chain"""
+        blocks = list(blocks)
+        if not blocks:
+            return True
+        expected = self.mark()
+        for block in blocks:
+            if expected is not None and block.index != expected:
+                return False
+            expected = block.index + 1
+        self._writer = threading.get_ident()
+
+        pending: List[bytes] = []
+        pending_bytes = 0
+        segment = self.segments[-1] if self.segments else None
+        for block in blocks:
+            if segment is None or segment.size + pending_bytes >= self.segment_bytes:
+                if pending:
+                    segment.append(pending)
+                    pending, pending_bytes = [], 0
+                segment = _Segment(self.directory, block.index, read_only=False)
+                self.segments.append(segment)
+                self._firsts.append(segment.first)
+            if segment not in self._dirty:
+                self._dirty.append(segment)
+            record = self._encode(block)
+            pending.append(record)
+            pending_bytes += len(record)
+        segment.append(pending)
+        return True
+
+    def _encode(self, block) -> bytes:
+        return (
+            RECORD_HEADER.pack(
+                block.index,
+                block.timestamp,
+                (block.hash_scheme or "").encode(),
+                _raw_digest(block.previous_hash),
+                _raw_digest(block.hash),
+                _raw_digest(block.payload_digest),
+            )
+            + json.dumps(block.data, separators=(",", ":")).encode()
+        )
+
+    def _segment_for(self, index: int) -> Optional[_Segment]:
+        latest = self.get_latest_block_index()
+        if latest is None or index > latest:
+            return None
+        position = bisect.bisect_right(self._firsts, index) - 1
+        if position < 0:
+            return None
+        segment = self.segments[position]
+        return segment if index < segment.next_index else None
+
+    def _header(self, mapped: mmap.mmap, start: int) -> Tuple:
+        """Decode a record header in place into the tuple of iter_block_headers"""
+        index, timestamp, scheme, previous_hash, block_hash, payload_digest = (
+            RECORD_HEADER.unpack_from(mapped, start)
+        )
+        return (
+            index,
+            timestamp,
+            _hex_digest(previous_hash) or "0",
+            _hex_digest(block_hash),
+            scheme.rstrip(b"\0").decode() or None,
+            _hex_digest(payload_digest),
+        )
+
+    def _read(self, index: int) -> Optional[Dict[str, Any]]:
+        segment = self._segment_for(index)
+        if segment is None:
+            return None
+        mapped, start, end = segment.record(index)
+        header = self._header(mapped, start)
+        return {
+            "index": header[0],
+            "timestamp": header[1],
+            "data": json.loads(mapped[start + RECORD_HEADER.size : end]),
+            "previous_hash": header[2],
+            "hash": header[3],
+            "hash_scheme": header[4],
+            "payload_digest": header[5],
+        }
+
+    def get_block_hash(self, index: int) -> Optional[str]:
+        segment = self._segment_for(index)
+        if segment is None:
+            return None
+        mapped, start, _ = segment.record(index)
+        return self._header(mapped, start)[3]
+
+    def get_latest_block(self) -> Optional[Dict[str, Any]]:
+        latest = self.get_latest_block_index()
+        return None if latest is None else self._read(latest)
+
+    def get_block(self, block_index: int) -> Optional[Dict[str, Any]]:
+        return self._read(block_index)
+
+    def get_blocks(self, start: int, end: int) -> List[Dict[str, Any]]:
+        """Return stored blocks with start <= index < end, in chain order"""
+        latest = self.get_latest_block_index()
+        if latest is None:
+            return []
+        start = max(start, self.first_index)
+        return [self._read(i) for i in range(start, min(end, latest + 1))]
+
+    def get_blocks_by_index(self, block_indices: List[int]) -> List[Dict[str, Any]]:
+        blocks = (self._read(index) for index in block_indices)
+        return [block for block in blocks if block is not None]
+
+    def iter_block_headers(self, start: int = 0, end: Optional[int] = None):
+        """Yield header tuples like Database.iter_block_headers, reading no
+        block data"""
+        latest = self.get_latest_block_index()
+        if latest is None:
+            return
+        stop = latest + 1 if end is None else min(end, latest + 1)
+        for index in range(max(start, self.first_index), stop):
+            segment = self._segment_for(index)
+            mapped, record_start, _ = segment.record(index)
+            yield self._header(mapped, record_start)
+
+    def get_block_index_entries(self) -> Iterator[Tuple[int, Any, Any]]:
+        """Yield (block_index, record_type, username) like the blocks table"""
+        latest = self.get_latest_block_index()
+        if latest is None:
+            return
+        for index in range(self.first_index, latest + 1):
+            data = self._read(index)["data"]
+            if not isinstance(data, dict):
+                continue
+            yield index, data.get("record_type"), data.get("username")
+            transactions = data.get("transactions")
+            if not isinstance(transactions, list):
+                continue
+            for tx in transactions:
+                if isinstance(tx, dict):
+                    yield index, tx.get("record_type"), tx.get("username")
+
+    def sync(self):
+        """Flush appended segments to stable storage"""
+        for segment in self.segments:
+            os.fsync(segment.log.fileno())
+            os.fsync(segment.idx.fileno())
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self._firsts = []
@@ -1,55 +1,591 @@
 import hashlib
+import hmac
+import itertools
 import json
+import os
+import struct
+import sys
+import threading
 import time
-from typing import List, Dict, Any
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple
 
 from database import Database
+from metrics import instrumented
+
+# Hash functions a chain can use for new blocks. Each produces 32-byte digests
+# so headers keep a fixed width.
+HASH_FUNCTIONS = {
+    "sha256": hashlib.sha256,
+    "blake2b": lambda data=b"": hashlib.blake2b(data, digest_size=32),
+}
+DEFAULT_HASH_SCHEME = "sha256"
+# Blocks written before canonical headers hash the JSON of all their fields
+LEGACY_HASH_SCHEME = "json-sha256"
+
+# version, index, timestamp, previous hash, payload digest
+HEADER_FORMAT = struct.Struct(">BQd32s32s")
+HEADER_VERSIONS = {"sha256": 1, "blake2b": 2}
+
+# Batch Merkle trees hash leaves and inner nodes under distinct prefixes.
+# Batches sealed before this carry no merkle_version (see _legacy_merkle_root)
+MERKLE_VERSION = 2
+MERKLE_LEAF_PREFIX = b"\x00"
+MERKLE_NODE_PREFIX = b"\x01"
+
+
+def canonical_payload(data: Any) -> bytes:
+    """Deterministic compact encoding of block data"""
+    return json.dumps(
+        data, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+def _digest_bytes(hex_digest: str) -> bytes:
+    # The genesis block links to "0", which pads to an all-zero digest
+    return bytes.fromhex(hex_digest.rjust(64, "0"))
+
+
+def _hex_digest(raw: bytes) -> str:
+    return raw.hex() if any(raw) else "0"
 
 
 class Block:
+    # Slots drop the per-instance __dict__; chains can hold millions of blocks
+    __slots__ = (
+        "index",
+        "timestamp",
+        "data",
+        "previous_hash",
+        "hash_scheme",
+        "payload_digest",
+        "hash",
+    )
+
     def __init__(
-        self, index: int, timestamp: float, data: Dict[str, Any], previous_hash: str
+        self,
+        index: int,
+        timestamp: float,
+        data: Dict[str, Any],
+        previous_hash: str,
+        block_hash: Optional[str] = None,
+        hash_scheme: str = DEFAULT_HASH_SCHEME,
+        payload_digest: Optional[str] = None,
     ):
         self.index = index
         self.timestamp = timestamp
         self.data = data
         self.previous_hash = previous_hash
-        self.hash = self.calculate_hash()
+        self.hash_scheme = hash_scheme
+        # The payload is digested once; the header hash covers it via the digest
+        if payload_digest is None and hash_scheme != LEGACY_HASH_SCHEME:
+            payload_digest = self.calculate_payload_digest()
+        self.payload_digest = payload_digest
+        # Blocks restored from the database keep the hash they were stored with
+        self.hash = block_hash or self.calculate_hash()
+
+    def calculate_payload_digest(self) -> str:
+        payload = canonical_payload(self.data)
+        return HASH_FUNCTIONS[self.hash_scheme](payload).hexdigest()
+
+    def header_bytes(self) -> bytes:
+        return HEADER_FORMAT.pack(
+            HEADER_VERSIONS[self.hash_scheme],
+            self.index,
+            self.timestamp,
+            _digest_bytes(self.previous_hash),
+            _digest_bytes(self.payload_digest),
+        )
 
+    @instrumented("block.calculate_hash")
     def calculate_hash(self) -> str:
-        block_string = json.dumps(self.__dict__, sort_keys=True)
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        if self.hash_scheme == LEGACY_HASH_SCHEME:
+            block_string = json.dumps(
+                {
+                    "index": self.index,
+                    "timestamp": self.timestamp,
+                    "data": self.data,
+                    "previous_hash": self.previous_hash,
+                },
+                sort_keys=True,
+            )
+            return hashlib.sha256(block_string.encode()).hexdigest()
+        return HASH_FUNCTIONS[self.hash_scheme](self.header_bytes()).hexdigest()
+
+    def payload_matches(self) -> bool:
+        """Whether the data still hashes to the digest stored in the header"""
+        if self.hash_scheme == LEGACY_HASH_SCHEME:
+            return True  # legacy hashes cover the data directly
+        return self.payload_digest == self.calculate_payload_digest()
+
+    @classmethod
+    def from_dict(cls, block: Dict[str, Any]) -> "Block":
+        return cls(
+            block["index"],
+            block["timestamp"],
+            block["data"],
+            block["previous_hash"],
+            block_hash=block["hash"],
+            hash_scheme=block.get("hash_scheme") or LEGACY_HASH_SCHEME,
+            payload_digest=block.get("payload_digest"),
+        )
+
+
+def check_block(block: Block, previous_block: Optional[Block]) -> bool:
+    """Check a block's own hash and its link to the block stored before it.
+
+    The header is re-hashed, the payload re-digested and a sealed batch's
+    Merkle root recomputed from its transactions.
+    """
+    # The genesis block is not re-hashed, matching the original validation
+    if block.index > 0:
+        if block.hash != block.calculate_hash():
+            return False
+        if not block.payload_matches() or not batch_root_matches(block):
+            return False
+    if previous_block is None:
+        return True
+    return (
+        block.index == previous_block.index + 1
+        and block.previous_hash == previous_block.hash
+    )
+
+
+def block_records(block: Block) -> List[Dict[str, Any]]:
+    """Return the records carried by a block: its transactions if it is a
+    sealed batch, otherwise the block data itself"""
+    if not isinstance(block.data, dict):
+        return []
+    if block.data.get("record_type") == "batch":
+        return block.data.get("transactions", [])
+    return [block.data]
+
+
+def merkle_root(transactions: List[Dict[str, Any]]) -> str:
+    """Return the hex SHA-256 Merkle root of a list of transactions.
+
+    Leaves and inner nodes are hashed under different prefixes, and the last
+    node of an odd level is promoted unchanged, so the root also commits to
+    how many transactions the batch holds.
+    """
+    level = [
+        hashlib.sha256(MERKLE_LEAF_PREFIX + canonical_payload(tx)).digest()
+        for tx in transactions
+    ]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        paired = [
+            hashlib.sha256(MERKLE_NODE_PREFIX + level[i] + level[i + 1]).digest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0].hex()
+
+
+def _legacy_merkle_root(transactions: List[Dict[str, Any]]) -> str:
+    # Unprefixed, duplicating the last node of odd levels
+    level = [
+        hashlib.sha256(json.dumps(tx, sort_keys=True).encode()).digest()
+        for tx in transactions
+    ]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [
+            hashlib.sha256(level[i] + level[i + 1]).digest()
+            for i in range(0, len(level), 2)
+        ]
+    return level[0].hex()
+
+
+def batch_root_matches(block: Block) -> bool:
+    """Whether a sealed batch's Merkle root matches its transactions; blocks
+    that are not batches have no root to check"""
+    data = block.data
+    if not isinstance(data, dict) or data.get("record_type") != "batch":
+        return True
+    transactions = data.get("transactions")
+    if not isinstance(transactions, list):
+        return False
+    if data.get("merkle_version") == MERKLE_VERSION:
+        return data.get("merkle_root") == merkle_root(transactions)
+    return data.get("merkle_root") == _legacy_merkle_root(transactions)
 
 
 class Blockchain:
-    def __init__(self):
+    def __init__(self, hash_scheme: str = DEFAULT_HASH_SCHEME):
+        if hash_scheme not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown hash scheme: {hash_scheme}")
+        self.hash_scheme = hash_scheme
         self.chain: List[Block] = [self.create_genesis_block()]
         self.pending_transactions: List[Dict[str, Any]] = []
+        # Height up to which is_chain_valid has already verified the chain
+        self._verified_height = 0
+        # Secondary indexes: patient username / record type -> block indices
+        self.patient_index: Dict[str, List[int]] = {}
+        self.record_type_index: Dict[str, List[int]] = {}
+        # Readers look indexes up from the service's read pool while the
+        # writer appends to them
+        self._index_lock = threading.RLock()
 
     def create_genesis_block(self) -> Block:
-        return Block(0, time.time(), {"message": "Genesis Block"}, "0")
+        return Block(
+            0,
+            time.time(),
+            {"message": "Genesis Block"},
+            "0",
+            hash_scheme=self.hash_scheme,
+        )
 
     def get_latest_block(self) -> Block:
         return self.chain[-1]
 
     def add_block(self, data: Dict[str, Any]) -> Block:
         previous_block = self.get_latest_block()
-        new_block = Block(len(self.chain), time.time(), data, previous_block.hash)
+        new_block = Block(
+            len(self.chain),
+            time.time(),
+            data,
+            previous_block.hash,
+            hash_scheme=self.hash_scheme,
+        )
         self.chain.append(new_block)
+        self._index_block(new_block)
         return new_block
 
-    def is_chain_valid(self) -> bool:
-        for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i - 1]
+    def _add_index_entry(
+        self, index: Dict[str, List[int]], key: Optional[str], block_index: int
+    ):
+        if key is None:
+            return
+        positions = index.setdefault(key, [])
+        # Batch blocks can carry several records for the same key
+        if not positions or positions[-1] != block_index:
+            positions.append(block_index)
 
-            if current_block.hash != current_block.calculate_hash():
-                return False
-            if current_block.previous_hash != previous_block.hash:
+    def _index_block(self, block: Block):
+        if not isinstance(block.data, dict):
+            return
+        with self._index_lock:
+            self._add_index_entry(
+                self.record_type_index, block.data.get("record_type"), block.index
+            )
+            for record in block_records(block):
+                username = record.get("username")
+                self._add_index_entry(self.patient_index, username, block.index)
+                if record is not block.data:
+                    self._add_index_entry(
+                        self.record_type_index, record.get("record_type"), block.index
+                    )
+
+    def get_blocks(self, indices: List[int]) -> List[Block]:
+        if isinstance(self.chain, LazyChain):
+            return self.chain.get_many(indices)
+        return [self.chain[i] for i in indices]
+
+    def get_patient_blocks(self, username: str) -> List[Block]:
+        with self._index_lock:
+            indices = list(self.patient_index.get(username, []))
+        return self.get_blocks(indices)
+
+    def get_blocks_by_type(self, record_type: str) -> List[Block]:
+        with self._index_lock:
+            indices = list(self.record_type_index.get(record_type, []))
+        return self.get_blocks(indices)
+
+    def add_transaction(self, transaction: Dict[str, Any]):
+        self.pending_transactions.append(transaction)
+
+    def seal_pending_transactions(self) -> Optional[Block]:
+        """Mint one block holding every pending transaction and its Merkle root"""
+        if not self.pending_transactions:
+            return None
+        transactions = self.pending_transactions
+        self.pending_transactions = []
+        return self.add_block(
+            {
+                "record_type": "batch",
+                "merkle_root": merkle_root(transactions),
+                "merkle_version": MERKLE_VERSION,
+                "transactions": transactions,
+            }
+        )
+
+    def iter_blocks(self, start: int = 0) -> Iterator[Block]:
+        if isinstance(self.chain, LazyChain):
+            return self.chain.iter_from(start)
+        return itertools.islice(self.chain, start, None)
+
+    def is_chain_valid(self, full: bool = False) -> bool:
+        """Validate blocks appended since the last successful check.
+
+        With full=True the whole chain is re-hashed from the genesis block.
+        """
+        start = 0 if full else self._verified_height
+        previous_block = None
+        for current_block in self.iter_blocks(start):
+            if not check_block(current_block, previous_block):
                 return False
+            previous_block = current_block
+        self._verified_height = len(self.chain) - 1
         return True
 
 
+class LazyChain:
+    """List-like view of the persisted chain that pages blocks in on demand.
+
+    Only the tail block is known up front; older blocks are read from the
+    ``blocks`` table one page at a time and kept in a small LRU cache.
+    """
+
+    def __init__(
+        self, db: Database, tail: Block, page_size: int = 256, max_pages: int = 64
+    ):
+        self.db = db
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._length = tail.index + 1
+        self._tail = tail
+        self._pages: "OrderedDict[int, Dict[int, Block]]" = OrderedDict()
+        # Blocks appended this session, which may not be written to the db yet
+        self._recent: "OrderedDict[int, Block]" = OrderedDict()
+        self._recent[tail.index] = tail
+        # Guards the caches, which read-pool threads fill while the writer appends
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step == 1:
+                return self._get_range(start, stop)
+            blocks = (self._get(i) for i in range(start, stop, step))
+            return [block for block in blocks if block is not None]
+
+        index = key + self._length if key < 0 else key
+        if not 0 <= index < self._length:
+            raise IndexError("chain index out of range")
+        block = self._get(index)
+        if block is None:
+            raise IndexError(f"Block {index} is not stored in the database")
+        return block
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, start: int) -> Iterator[Block]:
+        first_page = start - start % self.page_size
+        for page_start in range(first_page, self._length, self.page_size):
+            stop = min(page_start + self.page_size, self._length)
+            yield from self._get_range(max(start, page_start), stop)
+
+    def append(self, block: Block):
+        with self._lock:
+            if block.index != self._length:
+                raise ValueError(
+                    f"Expected block index {self._length}, got {block.index}"
+                )
+            self._length += 1
+            self._tail = block
+            self._recent[block.index] = block
+            while len(self._recent) > self.page_size:
+                self._recent.popitem(last=False)
+            page = self._pages.get(block.index // self.page_size)
+            if page is not None:
+                page[block.index] = block
+
+    def get_many(self, indices: List[int]) -> List[Block]:
+        """Fetch specific blocks, reading uncached ones with one query per chunk"""
+        found: Dict[int, Block] = {}
+        missing = []
+        with self._lock:
+            for index in indices:
+                block = self._recent.get(index)
+                page = self._pages.get(index // self.page_size)
+                if block is None and page is not None:
+                    block = page.get(index)
+                if block is None:
+                    missing.append(index)
+                else:
+                    found[index] = block
+        for start in range(0, len(missing), 500):
+            for row in self.db.get_blocks_by_index(missing[start : start + 500]):
+                found[row["index"]] = Block.from_dict(row)
+        return [found[index] for index in indices if index in found]
+
+    def _get(self, index: int) -> Optional[Block]:
+        with self._lock:
+            if index in self._recent:
+                return self._recent[index]
+            return self._load_page(index // self.page_size).get(index)
+
+    def _get_range(self, start: int, stop: int) -> List[Block]:
+        blocks = []
+        for page_no in range(start // self.page_size, (stop - 1) // self.page_size + 1):
+            first = max(start, page_no * self.page_size)
+            last = min(stop, (page_no + 1) * self.page_size)
+            with self._lock:
+                page = self._load_page(page_no)
+                for i in range(first, last):
+                    block = self._recent.get(i) or page.get(i)
+                    if block is not None:
+                        blocks.append(block)
+        return blocks
+
+    def _load_page(self, page_no: int) -> Dict[int, Block]:
+        # Callers hold self._lock
+        if page_no in self._pages:
+            self._pages.move_to_end(page_no)
+            return self._pages[page_no]
+
+        start = page_no * self.page_size
+        page = {
+            row["index"]: Block.from_dict(row)
+            for row in self.db.get_blocks(start, start + self.page_size)
+        }
+        self._pages[page_no] = page
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return page
+
+
+# Per-block scheme codes used by CompactChain; 0 marks an index with no block
+_CHAIN_SCHEMES = (None, LEGACY_HASH_SCHEME) + tuple(HASH_FUNCTIONS)
+_SCHEME_CODES = {scheme: code for code, scheme in enumerate(_CHAIN_SCHEMES)}
+_ZERO_DIGEST = bytes(32)
+
+
+class CompactChain(LazyChain):
+    """LazyChain that also keeps every block header in memory, packed.
+
+    Headers live in contiguous arrays at a fixed 105 bytes per block (the
+    timestamp, a scheme code and three raw 32-byte digests), so hashes and
+    links can be read without touching the database. Payloads stay in the
+    ``blocks`` table and are paged in on demand through a small cache.
+    """
+
+    def __init__(
+        self, db: Database, tail: Block, page_size: int = 256, max_pages: int = 4
+    ):
+        super().__init__(db, tail, page_size, max_pages)
+        self._timestamps = array("d")
+        self._schemes = bytearray()
+        self._hashes = bytearray()
+        self._previous_hashes = bytearray()
+        self._payload_digests = bytearray()
+        for row in db.iter_block_headers(0, tail.index):
+            self._push_header(*row)
+        self._push_block_header(tail)
+
+    def append(self, block: Block):
+        with self._lock:
+            super().append(block)
+            self._push_block_header(block)
+
+    def _push_block_header(self, block: Block):
+        self._push_header(
+            block.index,
+            block.timestamp,
+            block.previous_hash,
+            block.hash,
+            block.hash_scheme,
+            block.payload_digest,
+        )
+
+    def _push_header(
+        self,
+        index: int,
+        timestamp: float,
+        previous_hash: str,
+        block_hash: str,
+        hash_scheme: Optional[str],
+        payload_digest: Optional[str],
+    ):
+        # Indices missing from the table are padded so position == block index
+        gap = index - len(self._schemes)
+        if gap > 0:
+            self._timestamps.extend([0.0] * gap)
+            self._schemes.extend(bytes(gap))
+            for digests in (self._hashes, self._previous_hashes, self._payload_digests):
+                digests.extend(bytes(32 * gap))
+        self._timestamps.append(timestamp)
+        self._schemes.append(_SCHEME_CODES[hash_scheme or LEGACY_HASH_SCHEME])
+        self._hashes += _digest_bytes(block_hash)
+        self._previous_hashes += _digest_bytes(previous_hash)
+        self._payload_digests += (
+            _digest_bytes(payload_digest) if payload_digest else _ZERO_DIGEST
+        )
+
+    def _has_header(self, index: int) -> bool:
+        return 0 <= index < len(self._schemes) and self._schemes[index] != 0
+
+    def block_hash(self, index: int) -> Optional[str]:
+        if not self._has_header(index):
+            return None
+        return _hex_digest(self._hashes[index * 32 : index * 32 + 32])
+
+    def header(self, index: int) -> Optional[Dict[str, Any]]:
+        """A block's header fields, read from memory without its data"""
+        if not self._has_header(index):
+            return None
+        start, stop = index * 32, index * 32 + 32
+        scheme = _CHAIN_SCHEMES[self._schemes[index]]
+        return {
+            "index": index,
+            "timestamp": self._timestamps[index],
+            "previous_hash": _hex_digest(self._previous_hashes[start:stop]),
+            "hash": _hex_digest(self._hashes[start:stop]),
+            "hash_scheme": scheme,
+            "payload_digest": (
+                None
+                if scheme == LEGACY_HASH_SCHEME
+                else self._payload_digests[start:stop].hex()
+            ),
+        }
+
+    def check_links(self, start: int = 1) -> Optional[int]:
+        """Return the first block at or after start whose previous_hash is not
+        the hash stored before it, or None if every stored link holds"""
+        start = max(start, 1)
+        # Fast path: every link holds when the two digest arrays line up
+        if self._previous_hashes[start * 32 :] == self._hashes[(start - 1) * 32 : -32]:
+            return None
+        hashes = memoryview(self._hashes)
+        previous_hashes = memoryview(self._previous_hashes)
+        for index in range(start, len(self._schemes)):
+            if not (self._schemes[index] and self._schemes[index - 1]):
+                continue
+            offset = index * 32
+            if previous_hashes[offset : offset + 32] != hashes[offset - 32 : offset]:
+                return index
+        return None
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes held by the header arrays and the number of cached blocks"""
+        arrays = (
+            self._timestamps,
+            self._schemes,
+            self._hashes,
+            self._previous_hashes,
+            self._payload_digests,
+        )
+        cached = len(self._recent) + sum(len(page) for page in self._pages.values())
+        return {
+            "blocks": len(self._schemes),
+            "header_bytes": sum(sys.getsizeof(a) for a in arrays),
+            "cached_blocks": cached,
+        }
+
+
 # class HealthcareBlockchain(Blockchain):
 #     def __init__(self, db_name="healthcare_blockchain.db"):
 #         super().__init__()
@@ -132,40 +668,176 @@ import hashlib
 import json
 import time
 from typing import List, Dict, Any
+from auth import hash_password
+from blob_store import BlobReader, BlobStore
 from database import Database
+from permissions import PermissionStore
 
 
 class HealthcareBlockchain(Blockchain):
-    def __init__(self, db_name="healthcare_blockchain.db"):
-        super().__init__()
-        self.db = Database(db_name)
+    def __init__(
+        self,
+        db_name="healthcare_blockchain.db",
+        batch_size: int = 0,
+        batch_interval_ms: int = 0,
+        checkpoint_key: Optional[bytes] = None,
+        hash_scheme: str = DEFAULT_HASH_SCHEME,
+        compact_chain: bool = False,
+        block_store: Optional[str] = None,
+        blob_dir: Optional[str] = None,
+    ):
+        """batch_size > 0 queues records into pending_transactions and seals them
+        into one block per batch_size records, or once the oldest queued record
+        is batch_interval_ms old (checked on each add and by flush_if_due).
+
+        checkpoint_key signs integrity checkpoints. It defaults to the
+        MEDICHAIN_CHECKPOINT_KEY environment variable; without either, a random
+        per-process key is used and older checkpoints are ignored.
+
+        hash_scheme picks the hash function for new blocks (see HASH_FUNCTIONS);
+        stored blocks keep the scheme they were written with.
+
+        compact_chain=True keeps every block header in memory in a
+        CompactChain, trading ~105 bytes per block for database-free access
+        to hashes and links; payloads are still paged in on demand.
+
+        block_store selects the blocks table ("sqlite") or an append-only
+        BlockLog ("log"); see Database.
+
+        blob_dir is the BlobStore holding attachments, <db_name>.blobs by
+        default. Blobs are encrypted at rest when MEDICHAIN_RECORD_KEY is set."""
+        super().__init__(hash_scheme)
+        self.compact_chain = compact_chain
+        self.db_name = db_name
+        self.db = Database(db_name, block_store=block_store)
+        blob_cipher = None
+        if os.environ.get("MEDICHAIN_RECORD_KEY"):
+            from encryption import AttachmentCipher
+
+            blob_cipher = AttachmentCipher.from_env()
+        self.blobs = BlobStore(blob_dir or f"{db_name}.blobs", cipher=blob_cipher)
         self.users: Dict[str, Dict[str, Any]] = {}
-        self.access_permissions: Dict[str, List[str]] = {}
+        self.permissions = PermissionStore(self.db)
+        # patient -> set of providers, kept in sync by self.permissions
+        self.access_permissions: Dict[str, Set[str]] = self.permissions.by_patient
+        self.batch_size = batch_size
+        self.batch_interval_ms = batch_interval_ms
+        self._batch_started: Optional[float] = None
+        env_key = os.environ.get("MEDICHAIN_CHECKPOINT_KEY")
+        self.checkpoint_key = checkpoint_key or (
+            env_key.encode() if env_key else os.urandom(32)
+        )
+        self._load_chain_from_db()
         self._load_users_from_db()
 
+    def _load_chain_from_db(self):
+        """Restore the chain tail from the database, paging older blocks lazily"""
+        latest = self.db.get_latest_block()
+        if latest is None:
+            # Fresh database: persist the genesis block so restarts can resume
+            self.db.add_block(self.chain[0])
+            if not self.compact_chain:
+                return
+            tail = self.chain[0]
+        else:
+            tail = Block.from_dict(latest)
+        if self.compact_chain:
+            self.chain = CompactChain(self.db, tail)
+        else:
+            self.chain = LazyChain(self.db, tail)
+        # The secondary indexes are rebuilt from the blocks table on first use
+        self._indexes_loaded = False
+
+    def reload_chain(self):
+        """Drop in-memory blocks and indexes and restore them from the database"""
+        with self._index_lock:
+            self.patient_index = {}
+            self.record_type_index = {}
+            self._load_chain_from_db()
+        self._verified_height = min(self._verified_height, len(self.chain) - 1)
+
+    def reload_users(self):
+        """Restore users and grants from the database after bulk writes behind
+        the in-memory view (see loadgen.generate_population)"""
+        self._load_users_from_db()
+
+    @contextmanager
+    def transaction(self):
+        """Commit every block and record written inside the block at once.
+
+        On failure the database is rolled back and the in-memory chain is
+        restored from it, so memory never runs ahead of what was stored.
+        """
+        try:
+            with self.db.transaction():
+                yield self
+        except BaseException:
+            self.reload_chain()
+            raise
+
+    def _ensure_indexes(self):
+        if getattr(self, "_indexes_loaded", True):
+            return
+        # Built under the lock so add_block cannot change the live indexes
+        # mid-merge and no reader sees a half-built one
+        with self._index_lock:
+            if not self._indexes_loaded:
+                self._build_indexes()
+
+    def _build_indexes(self):
+        patient_index: Dict[str, List[int]] = {}
+        record_type_index: Dict[str, List[int]] = {}
+        for block_index, record_type, username in self.db.get_block_index_entries():
+            self._add_index_entry(record_type_index, record_type, block_index)
+            self._add_index_entry(patient_index, username, block_index)
+        # Keep blocks appended since startup that the rebuild did not see yet
+        for live, rebuilt in (
+            (self.patient_index, patient_index),
+            (self.record_type_index, record_type_index),
+        ):
+            for key, positions in live.items():
+                seen = rebuilt.get(key, [-1])[-1]
+                for block_index in positions:
+                    if block_index > seen:
+                        self._add_index_entry(rebuilt, key, block_index)
+        self.patient_index = patient_index
+        self.record_type_index = record_type_index
+        self._indexes_loaded = True
+
+    def get_patient_blocks(self, username: str) -> List[Block]:
+        self._ensure_indexes()
+        return super().get_patient_blocks(username)
+
+    def get_blocks_by_type(self, record_type: str) -> List[Block]:
+        self._ensure_indexes()
+        return super().get_blocks_by_type(record_type)
+
     def _load_users_from_db(self):
         """Load existing users from database into memory"""
-        cursor = self.db.conn.cursor()
-        cursor.execute("SELECT username, password, user_type FROM users")
-        for username, password, user_type in cursor.fetchall():
+        for username, password, user_type in self.db.get_users():
             self.users[username] = {
                 "type": user_type,
                 "password": password,
             }
             if user_type == "patient":
-                self.access_permissions[username] = []
+                self.permissions.add_patient(username)
 
         # Load access permissions
-        cursor.execute("SELECT patient_id, provider_id FROM access_permissions")
-        for patient_id, provider_id in cursor.fetchall():
-            if patient_id in self.access_permissions:
-                self.access_permissions[patient_id].append(provider_id)
+        self.permissions.load()
 
-    def add_user(self, username: str, user_type: str, password: str) -> bool:
+    def add_user(
+        self,
+        username: str,
+        user_type: str,
+        password: str,
+        password_hash: Optional[str] = None,
+    ) -> bool:
+        """password_hash is the stored form of password when the caller has
+        already hashed it (see auth.Authenticator.hash_async)"""
         if username in self.users:
             return False
 
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
+        hashed_password = password_hash or hash_password(password)
 
         # Add to database first
         if not self.db.add_user(username, hashed_password, user_type):
@@ -178,7 +850,7 @@ class HealthcareBlockchain(Blockchain):
         }
 
         if user_type == "patient":
-            self.access_permissions[username] = []
+            self.permissions.add_patient(username)
 
         return True
 
@@ -188,59 +860,165 @@ class HealthcareBlockchain(Blockchain):
             and healthcare_provider_id in self.users
             and self.users[patient_id]["type"] == "patient"
         ):
-            if patient_id in self.access_permissions:
-                if healthcare_provider_id not in self.access_permissions[patient_id]:
-                    # Add to database first
-                    if self.db.add_access_permission(
-                        patient_id, healthcare_provider_id
-                    ):
-                        self.access_permissions[patient_id].append(
-                            healthcare_provider_id
-                        )
-                        return True
+            return self.permissions.grant(patient_id, healthcare_provider_id)
         return False
 
+    def revoke_access(self, patient_id: str, healthcare_provider_id: str) -> bool:
+        return self.permissions.revoke(patient_id, healthcare_provider_id)
+
     def has_access(self, patient_id: str, healthcare_provider_id: str) -> bool:
-        # Check both memory and database
-        return (
-            patient_id in self.access_permissions
-            and healthcare_provider_id in self.access_permissions[patient_id]
-        ) or self.db.check_access_permission(patient_id, healthcare_provider_id)
+        # The permission store mirrors the access_permissions table, so this
+        # is a set lookup with no database round trip
+        return self.permissions.has_access(patient_id, healthcare_provider_id)
+
+    def patients_visible_to(self, healthcare_provider_id: str) -> List[str]:
+        """Patients that granted access to the provider, in name order"""
+        return sorted(self.permissions.patients_of(healthcare_provider_id))
+
+    def build_medical_record(
+        self, username: str, record_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Validate a record and wrap it as block data; raises ValueError"""
+        if not username in self.users:
+            raise ValueError("Patient not found in the system")
+
+        if self.users[username]["type"] != "patient":
+            raise ValueError("Specified ID is not a patient")
+
+        if not record_data.get("diagnosis") or not record_data.get("treatment"):
+            raise ValueError("Diagnosis and treatment are required fields")
+
+        # Everything the medical_records insert needs is checked here, so a
+        # queued record cannot fail its batch when it is sealed
+        if not record_data.get("date"):
+            raise ValueError("Record date is required")
+        for field in ("diagnosis", "treatment", "date"):
+            if not isinstance(record_data[field], str):
+                raise ValueError(f"Record {field} must be text")
+        if not isinstance(record_data.get("notes") or "", str):
+            raise ValueError("Record notes must be text")
+        try:
+            canonical_payload(record_data)
+        except (TypeError, ValueError):
+            raise ValueError("Record data must be JSON serializable")
+
+        attachments = record_data.get("attachments")
+        if attachments is not None:
+            record_data = dict(
+                record_data, attachments=self._attachment_refs(attachments)
+            )
+
+        # With field encryption the block carries the same ciphertext as the
+        # medical_records row, so no plaintext reaches the block store and the
+        # payload digest covers exactly what is stored
+        if self.db.cipher is not None:
+            record_data = self.db.cipher.encrypt_record(username, record_data)
+
+        # Create the complete medical record
+        return {
+            "username": username,
+            "medical_data": record_data,
+            "timestamp": record_data.get("date") or time.strftime("%Y-%m-%d %H:%M:%S"),
+            "record_type": "medical_record",
+        }
+
+    def _attachment_refs(self, attachments: List[Dict[str, Any]]) -> List[Dict]:
+        """Reduce attachments to the references kept in blocks; each must
+        already be in the blob store (see attach_file)"""
+        if not isinstance(attachments, list):
+            raise ValueError("Attachments must be a list")
+        refs = []
+        for attachment in attachments:
+            digest = attachment.get("digest") if isinstance(attachment, dict) else None
+            if not self.blobs.is_valid_digest(digest):
+                raise ValueError(f"Invalid attachment digest: {digest!r}")
+            try:
+                # The stored blob decides the size, not the client
+                size = self.blobs.size(digest)
+            except FileNotFoundError:
+                raise ValueError(f"Attachment not found: {digest}")
+            ref = {"digest": digest, "size": size}
+            if attachment.get("name"):
+                ref["name"] = attachment["name"]
+            refs.append(ref)
+        return refs
+
+    def attach_file(self, path: str, name: Optional[str] = None) -> Dict[str, Any]:
+        """Store a file in the blob store and return the reference to list
+        under a record's "attachments"; identical files are stored once"""
+        ref = self.blobs.put_file(path)
+        ref["name"] = name or os.path.basename(path)
+        return ref
+
+    def get_patient_attachments(
+        self, patient_id: str, requester_id: str
+    ) -> List[Dict[str, Any]]:
+        """Attachment references of a patient's records, oldest first"""
+        if patient_id != requester_id and not self.has_access(
+            patient_id, requester_id
+        ):
+            return []
+        attachments = []
+        for record in self._chain_patient_records(patient_id):
+            attachments.extend(record["medical_data"].get("attachments") or [])
+        return attachments
 
+    def open_attachment(
+        self, patient_id: str, requester_id: str, digest: str
+    ) -> Optional[BlobReader]:
+        """Open one of a patient's attachments for streaming, or None.
+
+        The reader raises blob_store.BlobIntegrityError when it reaches the
+        end of a blob whose content no longer matches its digest.
+        """
+        attachments = self.get_patient_attachments(patient_id, requester_id)
+        if not any(ref["digest"] == digest for ref in attachments):
+            return None
+        try:
+            return self.blobs.open(digest)
+        except FileNotFoundError:
+            print(f"Attachment {digest} is missing from the blob store")
+            return None
+        except ValueError as e:
+            # A malformed reference in a block written before digests were
+            # validated
+            print(f"Error opening attachment: {str(e)}")
+            return None
+
+    @instrumented("blockchain.add_medical_record", false_is_failure=True)
     def add_medical_record(self, username: str, record_data: Dict[str, Any]) -> bool:
         try:
-            if not username in self.users:
-                raise ValueError("Patient not found in the system")
-
-            if self.users[username]["type"] != "patient":
-                raise ValueError("Specified ID is not a patient")
-
-            if not record_data.get("diagnosis") or not record_data.get("treatment"):
-                raise ValueError("Diagnosis and treatment are required fields")
-
-            # Create the complete medical record
-            medical_record = {
-                "username": username,
-                "medical_data": record_data,
-                "timestamp": record_data.get("date")
-                or time.strftime("%Y-%m-%d %H:%M:%S"),
-                "record_type": "medical_record",
-            }
+            medical_record = self.build_medical_record(username, record_data)
+
+            if self.batch_size > 0:
+                # Queue the record; it is written when its batch is sealed
+                self.add_transaction(medical_record)
+                if self._batch_started is None:
+                    self._batch_started = time.monotonic()
+                if not self.flush_if_due():
+                    # Only a record that stays queued is reported as added, so
+                    # a caller retrying this one cannot store it twice
+                    self.pending_transactions = [
+                        tx
+                        for tx in self.pending_transactions
+                        if tx is not medical_record
+                    ]
+                    raise ValueError("Failed to seal pending records")
+                return True
 
-            # Add the record to the blockchain
-            new_block = self.add_block(medical_record)
+            # Stage the block and its record row and commit them together
+            with self.transaction():
+                new_block = self.add_block(medical_record)
 
-            # Save the block to the database
-            if not self.db.add_block(new_block):
-                raise ValueError("Failed to save block to database")
+                if not self.db.add_block(new_block):
+                    raise ValueError("Failed to save block to database")
 
-            # Save the medical record to the database
-            if not self.db.add_medical_record(
-                username=username,
-                record_data=record_data,
-                block_index=new_block.index,
-            ):
-                raise ValueError("Failed to save medical record to database")
+                if not self.db.add_medical_record(
+                    username=username,
+                    record_data=medical_record["medical_data"],
+                    block_index=new_block.index,
+                ):
+                    raise ValueError("Failed to save medical record to database")
 
             return True
 
@@ -248,51 +1026,206 @@ class HealthcareBlockchain(Blockchain):
             print(f"Error adding medical record: {str(e)}")
             return False
 
+    def flush_if_due(self) -> bool:
+        """Seal the pending batch if it is full or has waited long enough"""
+        if not self.pending_transactions:
+            return True
+        full = len(self.pending_transactions) >= self.batch_size
+        waited_ms = (time.monotonic() - self._batch_started) * 1000
+        if full or (self.batch_interval_ms and waited_ms >= self.batch_interval_ms):
+            return self.flush_pending()
+        return True
+
+    def flush_pending(self) -> bool:
+        """Seal all pending records into one block and persist it"""
+        if not self.pending_transactions:
+            return True
+        pending = list(self.pending_transactions)
+        try:
+            self._batch_started = None
+            with self.transaction():
+                new_block = self.seal_pending_transactions()
+                if new_block is None:
+                    return True
+
+                if not self.db.add_block(new_block):
+                    raise ValueError("Failed to save block to database")
+
+                records = [
+                    (tx["username"], tx["medical_data"])
+                    for tx in new_block.data["transactions"]
+                ]
+                if not self.db.add_medical_records(
+                    records, block_index=new_block.index
+                ):
+                    raise ValueError("Failed to save medical records to database")
+
+            return True
+
+        except Exception as e:
+            print(f"Error sealing pending records: {str(e)}")
+            # Keep the records queued so a later flush can retry them, except
+            # any that no longer validate and would fail every retry
+            retry = []
+            for tx in pending:
+                try:
+                    self.build_medical_record(tx["username"], tx["medical_data"])
+                    retry.append(tx)
+                except ValueError as error:
+                    print(f"Dropping pending record for {tx['username']}: {error}")
+            self.pending_transactions = retry + self.pending_transactions
+            if self.pending_transactions:
+                self._batch_started = time.monotonic()
+            return False
+
+    @instrumented("blockchain.get_patient_records")
     def get_patient_records(
         self, patient_id: str, requester_id: str
     ) -> List[Dict[str, Any]]:
         if patient_id == requester_id or self.has_access(patient_id, requester_id):
-            # Get records from both blockchain and database
-            blockchain_records = []
-            for block in self.chain[1:]:  # Skip genesis block
-                if (
-                    block.data.get("patient_id") == patient_id
-                    and block.data.get("record_type") == "medical_record"
-                ):
-                    blockchain_records.append(block.data)
-
             # Get detailed records from database
             db_records = self.db.get_patient_records(patient_id)
 
-            # Merge and return records (prioritizing database records as they contain more detail)
-            return db_records or blockchain_records
+            # Prioritize database records as they contain more detail, falling
+            # back to the chain through the patient index
+            return db_records or self._chain_patient_records(patient_id)
         return []
 
-    def verify_blockchain_integrity(self) -> bool:
-        """Verify the integrity of both in-memory and database stored blocks"""
-        # First check in-memory chain
-        if not super().is_chain_valid():
-            return False
+    def get_patient_records_page(
+        self,
+        patient_id: str,
+        requester_id: str,
+        page_size: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Any], Optional[str]]:
+        """One keyset page of a patient's records and the cursor for the next"""
+        if patient_id == requester_id or self.has_access(patient_id, requester_id):
+            return self.db.get_patient_records_page(patient_id, page_size, cursor)
+        return [], None
 
-        # Then verify against database
-        cursor = self.db.conn.cursor()
-        cursor.execute("SELECT * FROM blocks ORDER BY index")
-        db_blocks = cursor.fetchall()
+    def iter_patient_records(
+        self,
+        patient_id: str,
+        requester_id: str,
+        page_size: int = 500,
+        cursor: Optional[str] = None,
+    ) -> Iterator[Any]:
+        """Stream a patient's records without materializing their history"""
+        if patient_id == requester_id or self.has_access(patient_id, requester_id):
+            yield from self.db.iter_patient_records(patient_id, page_size, cursor)
 
-        if len(db_blocks) != len(self.chain):
-            return False
+    @instrumented("blockchain.search_records")
+    def search_records(
+        self,
+        requester_id: str,
+        query: str,
+        page_size: int = 20,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Any], Optional[str]]:
+        """One ranked page of the records matching query among those the
+        requester may read (their own and their granting patients'), and the
+        cursor for the next page"""
+        if requester_id not in self.users:
+            return [], None
+        visible = [requester_id] + sorted(self.permissions.patients_of(requester_id))
+        return self.db.search_records(query, visible, page_size, cursor)
 
-        for i, block in enumerate(db_blocks):
-            if block[0] != self.chain[i].index:  # Compare indices
+    def _chain_patient_records(self, patient_id: str) -> List[Dict[str, Any]]:
+        records = []
+        for block in self.get_patient_blocks(patient_id):
+            for record in block_records(block):
+                if (
+                    record.get("username") == patient_id
+                    and record.get("record_type") == "medical_record"
+                ):
+                    if self.db.cipher is not None:
+                        record = dict(
+                            record,
+                            medical_data=self.db.cipher.decrypt_record(
+                                patient_id, record["medical_data"]
+                            ),
+                        )
+                    records.append(record)
+        return records
+
+    def _sign_checkpoint(self, height: int, block_hash: str) -> str:
+        message = f"{height}:{block_hash}".encode()
+        return hmac.new(self.checkpoint_key, message, hashlib.sha256).hexdigest()
+
+    def _latest_trusted_checkpoint(self) -> Optional[Dict[str, Any]]:
+        checkpoint = self.db.get_latest_checkpoint()
+        if checkpoint is None:
+            return None
+        expected = self._sign_checkpoint(checkpoint["height"], checkpoint["hash"])
+        if not hmac.compare_digest(expected, checkpoint["signature"]):
+            return None
+        return checkpoint
+
+    def verify_blockchain_integrity(
+        self, full_audit: bool = False, page_size: int = 1000, workers: int = 1
+    ) -> bool:
+        """Verify the stored blocks and record a signed checkpoint on success.
+
+        Only blocks appended since the last trusted checkpoint are re-hashed;
+        full_audit=True re-verifies the whole chain. workers > 1 hashes block
+        ranges in a process pool (see chain_audit.verify_chain_parallel).
+        """
+        start = 0
+        previous_block = None
+        checkpoint = None if full_audit else self._latest_trusted_checkpoint()
+        if checkpoint is not None:
+            stored = self.db.get_block(checkpoint["height"])
+            if stored is None or stored["hash"] != checkpoint["hash"]:
                 return False
-            if block[4] != self.chain[i].hash:  # Compare hashes
+            previous_block = Block.from_dict(stored)
+            start = checkpoint["height"] + 1
+
+        tail_index = self.db.get_latest_block_index()
+        if tail_index is None:
+            return False
+        if workers > 1:
+            from chain_audit import verify_chain_parallel
+
+            result = verify_chain_parallel(
+                self.db_name,
+                start,
+                tail_index + 1,
+                (previous_block.index, previous_block.hash) if previous_block else None,
+                workers=workers,
+                block_log=(
+                    str(self.db.block_log.directory) if self.db.block_log else None
+                ),
+            )
+            if result["first_invalid"] is not None:
+                print(f"Block {result['first_invalid']} failed verification")
                 return False
+            if result["last"] is not None:
+                previous_block = Block.from_dict(self.db.get_block(result["last"][0]))
+        else:
+            for page_start in range(start, tail_index + 1, page_size):
+                for row in self.db.get_blocks(page_start, page_start + page_size):
+                    block = Block.from_dict(row)
+                    if not check_block(block, previous_block):
+                        return False
+                    previous_block = block
+
+        # The in-memory tail must be the stored tail
+        latest = self.get_latest_block()
+        if previous_block is None or previous_block.hash != latest.hash:
+            return False
 
+        self.db.add_checkpoint(
+            previous_block.index,
+            previous_block.hash,
+            self._sign_checkpoint(previous_block.index, previous_block.hash),
+        )
+        self._verified_height = previous_block.index
         return True
 
     def __del__(self):
         """Ensure database connection is closed when object is destroyed"""
         try:
+            self.flush_pending()
             self.db.close()
         except:
             pass
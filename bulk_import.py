@@ -0,0 +1,196 @@
+"""Headless bulk import of historical medical records.
+
+Streams records from a JSONL or CSV file (one record per line/row with
+username, diagnosis, treatment, notes and date), validates them in batches,
+chains one block per record in order and writes each batch with executemany
+inside a single transaction. Progress is saved with every batch, so an
+interrupted import resumes after the last committed block.
+
+Usage: python bulk_import.py records.jsonl [--db healthcare_blockchain.db]
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from typing import List, Dict, Any, Iterator, NamedTuple, Optional, Tuple, Union
+
+from blockchain import Block, HealthcareBlockchain
+
+RECORD_FIELDS = ("diagnosis", "treatment", "notes", "date")
+
+
+class InvalidRow(NamedTuple):
+    """A JSONL line that does not hold a record"""
+
+    line: int
+    error: str
+
+
+def read_records(
+    path: str, fmt: Optional[str] = None
+) -> Iterator[Union[Dict[str, Any], InvalidRow]]:
+    """Yield raw records one at a time from a JSONL or CSV file.
+
+    JSONL lines that are not JSON objects are yielded as InvalidRow, so they
+    are counted like any other invalid row instead of ending the import.
+    """
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+            return
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield InvalidRow(line_number, f"Malformed JSON: {e.msg}")
+                continue
+            if isinstance(raw, dict):
+                yield raw
+            else:
+                yield InvalidRow(line_number, "Record is not a JSON object")
+
+
+def chain_batch(
+    blockchain: HealthcareBlockchain,
+    batch: List[Tuple[str, Dict[str, Any]]],
+    next_index: int,
+    previous_hash: str,
+) -> Tuple[List[Block], List[Tuple[str, Dict[str, Any], int]], List[Tuple[int, str]]]:
+    """Validate (username, record_data) pairs and chain one block per valid
+    record after previous_hash.
+
+    Returns the blocks, their (username, record_data, block_index) rows for
+    insert_medical_records and a (position, error) pair per rejected record.
+    """
+    blocks = []
+    record_rows = []
+    errors = []
+    for position, (username, record_data) in enumerate(batch):
+        try:
+            medical_record = blockchain.build_medical_record(username, record_data)
+        except ValueError as e:
+            errors.append((position, str(e)))
+            continue
+        block = Block(
+            next_index,
+            time.time(),
+            medical_record,
+            previous_hash,
+            hash_scheme=blockchain.hash_scheme,
+        )
+        blocks.append(block)
+        # The block's copy of the record, encrypted if a cipher is set
+        record_rows.append((username, medical_record["medical_data"], block.index))
+        next_index += 1
+        previous_hash = block.hash
+    return blocks, record_rows, errors
+
+
+def import_records(
+    blockchain: HealthcareBlockchain,
+    path: str,
+    fmt: Optional[str] = None,
+    batch_size: int = 5000,
+    progress_every: float = 2.0,
+) -> Dict[str, Any]:
+    """Import every record in path into the chain and return run statistics.
+
+    Rows that fail validation are skipped and counted; the first few errors
+    are printed.
+    """
+    db = blockchain.db
+    source = os.path.abspath(path)
+    progress = db.get_import_progress(source)
+    rows_done = progress["rows_done"] if progress else 0
+
+    latest = db.get_latest_block()
+    next_index = latest["index"] + 1
+    previous_hash = latest["hash"]
+
+    stats = {"imported": 0, "invalid": 0, "resumed_at": rows_done}
+    started = time.perf_counter()
+    last_report = started
+
+    rows = itertools.islice(read_records(path, fmt), rows_done, None)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+
+        pairs = []
+        positions = []
+        rejected = []
+        for position, raw in enumerate(batch):
+            if isinstance(raw, InvalidRow):
+                rejected.append((position, f"line {raw.line}: {raw.error}"))
+                continue
+            positions.append(position)
+            pairs.append(
+                (
+                    raw.get("username"),
+                    {field: raw.get(field) or "" for field in RECORD_FIELDS},
+                )
+            )
+        blocks, record_rows, errors = chain_batch(
+            blockchain, pairs, next_index, previous_hash
+        )
+        rejected += [(positions[position], error) for position, error in errors]
+        for position, error in sorted(rejected):
+            stats["invalid"] += 1
+            if stats["invalid"] <= 10:
+                print(f"Skipping row {rows_done + position + 1}: {error}")
+        if blocks:
+            next_index = blocks[-1].index + 1
+            previous_hash = blocks[-1].hash
+
+        with db.transaction():
+            if not db.add_blocks(blocks):
+                raise ValueError("Failed to save blocks to database")
+            if not db.insert_medical_records(record_rows):
+                raise ValueError("Failed to save medical records to database")
+            rows_done += len(batch)
+            db.set_import_progress(source, rows_done, next_index - 1)
+        stats["imported"] += len(blocks)
+
+        now = time.perf_counter()
+        if now - last_report >= progress_every:
+            rate = stats["imported"] / (now - started)
+            print(
+                f"{rows_done} rows read, {stats['imported']} imported, "
+                f"{rate:.0f} rec/s"
+            )
+            last_report = now
+
+    # The chain and its indexes were extended behind the in-memory view
+    blockchain.reload_chain()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    stats["records_per_second"] = stats["imported"] / elapsed if elapsed else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import medical records")
+    parser.add_argument("path", help="JSONL or CSV file of records")
+    parser.add_argument("--db", default="healthcare_blockchain.db")
+    parser.add_argument("--format", choices=["jsonl", "csv"])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--block-store", choices=["sqlite", "log"])
+    args = parser.parse_args()
+
+    blockchain = HealthcareBlockchain(args.db, block_store=args.block_store)
+    stats = import_records(blockchain, args.path, args.format, args.batch_size)
+    print(
+        f"Imported {stats['imported']} records ({stats['invalid']} invalid) "
+        f"in {stats['seconds']:.1f}s, {stats['records_per_second']:.0f} rec/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import pathlib
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from block_log import BlockLog
+from blockchain import Block, check_block
+from database import BLOCK_COLUMNS, block_from_row
+
+
+def _read_range(
+    db_name: str, start: int, end: int, block_log: Optional[str]
+) -> Iterator[Block]:
+    """Yield stored blocks start <= index < end over a read-only handle"""
+    if block_log is not None:
+        log = BlockLog(block_log, read_only=True)
+        try:
+            for stored in log.get_blocks(start, end):
+                yield Block.from_dict(stored)
+        finally:
+            log.close()
+        return
+
+    uri = pathlib.Path(db_name).absolute().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT {BLOCK_COLUMNS} FROM blocks
+            WHERE block_index >= ? AND block_index < ?
+            ORDER BY block_index
+            """,
+            (start, end),
+        )
+        for row in cursor:
+            yield Block.from_dict(block_from_row(row))
+    finally:
+        conn.close()
+
+
+def _verify_range(
+    db_name: str, start: int, end: int, block_log: Optional[str] = None
+) -> Dict[str, Any]:
+    """Verify blocks start <= index < end in a worker process.
+
+    Links inside the range are checked here; the link into the range from the
+    block before it is left to the caller, which sees every range boundary.
+    """
+    first = None
+    previous_block = None
+    for block in _read_range(db_name, start, end, block_log):
+        if not check_block(block, previous_block):
+            return {"first_invalid": block.index, "first": first, "last": None}
+        if first is None:
+            first = (block.index, block.previous_hash)
+        previous_block = block
+    last = (previous_block.index, previous_block.hash) if previous_block else None
+    return {"first_invalid": None, "first": first, "last": last}
+
+
+def verify_chain_parallel(
+    db_name: str,
+    start: int,
+    end: int,
+    previous_block: Optional[Tuple[int, str]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = 10000,
+    block_log: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Verify stored blocks start <= index < end across a process pool.
+
+    previous_block is the (index, hash) of an already trusted block just before
+    start, if any. block_log is the directory of the database's BlockLog when
+    it keeps its blocks there rather than in the blocks table. Returns a dict
+    with the first invalid index (or None) and the (index, hash) of the last
+    block verified.
+    """
+    ranges: List[Tuple[int, int]] = [
+        (chunk_start, min(chunk_start + chunk_size, end))
+        for chunk_start in range(start, end, chunk_size)
+    ]
+    last = previous_block
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            _verify_range,
+            [db_name] * len(ranges),
+            [r[0] for r in ranges],
+            [r[1] for r in ranges],
+            [block_log] * len(ranges),
+        )
+        for result in results:
+            # Check the link across the boundary before trusting the range
+            first = result["first"]
+            if first is not None and last is not None:
+                index, previous_hash = first
+                if index != last[0] + 1 or previous_hash != last[1]:
+                    executor.shutdown(cancel_futures=True)
+                    return {"first_invalid": index, "last": last}
+            if result["first_invalid"] is not None:
+                executor.shutdown(cancel_futures=True)
+                return {"first_invalid": result["first_invalid"], "last": last}
+            last = result["last"] or last
+    return {"first_invalid": None, "last": last}
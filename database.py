@@ -1,217 +1,1166 @@
+import base64
+import os
+import pathlib
+import queue
+import re
+import shutil
 import sqlite3
-from typing import Optional, List, Dict, Any
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 import json
 import time
 
+from block_log import BlockLog
+from metrics import instrument_class
+from query_diagnostics import QueryDiagnostics
 
+
+# Connection settings applied on open; override per key via Database(pragmas=...)
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # durable at checkpoints, safe with WAL
+    "cache_size": -65536,  # negative means KiB, i.e. 64 MiB of page cache
+    "mmap_size": 268435456,  # 256 MiB
+    "temp_store": "MEMORY",
+}
+
+# Column order expected by block_from_row
+BLOCK_COLUMNS = (
+    "block_index, block_timestamp, block_data, previous_hash, block_hash, "
+    "hash_scheme, payload_digest"
+)
+
+
+def block_from_row(row: tuple) -> Dict[str, Any]:
+    """A block dict from a row of BLOCK_COLUMNS"""
+    return {
+        "index": row[0],
+        "timestamp": row[1],
+        "data": json.loads(row[2]),
+        "previous_hash": row[3],
+        "hash": row[4],
+        "hash_scheme": row[5],
+        "payload_digest": row[6],
+    }
+
+
+# Pragmas that change the database file itself; only the writer applies them
+WRITER_ONLY_PRAGMAS = ("journal_mode", "synchronous")
+
+# Full-text index of the record fields, see Database.search_records. It is
+# contentless (it stores only the index; matches join back to medical_records
+# by record_id) and leaves out rows sealed by encryption.FieldCipher, whose
+# columns hold ciphertext that starts with encryption.PREFIX.
+SEARCH_TABLE = "medical_records_fts"
+_PLAIN_TEXT = "substr({row}diagnosis, 1, 9) <> '$aes-gcm$'"
+_SEARCH_ROW = "{row}username, {row}diagnosis, {row}treatment, {row}notes"
+# bm25 weights in index column order. username is indexed only to narrow
+# matches to the patients a requester may see, so it adds nothing to a score
+SEARCH_WEIGHTS = "0.0, 4.0, 2.0, 1.0"
+# Requesters seeing at most this many patients have them pushed into the
+# MATCH expression, so FTS5 intersects posting lists instead of joining every
+# match to medical_records; past that, merging the long OR costs more than
+# the join. The exact filter on medical_records.username applies either way
+SEARCH_PUSHDOWN_LIMIT = 250
+_SEARCH_TERMS = re.compile(r'"([^"]*)"|(\S+)')
+# A character the unicode61 tokenizer keeps in a token; a username without
+# one indexes as no tokens at all and cannot be matched through the index
+_TOKEN_CHAR = re.compile(r"[^\W_]")
+
+
+class SearchUnavailableError(RuntimeError):
+    """Full-text search cannot answer for the records stored in this database"""
+
+
+def _fts_string(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 expression over the record fields, or None
+    if it has nothing to search for.
+
+    Every word must match; word* matches a prefix and "two words" a phrase.
+    Words are quoted, so FTS5 operators and column filters in the text are
+    searched for as plain words.
+    """
+    terms = []
+    for phrase, word in _SEARCH_TERMS.findall(text):
+        suffix = ""
+        if word:
+            if word.endswith("*"):
+                word, suffix = word.rstrip("*"), " *"
+            phrase = word
+        if re.search(r"\w", phrase):
+            terms.append(_fts_string(phrase) + suffix)
+    if not terms:
+        return None
+    return "{diagnosis treatment notes} : (" + " ".join(terms) + ")"
+
+
+class ConnectionPool:
+    """One serialized writer connection plus read-only connections.
+
+    Under WAL, readers neither block the writer nor each other, so any thread
+    can query concurrently while every write goes through the single writer.
+    """
+
+    def __init__(
+        self,
+        db_name: str,
+        readers: int,
+        pragmas: Dict[str, Any],
+        diagnostics: Optional[QueryDiagnostics] = None,
+    ):
+        self.db_name = db_name
+        self.pragmas = pragmas
+        self.diagnostics = diagnostics
+        self._connect = diagnostics.connect if diagnostics else sqlite3.connect
+        self.writer = self._connect(db_name, check_same_thread=False)
+        self._configure(self.writer, pragmas)
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+        # Nesting depth of Database.transaction() on the writer
+        self.transaction_depth = 0
+        self.max_readers = 0 if db_name == ":memory:" else readers
+        self._idle_readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self.users = 0
+        # Set when the database keeps its blocks in a BlockLog
+        self.block_log: Optional[BlockLog] = None
+
+    def _configure(self, conn: sqlite3.Connection, pragmas: Dict[str, Any]):
+        cursor = conn.cursor()
+        for name, value in pragmas.items():
+            if value is not None:
+                cursor.execute(f"PRAGMA {name} = {value}")
+
+    @contextmanager
+    def write(self):
+        with self._write_lock:
+            self._local.writing = getattr(self._local, "writing", 0) + 1
+            try:
+                yield self.writer
+            finally:
+                self._local.writing -= 1
+
+    @contextmanager
+    def read(self):
+        if self.max_readers == 0 or getattr(self._local, "writing", 0):
+            # Reads made while this thread holds the writer must see its
+            # uncommitted changes, so they go through the writer too
+            with self.write() as conn:
+                yield conn
+            return
+        conn = self._checkout_reader()
+        try:
+            yield conn
+        finally:
+            self._idle_readers.put(conn)
+
+    def _checkout_reader(self) -> sqlite3.Connection:
+        try:
+            return self._idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._readers_lock:
+            if len(self._readers) < self.max_readers:
+                conn = self._open_reader()
+                self._readers.append(conn)
+                return conn
+        return self._idle_readers.get()
+
+    def _open_reader(self) -> sqlite3.Connection:
+        uri = pathlib.Path(self.db_name).absolute().as_uri() + "?mode=ro"
+        conn = self._connect(uri, uri=True, check_same_thread=False)
+        self._configure(
+            conn,
+            {k: v for k, v in self.pragmas.items() if k not in WRITER_ONLY_PRAGMAS},
+        )
+        return conn
+
+    def close(self):
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+        with self._write_lock:
+            self.writer.close()
+            if self.block_log is not None:
+                self.block_log.close()
+        if self.diagnostics is not None:
+            print(f"Slowest statements on {self.db_name}:")
+            self.diagnostics.print_report()
+
+
+# Database objects opened on the same file in one process share its pool
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _acquire_pool(
+    db_name: str,
+    readers: int,
+    pragmas: Dict[str, Any],
+    diagnostics: Optional[QueryDiagnostics] = None,
+) -> ConnectionPool:
+    if db_name == ":memory:":
+        pool = ConnectionPool(db_name, readers, pragmas, diagnostics)
+        pool.users += 1
+        return pool
+    key = os.path.abspath(db_name)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_name, readers, pragmas, diagnostics)
+        pool.users += 1
+        return pool
+
+
+def _release_pool(pool: ConnectionPool):
+    with _pools_lock:
+        pool.users -= 1
+        if pool.users > 0:
+            return
+        key = os.path.abspath(pool.db_name)
+        if _pools.get(key) is pool:
+            del _pools[key]
+    pool.close()
+
+
+# Every public query is timed as "db.<method>" while metrics are enabled;
+# these hand out connections or context managers rather than doing the work
+@instrument_class(
+    "db",
+    exclude=("transaction", "writer", "reader"),
+    # These return False only when a write was rejected
+    false_is_failure=(
+        "add_block",
+        "add_blocks",
+        "add_medical_record",
+        "insert_medical_records",
+    ),
+)
 class Database:
-    def __init__(self, db_name: str = "healthcare.db"):
-        self.conn = sqlite3.connect(db_name)
+    def __init__(
+        self,
+        db_name: str = "healthcare.db",
+        pragmas: Optional[Dict[str, Any]] = None,
+        readers: int = 4,
+        block_store: Optional[str] = None,
+        record_cipher=None,
+        diagnostics: Optional[QueryDiagnostics] = None,
+    ):
+        """block_store picks where blocks are kept: "sqlite" for the blocks
+        table or "log" for an append-only BlockLog in the <db_name>.blocks
+        directory. By default a database keeps whichever it already uses.
+
+        record_cipher (an encryption.FieldCipher) encrypts the diagnosis,
+        treatment and notes columns. It defaults to one built from
+        MEDICHAIN_RECORD_KEY when that is set; otherwise fields are stored as
+        plain text.
+
+        diagnostics turns on the slow-query log and plan capture of
+        query_diagnostics, by default when MEDICHAIN_SQL_DIAGNOSTICS is set.
+        Connections are shared per file, so the first Database opened on a
+        file decides whether its pool is diagnosed."""
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        if record_cipher is None and os.environ.get("MEDICHAIN_RECORD_KEY"):
+            from encryption import FieldCipher
+
+            record_cipher = FieldCipher.from_env()
+        self.cipher = record_cipher
+        if diagnostics is None:
+            diagnostics = QueryDiagnostics.from_env()
+        self.pool = _acquire_pool(db_name, readers, self.pragmas, diagnostics)
+        self._closed = False
+        self.block_log: Optional[BlockLog] = None
         self.create_tables()
+        self.block_log = self._open_block_log(db_name, block_store)
+
+    def _open_block_log(
+        self, db_name: str, block_store: Optional[str]
+    ) -> Optional[BlockLog]:
+        log_dir = f"{db_name}.blocks"
+        if block_store is None:
+            block_store = "log" if os.path.isdir(log_dir) else "sqlite"
+        if block_store == "sqlite":
+            if os.path.isdir(log_dir):
+                raise ValueError(f"{db_name} already keeps its blocks in {log_dir}")
+            return None
+        if block_store != "log":
+            raise ValueError(f"Unknown block store: {block_store}")
+        if db_name == ":memory:":
+            raise ValueError("The block log needs an on-disk database")
+
+        with self.writer():
+            if self.pool.block_log is None:
+                if not os.path.isdir(log_dir):
+                    self._copy_blocks_to_log(log_dir)
+                self.pool.block_log = BlockLog(log_dir)
+            return self.pool.block_log
+
+    def _copy_blocks_to_log(self, log_dir: str, page_size: int = 10000):
+        """Seed a new block log with the blocks already in the blocks table.
+
+        The log is built beside its final path and renamed into place, so an
+        interrupted copy is started over on the next open.
+        """
+        building = f"{log_dir}.building"
+        shutil.rmtree(building, ignore_errors=True)
+        block_log = BlockLog(building)
+        try:
+            latest = self.get_latest_block_index()
+            if latest is not None:
+                for start in range(0, latest + 1, page_size):
+                    rows = self.get_blocks(start, start + page_size)
+                    if not block_log.add_blocks(SimpleNamespace(**r) for r in rows):
+                        raise ValueError("The blocks table has gaps in its chain")
+            block_log.sync()
+        finally:
+            block_log.close()
+        os.rename(building, log_dir)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The shared writer connection; prefer writer()/reader() from threads"""
+        return self.pool.writer
+
+    def writer(self):
+        return self.pool.write()
+
+    def reader(self):
+        return self.pool.read()
+
+    @contextmanager
+    def transaction(self):
+        """Stage every write made inside the block and commit them once.
+
+        Nested transactions become savepoints, so a failing inner unit is rolled
+        back on its own while the outer transaction carries on. The writer stays
+        locked to this thread until the outermost transaction ends.
+        """
+        with self.writer() as conn:
+            depth = self.pool.transaction_depth
+            savepoint = f"unit_of_work_{depth}"
+            log_mark = self.block_log.mark() if self.block_log is not None else None
+            if depth == 0:
+                conn.commit()
+                conn.execute("BEGIN")
+            else:
+                conn.execute(f"SAVEPOINT {savepoint}")
+            self.pool.transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.pool.transaction_depth -= 1
+                if depth == 0:
+                    conn.rollback()
+                else:
+                    conn.execute(f"ROLLBACK TO {savepoint}")
+                    conn.execute(f"RELEASE {savepoint}")
+                if self.block_log is not None:
+                    self.block_log.rollback_to(log_mark)
+                raise
+            self.pool.transaction_depth -= 1
+            if depth == 0:
+                if self.block_log is not None:
+                    # Blocks are durable before the rows that refer to them
+                    try:
+                        self.block_log.commit()
+                    except BaseException:
+                        conn.rollback()
+                        self.block_log.rollback_to(log_mark)
+                        raise
+                conn.commit()
+            else:
+                conn.execute(f"RELEASE {savepoint}")
+
+    def _commit(self):
+        # Inside transaction() the outermost unit of work commits instead
+        with self.writer() as conn:
+            if self.pool.transaction_depth == 0:
+                conn.commit()
+
+    def _commit_log(self, added: bool) -> bool:
+        # Blocks appended outside transaction() are committed at once
+        if added and self.pool.transaction_depth == 0:
+            self.block_log.commit()
+        return added
+
+    def _rollback(self):
+        with self.writer() as conn:
+            if self.pool.transaction_depth == 0:
+                conn.rollback()
 
     def create_tables(self):
-        cursor = self.conn.cursor()
+        with self.writer() as conn:
+            cursor = conn.cursor()
 
-        # Users table
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                username TEXT PRIMARY KEY,
-                password TEXT NOT NULL,
-                user_type TEXT NOT NULL
+            # Users table
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    password TEXT NOT NULL,
+                    user_type TEXT NOT NULL
+                )
+                """
             )
-            """
-        )
 
-        # Blocks table - using block_index instead of index (which is a SQL keyword)
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS blocks (
-                block_index INTEGER PRIMARY KEY,
-                block_timestamp REAL NOT NULL,
-                block_data TEXT NOT NULL,
-                previous_hash TEXT NOT NULL,
-                block_hash TEXT NOT NULL
+            # Blocks table - using block_index instead of index (which is a SQL keyword)
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS blocks (
+                    block_index INTEGER PRIMARY KEY,
+                    block_timestamp REAL NOT NULL,
+                    block_data TEXT NOT NULL,
+                    previous_hash TEXT NOT NULL,
+                    block_hash TEXT NOT NULL,
+                    hash_scheme TEXT,
+                    payload_digest TEXT
+                )
+                """
+            )
+            # Databases created before canonical block headers lack these columns;
+            # NULL marks a block hashed with the original JSON scheme
+            cursor.execute("PRAGMA table_info(blocks)")
+            block_columns = {row[1] for row in cursor.fetchall()}
+            for column in ("hash_scheme", "payload_digest"):
+                if column not in block_columns:
+                    cursor.execute(f"ALTER TABLE blocks ADD COLUMN {column} TEXT")
+
+            # Medical records table
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS medical_records (
+                    record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT NOT NULL,
+                    diagnosis TEXT NOT NULL,
+                    treatment TEXT NOT NULL,
+                    notes TEXT,
+                    record_date TEXT NOT NULL,
+                    block_index INTEGER,
+                    FOREIGN KEY (username) REFERENCES users (username),
+                    FOREIGN KEY (block_index) REFERENCES blocks (block_index)
+                )
+                """
+            )
+
+            # Access permissions table
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS access_permissions (
+                    patient_id TEXT NOT NULL,
+                    provider_id TEXT NOT NULL,
+                    grant_date TEXT NOT NULL,
+                    FOREIGN KEY (patient_id) REFERENCES users (username),
+                    FOREIGN KEY (provider_id) REFERENCES users (username),
+                    PRIMARY KEY (patient_id, provider_id)
+                )
+                """
+            )
+
+            # Signed integrity checkpoints (verified height and its block hash)
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    height INTEGER PRIMARY KEY,
+                    block_hash TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+                """
+            )
+
+            # Resume points for bulk imports (source rows consumed so far)
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS import_progress (
+                    source TEXT PRIMARY KEY,
+                    rows_done INTEGER NOT NULL,
+                    last_block INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+                """
+            )
+
+            # Indexes for the per-patient record listing and provider-side lookups.
+            # The implicit trailing record_id makes (record_date, record_id) a
+            # usable keyset for paging a patient's history.
+            cursor.execute("DROP INDEX IF EXISTS idx_medical_records_username_date")
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_medical_records_patient_date
+                ON medical_records (username, record_date)
+                """
+            )
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_access_permissions_provider
+                ON access_permissions (provider_id, patient_id)
+                """
             )
-            """
-        )
 
-        # Medical records table
+            self.search_available = self._create_search_index(cursor)
+
+            self._commit()
+
+    def _create_search_index(self, cursor: sqlite3.Cursor) -> bool:
+        """Create the full-text index and the triggers that keep it in sync
+        with medical_records; False if SQLite was built without FTS5"""
         cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS medical_records (
-                record_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                diagnosis TEXT NOT NULL,
-                treatment TEXT NOT NULL,
-                notes TEXT,
-                record_date TEXT NOT NULL,
-                block_index INTEGER,
-                FOREIGN KEY (username) REFERENCES users (username),
-                FOREIGN KEY (block_index) REFERENCES blocks (block_index)
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (SEARCH_TABLE,),
+        )
+        if cursor.fetchone() is None:
+            try:
+                cursor.execute(
+                    f"""
+                    CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+                        username, diagnosis, treatment, notes,
+                        content='', tokenize='porter unicode61'
+                    )
+                    """
+                )
+            except sqlite3.OperationalError as e:
+                print(f"Full-text search is unavailable: {str(e)}")
+                return False
+            # Index the records written before the index existed
+            cursor.execute(
+                f"""
+                INSERT INTO {SEARCH_TABLE}
+                (rowid, username, diagnosis, treatment, notes)
+                SELECT record_id, {_SEARCH_ROW.format(row="")}
+                FROM medical_records
+                WHERE {_PLAIN_TEXT.format(row="")}
+                """
             )
+        # A contentless index deletes a row given the values it indexed
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS medical_records_fts_insert
+            AFTER INSERT ON medical_records
+            WHEN {_PLAIN_TEXT.format(row="new.")}
+            BEGIN
+                INSERT INTO {SEARCH_TABLE}
+                (rowid, username, diagnosis, treatment, notes)
+                VALUES (new.record_id, {_SEARCH_ROW.format(row="new.")});
+            END
             """
         )
-
-        # Access permissions table
         cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS access_permissions (
-                patient_id TEXT NOT NULL,
-                provider_id TEXT NOT NULL,
-                grant_date TEXT NOT NULL,
-                FOREIGN KEY (patient_id) REFERENCES users (username),
-                FOREIGN KEY (provider_id) REFERENCES users (username),
-                PRIMARY KEY (patient_id, provider_id)
-            )
+            f"""
+            CREATE TRIGGER IF NOT EXISTS medical_records_fts_delete
+            AFTER DELETE ON medical_records
+            WHEN {_PLAIN_TEXT.format(row="old.")}
+            BEGIN
+                INSERT INTO {SEARCH_TABLE}
+                ({SEARCH_TABLE}, rowid, username, diagnosis, treatment, notes)
+                VALUES ('delete', old.record_id, {_SEARCH_ROW.format(row="old.")});
+            END
             """
         )
-
-        self.conn.commit()
+        return True
 
     def add_user(self, username: str, password: str, user_type: str) -> bool:
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "INSERT INTO users (username, password, user_type) VALUES (?, ?, ?)",
-                (username, password, user_type),
-            )
-            self.conn.commit()
+            with self.writer() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT INTO users (username, password, user_type) VALUES (?, ?, ?)",
+                    (username, password, user_type),
+                )
+                self._commit()
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def add_users(self, users: List[Tuple[str, str, str]]) -> bool:
+        """Insert (username, password, user_type) rows in one statement; none
+        are added if any username is taken"""
+        try:
+            with self.transaction() as db:
+                db.conn.executemany(
+                    "INSERT INTO users (username, password, user_type) VALUES (?, ?, ?)",
+                    users,
+                )
             return True
         except sqlite3.IntegrityError:
             return False
 
     def get_user(self, username: str) -> Optional[tuple]:
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-        return cursor.fetchone()
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
+            return cursor.fetchone()
+
+    def update_user_password(self, username: str, password: str) -> bool:
+        with self.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE users SET password = ? WHERE username = ?", (password, username)
+            )
+            self._commit()
+            return cursor.rowcount == 1
 
     def add_block(self, block) -> bool:
+        if self.block_log is not None:
+            with self.writer():
+                return self._commit_log(self.block_log.add_block(block))
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO blocks (block_index, block_timestamp, block_data, previous_hash, block_hash)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (
-                    block.index,
-                    block.timestamp,
-                    json.dumps(block.data),
-                    block.previous_hash,
-                    block.hash,
-                ),
-            )
-            self.conn.commit()
+            with self.writer() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT INTO blocks (block_index, block_timestamp, block_data,
+                                        previous_hash, block_hash, hash_scheme,
+                                        payload_digest)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        block.index,
+                        block.timestamp,
+                        json.dumps(block.data),
+                        block.previous_hash,
+                        block.hash,
+                        block.hash_scheme,
+                        block.payload_digest,
+                    ),
+                )
+                self._commit()
             return True
         except sqlite3.IntegrityError:
             return False
 
     def get_latest_block(self) -> Optional[Dict[str, Any]]:
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM blocks ORDER BY block_index DESC LIMIT 1")
-        row = cursor.fetchone()
-        if row:
-            return {
-                "index": row[0],
-                "timestamp": row[1],
-                "data": json.loads(row[2]),
-                "previous_hash": row[3],
-                "hash": row[4],
-            }
-        return None
+        if self.block_log is not None:
+            return self.block_log.get_latest_block()
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {BLOCK_COLUMNS} FROM blocks ORDER BY block_index DESC LIMIT 1"
+            )
+            row = cursor.fetchone()
+            if row:
+                return block_from_row(row)
+            return None
+
+    def get_block(self, block_index: int) -> Optional[Dict[str, Any]]:
+        if self.block_log is not None:
+            return self.block_log.get_block(block_index)
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {BLOCK_COLUMNS} FROM blocks WHERE block_index = ?",
+                (block_index,),
+            )
+            row = cursor.fetchone()
+            return block_from_row(row) if row else None
+
+    def get_blocks(self, start: int, end: int) -> List[Dict[str, Any]]:
+        """Return stored blocks with start <= index < end, in chain order"""
+        if self.block_log is not None:
+            return self.block_log.get_blocks(start, end)
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT {BLOCK_COLUMNS} FROM blocks
+                WHERE block_index >= ? AND block_index < ?
+                ORDER BY block_index
+                """,
+                (start, end),
+            )
+            return [block_from_row(row) for row in cursor.fetchall()]
+
+    def get_blocks_by_index(self, block_indices: List[int]) -> List[Dict[str, Any]]:
+        if not block_indices:
+            return []
+        if self.block_log is not None:
+            return self.block_log.get_blocks_by_index(block_indices)
+        placeholders = ", ".join("?" * len(block_indices))
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT {BLOCK_COLUMNS} FROM blocks
+                WHERE block_index IN ({placeholders})
+                """,
+                list(block_indices),
+            )
+            return [block_from_row(row) for row in cursor.fetchall()]
+
+    def iter_block_headers(self, start: int = 0, end: Optional[int] = None):
+        """Yield (index, timestamp, previous_hash, hash, hash_scheme,
+        payload_digest) for stored blocks in chain order, without block_data"""
+        if self.block_log is not None:
+            yield from self.block_log.iter_block_headers(start, end)
+            return
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT block_index, block_timestamp, previous_hash, block_hash,
+                       hash_scheme, payload_digest
+                FROM blocks
+                WHERE block_index >= ? AND block_index < ?
+                ORDER BY block_index
+                """,
+                (start, end if end is not None else 2**63 - 1),
+            )
+            yield from cursor
+
+    def get_block_index_entries(self):
+        """Yield (block_index, record_type, username) for every stored record.
+
+        Batch blocks yield one row for the block and one per transaction. The
+        JSON is unpacked inside SQLite so no block_data reaches Python.
+        """
+        if self.block_log is not None:
+            yield from self.block_log.get_block_index_entries()
+            return
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT block_index,
+                       json_extract(block_data, '$.record_type'),
+                       json_extract(block_data, '$.username')
+                FROM blocks
+                WHERE json_valid(block_data)
+                UNION ALL
+                SELECT b.block_index,
+                       json_extract(t.value, '$.record_type'),
+                       json_extract(t.value, '$.username')
+                FROM blocks b, json_each(b.block_data, '$.transactions') t
+                WHERE json_valid(b.block_data)
+                ORDER BY 1
+                """
+            )
+            yield from cursor
 
     def add_medical_record(
         self, username: str, record_data: Dict[str, Any], block_index: int
     ) -> bool:
+        if self.cipher is not None:
+            record_data = self.cipher.encrypt_record(username, record_data)
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO medical_records
-                (username, diagnosis, treatment, notes, record_date, block_index)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    username,
-                    record_data["diagnosis"],
-                    record_data["treatment"],
-                    record_data.get("notes", ""),
-                    record_data["date"],
-                    block_index,
-                ),
-            )
-            self.conn.commit()
+            with self.writer() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT INTO medical_records
+                    (username, diagnosis, treatment, notes, record_date, block_index)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        username,
+                        record_data["diagnosis"],
+                        record_data["treatment"],
+                        record_data.get("notes", ""),
+                        record_data["date"],
+                        block_index,
+                    ),
+                )
+                self._commit()
             return True
         except sqlite3.IntegrityError:
             return False
 
-    def get_latest_block_index(self) -> Optional[int]:
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "SELECT block_index FROM blocks ORDER BY block_index DESC LIMIT 1"
+    def add_medical_records(
+        self, records: List[Tuple[str, Dict[str, Any]]], block_index: int
+    ) -> bool:
+        """Insert (username, record_data) pairs sealed into one block, one commit"""
+        return self.insert_medical_records(
+            [(username, record_data, block_index) for username, record_data in records]
         )
-        row = cursor.fetchone()
-        return row[0] if row else None
+
+    def insert_medical_records(
+        self, rows: List[Tuple[str, Dict[str, Any], int]]
+    ) -> bool:
+        """Insert (username, record_data, block_index) rows with one executemany"""
+        if self.cipher is not None:
+            sealed = self.cipher.encrypt_records(
+                [(username, record_data) for username, record_data, _ in rows]
+            )
+            rows = [
+                (username, record_data, block_index)
+                for (username, _, block_index), record_data in zip(rows, sealed)
+            ]
+        try:
+            with self.writer() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    """
+                    INSERT INTO medical_records
+                    (username, diagnosis, treatment, notes, record_date, block_index)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (
+                            username,
+                            record_data["diagnosis"],
+                            record_data["treatment"],
+                            record_data.get("notes", ""),
+                            record_data["date"],
+                            block_index,
+                        )
+                        for username, record_data, block_index in rows
+                    ],
+                )
+                self._commit()
+            return True
+        except sqlite3.IntegrityError:
+            self._rollback()
+            return False
+
+    def add_blocks(self, blocks) -> bool:
+        """Insert already chained blocks with one executemany"""
+        if self.block_log is not None:
+            with self.writer():
+                return self._commit_log(self.block_log.add_blocks(blocks))
+        try:
+            with self.writer() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    """
+                    INSERT INTO blocks (block_index, block_timestamp, block_data,
+                                        previous_hash, block_hash, hash_scheme,
+                                        payload_digest)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (
+                            block.index,
+                            block.timestamp,
+                            json.dumps(block.data),
+                            block.previous_hash,
+                            block.hash,
+                            block.hash_scheme,
+                            block.payload_digest,
+                        )
+                        for block in blocks
+                    ],
+                )
+                self._commit()
+            return True
+        except sqlite3.IntegrityError:
+            self._rollback()
+            return False
+
+    def get_import_progress(self, source: str) -> Optional[Dict[str, Any]]:
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT rows_done, last_block FROM import_progress WHERE source = ?",
+                (source,),
+            )
+            row = cursor.fetchone()
+            return {"rows_done": row[0], "last_block": row[1]} if row else None
+
+    def set_import_progress(self, source: str, rows_done: int, last_block: int):
+        with self.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO import_progress (source, rows_done, last_block, updated_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (source, rows_done, last_block, time.strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            self._commit()
+
+    def get_latest_block_index(self) -> Optional[int]:
+        if self.block_log is not None:
+            return self.block_log.get_latest_block_index()
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT block_index FROM blocks ORDER BY block_index DESC LIMIT 1"
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
 
     def get_patient_records(self, username: str) -> List[Dict[str, Any]]:
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            SELECT m.*, b.block_hash 
-            FROM medical_records m
-            JOIN blocks b ON m.block_index = b.block_index
-            WHERE m.username = ?
-            ORDER BY m.record_date DESC
-            """,
-            (username,),
-        )
-        records = []
-        for row in cursor.fetchall():
-            records.append(
-                {
-                    "id": row[0],
-                    "username": row[1],
-                    "diagnosis": row[2],
-                    "treatment": row[3],
-                    "notes": row[4],
-                    "date": row[5],
-                    "block_index": row[6],
-                    "block_hash": row[7],
-                }
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT m.*, b.block_hash 
+                FROM medical_records m
+                LEFT JOIN blocks b ON m.block_index = b.block_index
+                WHERE m.username = ?
+                ORDER BY m.record_date DESC
+                """,
+                (username,),
             )
+            records = []
+            for row in cursor.fetchall():
+                records.append(
+                    {
+                        "id": row[0],
+                        "username": row[1],
+                        "diagnosis": row[2],
+                        "treatment": row[3],
+                        "notes": row[4],
+                        "date": row[5],
+                        "block_index": row[6],
+                        "block_hash": row[7],
+                    }
+                )
+            return self._finish_records(records)
+
+    def _finish_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.cipher is not None:
+            self.cipher.decrypt_records(records)
+        # With a block log the blocks table has no rows to join against
+        if self.block_log is not None:
+            for record in records:
+                record["block_hash"] = self.block_log.get_block_hash(
+                    record["block_index"]
+                )
         return records
 
-    def add_access_permission(self, username: str, provider_id: str) -> bool:
-        try:
-            cursor = self.conn.cursor()
+    def get_patient_records_page(
+        self, username: str, page_size: int = 100, cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return one page of a patient's records, newest first, and the opaque
+        cursor for the next page (None on the last page).
+
+        Rows are dicts keyed like get_patient_records' records.
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        where = "m.username = ?"
+        params: List[Any] = [username]
+        if cursor is not None:
+            record_date, record_id = json.loads(base64.urlsafe_b64decode(cursor))
+            where += " AND (m.record_date, m.record_id) < (?, ?)"
+            params += [record_date, record_id]
+
+        with self.reader() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.row_factory = sqlite3.Row
+            db_cursor.execute(
+                f"""
+                SELECT m.record_id AS id, m.username, m.diagnosis, m.treatment,
+                       m.notes, m.record_date AS date, m.block_index, b.block_hash
+                FROM medical_records m
+                LEFT JOIN blocks b ON m.block_index = b.block_index
+                WHERE {where}
+                ORDER BY m.record_date DESC, m.record_id DESC
+                LIMIT ?
+                """,
+                params + [page_size + 1],
+            )
+            rows = self._finish_records([dict(row) for row in db_cursor.fetchall()])
+
+        if len(rows) <= page_size:
+            return rows, None
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = base64.urlsafe_b64encode(
+            json.dumps([last["date"], last["id"]]).encode()
+        ).decode()
+        return rows, next_cursor
+
+    def iter_patient_records(
+        self, username: str, page_size: int = 500, cursor: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield a patient's records one by one, reading a page at a time"""
+        while True:
+            rows, cursor = self.get_patient_records_page(username, page_size, cursor)
+            yield from rows
+            if cursor is None:
+                return
+
+    def search_records(
+        self,
+        query: str,
+        usernames: List[str],
+        page_size: int = 20,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return one page of the records of usernames matching query (see
+        fts_query), best match first, and the cursor for the next page.
+
+        Rows are dicts keyed like get_patient_records' records plus "score",
+        the bm25 rank (lower is better). Raises SearchUnavailableError if
+        SQLite lacks FTS5 or records are stored encrypted, since encrypted
+        records are not indexed and a search would silently miss them.
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        if not self.search_available:
+            raise SearchUnavailableError("SQLite was built without FTS5")
+        if self.cipher is not None:
+            raise SearchUnavailableError("Encrypted records are not indexed")
+        expression = fts_query(query)
+        if expression is None or not usernames:
+            return [], None
+        if len(usernames) <= SEARCH_PUSHDOWN_LIMIT and all(
+            _TOKEN_CHAR.search(username) for username in usernames
+        ):
+            allowed = " OR ".join(_fts_string(username) for username in usernames)
+            expression += f" AND username : ({allowed})"
+        where = "m.username IN (SELECT value FROM json_each(?))"
+        params: List[Any] = [expression, json.dumps(usernames)]
+        if cursor is not None:
+            score, record_id = json.loads(base64.urlsafe_b64decode(cursor))
+            where += " AND (s.score, m.record_id) > (?, ?)"
+            params += [score, record_id]
+
+        with self.reader() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.row_factory = sqlite3.Row
+            db_cursor.execute(
+                f"""
+                SELECT m.record_id AS id, m.username, m.diagnosis, m.treatment,
+                       m.notes, m.record_date AS date, m.block_index,
+                       b.block_hash, s.score
+                FROM (
+                    SELECT rowid, bm25({SEARCH_TABLE}, {SEARCH_WEIGHTS}) AS score
+                    FROM {SEARCH_TABLE}
+                    WHERE {SEARCH_TABLE} MATCH ?
+                ) s
+                JOIN medical_records m ON m.record_id = s.rowid
+                LEFT JOIN blocks b ON m.block_index = b.block_index
+                WHERE {where}
+                ORDER BY s.score, m.record_id
+                LIMIT ?
+                """,
+                params + [page_size + 1],
+            )
+            rows = self._finish_records([dict(row) for row in db_cursor.fetchall()])
+
+        if len(rows) <= page_size:
+            return rows, None
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = base64.urlsafe_b64encode(
+            json.dumps([last["score"], last["id"]]).encode()
+        ).decode()
+        return rows, next_cursor
+
+    def add_checkpoint(self, height: int, block_hash: str, signature: str) -> bool:
+        with self.writer() as conn:
+            cursor = conn.cursor()
             cursor.execute(
                 """
-                INSERT INTO access_permissions (patient_id, provider_id, grant_date)
-                VALUES (?, ?, ?)
+                INSERT OR REPLACE INTO checkpoints (height, block_hash, signature, created_at)
+                VALUES (?, ?, ?, ?)
                 """,
-                (username, provider_id, time.strftime("%Y-%m-%d %H:%M:%S")),
+                (height, block_hash, signature, time.strftime("%Y-%m-%d %H:%M:%S")),
             )
-            self.conn.commit()
+            self._commit()
+        return True
+
+    def get_latest_checkpoint(self) -> Optional[Dict[str, Any]]:
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT height, block_hash, signature FROM checkpoints
+                ORDER BY height DESC LIMIT 1
+                """
+            )
+            row = cursor.fetchone()
+            if row:
+                return {"height": row[0], "hash": row[1], "signature": row[2]}
+            return None
+
+    def add_access_permission(self, username: str, provider_id: str) -> bool:
+        try:
+            with self.writer() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT INTO access_permissions (patient_id, provider_id, grant_date)
+                    VALUES (?, ?, ?)
+                    """,
+                    (username, provider_id, time.strftime("%Y-%m-%d %H:%M:%S")),
+                )
+                self._commit()
             return True
         except sqlite3.IntegrityError:
             return False
 
+    def add_access_permissions(self, grants: List[Tuple[str, str]]) -> bool:
+        """Insert (patient_id, provider_id) grants in one statement"""
+        granted = time.strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with self.transaction() as db:
+                db.conn.executemany(
+                    """
+                    INSERT INTO access_permissions (patient_id, provider_id, grant_date)
+                    VALUES (?, ?, ?)
+                    """,
+                    [
+                        (patient_id, provider_id, granted)
+                        for patient_id, provider_id in grants
+                    ],
+                )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def remove_access_permission(self, username: str, provider_id: str) -> bool:
+        with self.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                DELETE FROM access_permissions
+                WHERE patient_id = ? AND provider_id = ?
+                """,
+                (username, provider_id),
+            )
+            self._commit()
+        return cursor.rowcount > 0
+
     def check_access_permission(self, username: str, provider_id: str) -> bool:
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            SELECT 1 FROM access_permissions 
-            WHERE patient_id = ? AND provider_id = ?
-            """,
-            (username, provider_id),
-        )
-        return cursor.fetchone() is not None
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT 1 FROM access_permissions 
+                WHERE patient_id = ? AND provider_id = ?
+                """,
+                (username, provider_id),
+            )
+            return cursor.fetchone() is not None
+
+    def get_users(self) -> List[tuple]:
+        """Return (username, password, user_type) for every user"""
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT username, password, user_type FROM users")
+            return cursor.fetchall()
+
+    def get_access_permissions(self) -> List[tuple]:
+        """Return every (patient_id, provider_id) grant"""
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT patient_id, provider_id FROM access_permissions")
+            return cursor.fetchall()
 
     def get_all_users(self) -> List[tuple]:
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT username, user_type FROM users")
-        return cursor.fetchall()
+        with self.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT username, user_type FROM users")
+            return cursor.fetchall()
+
+    def query_report(self, limit: Optional[int] = 20) -> List[Dict[str, Any]]:
+        """Per-statement totals and plans, slowest first; empty unless the
+        pool was opened with diagnostics"""
+        if self.pool.diagnostics is None:
+            return []
+        return self.pool.diagnostics.report(limit)
 
     def close(self):
-        self.conn.close()
+        if not self._closed:
+            self._closed = True
+            _release_pool(self.pool)
@@ -0,0 +1,359 @@
+"""Field-level encryption of medical record text and streaming encryption
+of attachments.
+
+Fields are sealed with AES-256-GCM under keys derived from a master secret
+with HKDF-SHA256, one key per key id, and bound to their patient and field
+name as associated data so a value cannot be moved to another record or
+column. Stored values look like
+
+    $aes-gcm$<key id>$<base64 of nonce + ciphertext + tag>
+
+so plaintext rows written before encryption was enabled read back unchanged.
+Attachments are encrypted as a stream of fixed-size chunks (see
+AttachmentCipher). The master secret comes from MEDICHAIN_RECORD_KEY (base64,
+at least 32 bytes).
+
+The cryptography package is only imported once a cipher is built, so this
+module can be imported (and encryption left off) without it.
+"""
+import base64
+import functools
+import os
+import struct
+from typing import List, Dict, Any, BinaryIO, Iterator, Optional, Tuple
+
+ENCRYPTED_FIELDS = ("diagnosis", "treatment", "notes")
+PREFIX = "$aes-gcm$"
+NONCE_BYTES = 12
+MIN_SECRET_BYTES = 32
+
+
+def derive_key(
+    master_secret: bytes, key_id: str, purpose: str = "record-fields"
+) -> bytes:
+    """Derive the 256-bit key for key_id and purpose from a high-entropy
+    master secret; each purpose gets an independent key"""
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=f"medichain-{purpose}:{key_id}".encode(),
+    ).derive(master_secret)
+
+
+class FieldCipher:
+    """Encrypts record fields with one cached AESGCM context per key id.
+
+    New values use key_id; retired maps older key ids to their master
+    secrets so values written before a key rotation still decrypt.
+    """
+
+    def __init__(
+        self,
+        master_secret: bytes,
+        key_id: str = "1",
+        retired: Optional[Dict[str, bytes]] = None,
+    ):
+        if len(master_secret) < MIN_SECRET_BYTES:
+            raise ValueError(f"Master secret must be {MIN_SECRET_BYTES}+ bytes")
+        if "$" in key_id:
+            raise ValueError("Key ids cannot contain '$'")
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        self.key_id = key_id
+        secrets = {**(retired or {}), key_id: master_secret}
+        # Key derivation and cipher setup happen once per key, not per value
+        self._aeads = {kid: AESGCM(derive_key(s, kid)) for kid, s in secrets.items()}
+        self._prefix = f"{PREFIX}{key_id}$"
+
+    @classmethod
+    def from_env(cls) -> Optional["FieldCipher"]:
+        secret = os.environ.get("MEDICHAIN_RECORD_KEY")
+        if not secret:
+            return None
+        key_id = os.environ.get("MEDICHAIN_RECORD_KEY_ID", "1")
+        return cls(base64.b64decode(secret), key_id)
+
+    def encrypt(self, value: str, associated_data: bytes) -> str:
+        nonce = os.urandom(NONCE_BYTES)
+        sealed = self._aeads[self.key_id].encrypt(
+            nonce, value.encode(), associated_data
+        )
+        return self._prefix + base64.b64encode(nonce + sealed).decode()
+
+    def decrypt(self, value: str, associated_data: bytes) -> str:
+        if not isinstance(value, str) or not value.startswith(PREFIX):
+            return value  # stored before encryption was enabled
+        key_id, _, payload = value[len(PREFIX) :].partition("$")
+        aead = self._aeads.get(key_id)
+        if aead is None:
+            raise ValueError(f"No key for record key id {key_id}")
+        sealed = base64.b64decode(payload)
+        return aead.decrypt(
+            sealed[:NONCE_BYTES], sealed[NONCE_BYTES:], associated_data
+        ).decode()
+
+    def encrypt_record(
+        self, username: str, record_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Return a copy of record_data with its text fields encrypted"""
+        return self.encrypt_records([(username, record_data)])[0]
+
+    def decrypt_record(
+        self, username: str, record_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Return a copy of record_data with its text fields decrypted"""
+        opened = dict(record_data)
+        for field in ENCRYPTED_FIELDS:
+            if field in opened:
+                opened[field] = self.decrypt(
+                    opened[field], f"{username}:{field}".encode()
+                )
+        return opened
+
+    def encrypt_records(
+        self, records: List[Tuple[str, Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """Encrypt many (username, record_data) pairs in one pass.
+
+        Nonces for the whole batch come from a single os.urandom call and the
+        cipher context is looked up once. Fields that are already sealed are
+        kept as they are, so a record encrypted for its block is stored with
+        the same ciphertext.
+        """
+        aead = self._aeads[self.key_id]
+        prefix = self._prefix
+        b64encode = base64.b64encode
+        nonces = os.urandom(NONCE_BYTES * len(ENCRYPTED_FIELDS) * len(records))
+        offset = 0
+        sealed_records = []
+        for username, record_data in records:
+            sealed_record = dict(record_data)
+            for field in ENCRYPTED_FIELDS:
+                nonce = nonces[offset : offset + NONCE_BYTES]
+                offset += NONCE_BYTES
+                value = record_data.get(field)
+                if isinstance(value, str) and value.startswith(PREFIX):
+                    continue
+                plaintext = (record_data.get(field) or "").encode()
+                aad = f"{username}:{field}".encode()
+                sealed = aead.encrypt(nonce, plaintext, aad)
+                sealed_record[field] = prefix + b64encode(nonce + sealed).decode()
+            sealed_records.append(sealed_record)
+        return sealed_records
+
+    def decrypt_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Decrypt the text fields of record dicts in place and return them"""
+        decrypt = self.decrypt
+        for record in records:
+            username = record["username"]
+            for field in ENCRYPTED_FIELDS:
+                record[field] = decrypt(record[field], f"{username}:{field}".encode())
+        return records
+
+
+@functools.lru_cache(maxsize=16)
+def _passphrase_cipher(key: str) -> FieldCipher:
+    from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+    # Passphrases are stretched with scrypt once per process, not per call
+    secret = Scrypt(salt=b"medichain-encrypt-data", length=32, n=2**15, r=8, p=1)
+    return FieldCipher(secret.derive(key.encode()))
+
+
+def encrypt_data(data: str, key: str) -> str:
+    """Encrypt a string under a passphrase"""
+    return _passphrase_cipher(key).encrypt(data, b"")
+
+
+def decrypt_data(encrypted_data: str, key: str) -> bytes:
+    """Decrypt a value from encrypt_data"""
+    return _passphrase_cipher(key).decrypt(encrypted_data, b"").encode()
+
+
+# magic, chunk size, nonce prefix, key id length; the key id follows
+ATTACHMENT_HEADER = struct.Struct(">4sI7sB")
+ATTACHMENT_MAGIC = b"MCA1"
+DEFAULT_CHUNK_SIZE = 64 * 1024
+TAG_BYTES = 16
+
+
+class AttachmentCipher:
+    """Streams files through AES-256-GCM in fixed-size authenticated chunks.
+
+    An encrypted attachment is a header followed by chunks of chunk_size
+    plaintext bytes plus a 16-byte tag. Chunk i is sealed with the nonce
+    prefix || i || last-chunk flag and the header as associated data, so
+    chunks cannot be reordered, dropped from the end or moved between files.
+    Memory use is one chunk whatever the file size, and any chunk can be
+    read on its own because its offset follows from its index.
+    """
+
+    def __init__(
+        self,
+        master_secret: bytes,
+        key_id: str = "1",
+        retired: Optional[Dict[str, bytes]] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        if len(master_secret) < MIN_SECRET_BYTES:
+            raise ValueError(f"Master secret must be {MIN_SECRET_BYTES}+ bytes")
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        self.key_id = key_id
+        self.chunk_size = chunk_size
+        secrets = {**(retired or {}), key_id: master_secret}
+        self._aeads = {
+            kid: AESGCM(derive_key(secret, kid, "attachments"))
+            for kid, secret in secrets.items()
+        }
+
+    @classmethod
+    def from_env(cls) -> Optional["AttachmentCipher"]:
+        secret = os.environ.get("MEDICHAIN_RECORD_KEY")
+        if not secret:
+            return None
+        key_id = os.environ.get("MEDICHAIN_RECORD_KEY_ID", "1")
+        return cls(base64.b64decode(secret), key_id)
+
+    @staticmethod
+    def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+        return prefix + index.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+    def encrypt_stream(
+        self, src: BinaryIO, dst: BinaryIO, associated_data: bytes = b""
+    ) -> int:
+        """Encrypt src into dst chunk by chunk; returns the plaintext size"""
+        key_id = self.key_id.encode()
+        prefix = os.urandom(7)
+        header = (
+            ATTACHMENT_HEADER.pack(
+                ATTACHMENT_MAGIC, self.chunk_size, prefix, len(key_id)
+            )
+            + key_id
+        )
+        aad = header + associated_data
+        aead = self._aeads[self.key_id]
+        dst.write(header)
+
+        size = 0
+        index = 0
+        chunk = src.read(self.chunk_size)
+        while True:
+            # Read one chunk ahead to know whether this one is the last
+            full = len(chunk) == self.chunk_size
+            following = src.read(self.chunk_size) if full else b""
+            last = not following
+            dst.write(aead.encrypt(self._nonce(prefix, index, last), chunk, aad))
+            size += len(chunk)
+            if last:
+                return size
+            if index == 0xFFFFFFFF:
+                raise ValueError("Attachment has too many chunks")
+            chunk = following
+            index += 1
+
+    def _open(
+        self, src: BinaryIO, associated_data: bytes
+    ) -> Tuple[Any, int, bytes, bytes]:
+        """Read the header; returns the chunk AEAD, chunk size, nonce prefix
+        and the associated data every chunk was sealed with"""
+        fixed = src.read(ATTACHMENT_HEADER.size)
+        if len(fixed) < ATTACHMENT_HEADER.size:
+            raise ValueError("Not an encrypted attachment")
+        magic, chunk_size, prefix, key_id_length = ATTACHMENT_HEADER.unpack(fixed)
+        if magic != ATTACHMENT_MAGIC:
+            raise ValueError("Not an encrypted attachment")
+        key_id = src.read(key_id_length)
+        aead = self._aeads.get(key_id.decode())
+        if aead is None:
+            raise ValueError(f"No key for attachment key id {key_id.decode()}")
+        return aead, chunk_size, prefix, fixed + key_id + associated_data
+
+    def iter_decrypt(
+        self, src: BinaryIO, associated_data: bytes = b""
+    ) -> Iterator[bytes]:
+        """Yield verified plaintext chunks of an encrypted stream in order.
+
+        Raises ValueError if any chunk fails authentication, including a
+        stream cut short at a chunk boundary.
+        """
+        aead, chunk_size, prefix, aad = self._open(src, associated_data)
+        index = 0
+        sealed = src.read(chunk_size + TAG_BYTES)
+        while True:
+            following = (
+                src.read(chunk_size + TAG_BYTES)
+                if len(sealed) == chunk_size + TAG_BYTES
+                else b""
+            )
+            last = not following
+            try:
+                yield aead.decrypt(self._nonce(prefix, index, last), sealed, aad)
+            except Exception:
+                raise ValueError(f"Attachment chunk {index} failed authentication")
+            if last:
+                return
+            sealed = following
+            index += 1
+
+    def decrypt_stream(
+        self, src: BinaryIO, dst: BinaryIO, associated_data: bytes = b""
+    ) -> int:
+        size = 0
+        for chunk in self.iter_decrypt(src, associated_data):
+            dst.write(chunk)
+            size += len(chunk)
+        return size
+
+    def encrypt_file(
+        self, src_path: str, dst_path: str, associated_data: bytes = b""
+    ) -> int:
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            return self.encrypt_stream(src, dst, associated_data)
+
+    def decrypt_file(
+        self, src_path: str, dst_path: str, associated_data: bytes = b""
+    ) -> int:
+        """Decrypt to dst_path, removing the partial output if it fails"""
+        try:
+            with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+                return self.decrypt_stream(src, dst, associated_data)
+        except ValueError:
+            os.remove(dst_path)
+            raise
+
+    def chunk_count(self, src: BinaryIO) -> int:
+        """Number of chunks in a seekable encrypted stream"""
+        src.seek(0)
+        _, chunk_size, _, header = self._open(src, b"")
+        body_size = src.seek(0, os.SEEK_END) - len(header)
+        # An empty attachment still has one (empty) final chunk
+        return max(1, -(-body_size // (chunk_size + TAG_BYTES)))
+
+    def plaintext_size(self, src: BinaryIO) -> int:
+        """Plaintext bytes in a seekable encrypted stream, from its length"""
+        count = self.chunk_count(src)
+        src.seek(0)
+        _, _, _, header = self._open(src, b"")
+        return src.seek(0, os.SEEK_END) - len(header) - count * TAG_BYTES
+
+    def read_chunk(
+        self, src: BinaryIO, index: int, associated_data: bytes = b""
+    ) -> bytes:
+        """Decrypt and verify only chunk index of a seekable encrypted stream"""
+        count = self.chunk_count(src)
+        if not 0 <= index < count:
+            raise IndexError(f"Attachment has no chunk {index}")
+        src.seek(0)
+        aead, chunk_size, prefix, aad = self._open(src, associated_data)
+        src.seek(index * (chunk_size + TAG_BYTES), os.SEEK_CUR)
+        sealed = src.read(chunk_size + TAG_BYTES)
+        try:
+            nonce = self._nonce(prefix, index, index == count - 1)
+            return aead.decrypt(nonce, sealed, aad)
+        except Exception:
+            raise ValueError(f"Attachment chunk {index} failed authentication")
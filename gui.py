@@ -1,11 +1,151 @@
+import queue
+import threading
 import time
 import tkinter as tk
 from tkinter import ttk, messagebox
+from typing import Optional
 from user_manager import UserManager
 from database import Database
 from blockchain import HealthcareBlockchain
 
 
+class RecordList:
+    """Treeview of medical records that loads off the Tk main loop.
+
+    A worker thread pulls records from a fetch callable and hands them over in
+    chunks through a bounded queue, which the main loop polls with root.after.
+    Rows are inserted in small slices within a per-tick time budget, and only
+    one window of rows at a time: the next window is read when the user
+    scrolls near the bottom, so the worker never runs far ahead of the view.
+    """
+
+    COLUMNS = ("Date", "Diagnosis", "Treatment", "Notes")
+
+    def __init__(
+        self,
+        root,
+        parent,
+        window_size: int = 500,
+        chunk_size: int = 100,
+        frame_budget_ms: float = 15,
+    ):
+        self.root = root
+        self.window_size = window_size
+        self.chunk_size = chunk_size
+        self.frame_budget = frame_budget_ms / 1000
+
+        self.tree = ttk.Treeview(parent, columns=self.COLUMNS, show="headings")
+        for column in self.COLUMNS:
+            self.tree.heading(column, text=column)
+        self.scrollbar = ttk.Scrollbar(
+            parent, orient="vertical", command=self.tree.yview
+        )
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.tree.bind("<Destroy>", lambda event: self.cancel())
+
+        self._chunks = None
+        self._cancel = None
+        self._pending = []
+        self._inserted = 0
+        self._limit = window_size
+        self._done = True
+
+    def load(self, fetch, on_error=None):
+        """Replace the rows with the records yielded by fetch() in a worker"""
+        self.cancel()
+        self.tree.delete(*self.tree.get_children())
+        self._chunks = queue.Queue(maxsize=2)
+        self._cancel = threading.Event()
+        self._pending = []
+        self._inserted = 0
+        self._limit = self.window_size
+        self._done = False
+        self._on_error = on_error
+        threading.Thread(
+            target=self._fetch_worker,
+            args=(fetch, self._chunks, self._cancel),
+            daemon=True,
+        ).start()
+        self.root.after(10, self._poll, self._chunks)
+
+    def cancel(self):
+        if self._cancel is not None:
+            self._cancel.set()
+
+    def _fetch_worker(self, fetch, chunks, cancel):
+        def put(item):
+            # Blocks while the view has enough rows, until cancelled
+            while not cancel.is_set():
+                try:
+                    chunks.put(item, timeout=0.2)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            chunk = []
+            for record in fetch():
+                chunk.append(record)
+                if len(chunk) >= self.chunk_size:
+                    if not put(chunk):
+                        return
+                    chunk = []
+            if chunk and not put(chunk):
+                return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    def _poll(self, chunks):
+        # A newer load() replaced this one, or the view has been destroyed
+        if chunks is not self._chunks or not self.tree.winfo_exists():
+            return
+        deadline = time.perf_counter() + self.frame_budget
+        while time.perf_counter() < deadline:
+            if not self._pending:
+                if self._done or self._inserted >= self._limit:
+                    return
+                try:
+                    item = chunks.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._done = True
+                    return
+                if isinstance(item, Exception):
+                    self._done = True
+                    if self._on_error:
+                        self._on_error(item)
+                    return
+                self._pending = item
+            record = self._pending.pop(0)
+            self.tree.insert(
+                "",
+                "end",
+                values=(
+                    record["date"],
+                    record["diagnosis"],
+                    record["treatment"],
+                    record["notes"],
+                ),
+            )
+            self._inserted += 1
+        self.root.after(1, self._poll, chunks)
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        near_bottom = float(last) > 0.9
+        if near_bottom and not self._done and self._inserted >= self._limit:
+            self._limit += self.window_size
+            self.root.after(1, self._poll, self._chunks)
+
+    def grid(self, row: int, column: int, **kwargs):
+        self.tree.grid(row=row, column=column, **kwargs)
+        scrollbar_column = column + kwargs.get("columnspan", 1)
+        self.scrollbar.grid(row=row, column=scrollbar_column, sticky="ns")
+
+
 class PatientPage:
     def __init__(self, root, blockchain):
         self.blockchain = blockchain
@@ -310,8 +450,21 @@ class HealthcareApp:
         for widget in self.root.winfo_children():
             widget.destroy()
 
+    def when_done(self, future, callback):
+        """Call callback with the future's result on the Tk thread once it
+        resolves, keeping slow password hashing off the main loop"""
+        if future.done():
+            callback(future.result())
+        else:
+            self.root.after(20, self.when_done, future, callback)
+
     def handle_login(self, username: str, password: str):
-        success, user_type = self.user_manager.authenticate_user(username, password)
+        self.when_done(
+            self.user_manager.auth.authenticate_async(username, password),
+            lambda result: self.finish_login(username, *result),
+        )
+
+    def finish_login(self, username: str, success: bool, user_type: str):
         if success:
             self.current_user = username
             self.current_user_type = user_type
@@ -327,8 +480,20 @@ class HealthcareApp:
             messagebox.showerror("Error", "All fields are required")
             return
 
-        if self.user_manager.register_user(username, password, user_type):
-            self.blockchain.add_user(username, user_type, password)
+        self.when_done(
+            self.user_manager.auth.hash_async(password),
+            lambda password_hash: self.finish_registration(
+                username, password, user_type, password_hash
+            ),
+        )
+
+    def finish_registration(
+        self, username: str, password: str, user_type: str, password_hash: Optional[str]
+    ):
+        if password_hash is None:
+            messagebox.showerror("Error", "The server is busy, please try again")
+        elif self.db.add_user(username, password_hash, user_type):
+            self.blockchain.add_user(username, user_type, password, password_hash)
             messagebox.showinfo("Success", "Registration successful!")
             self.setup_login_page()
         else:
@@ -368,44 +533,23 @@ class HealthcareApp:
             row=0, column=0, pady=20
         )
 
-        # Create Treeview
-        tree = ttk.Treeview(
-            frame, columns=("Date", "Diagnosis", "Treatment", "Notes"), show="headings"
+        # Records load in a worker thread and fill the list incrementally
+        record_list = RecordList(self.root, frame)
+        record_list.grid(row=1, column=0, pady=10)
+        record_list.load(
+            lambda: self.blockchain.iter_patient_records(
+                self.current_user, self.current_user
+            ),
+            on_error=self.show_load_error,
         )
 
-        tree.heading("Date", text="Date")
-        tree.heading("Diagnosis", text="Diagnosis")
-        tree.heading("Treatment", text="Treatment")
-        tree.heading("Notes", text="Notes")
-
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
-
-        # Get and display records
-        records = self.blockchain.get_patient_records(
-            self.current_user, self.current_user
-        )
-        for record in records:
-            medical_data = record
-            tree.insert(
-                "",
-                "end",
-                values=(
-                    medical_data["date"],
-                    medical_data["diagnosis"],
-                    medical_data["treatment"],
-                    medical_data["notes"],
-                ),
-            )
-
-        tree.grid(row=1, column=0, pady=10)
-        scrollbar.grid(row=1, column=1, sticky="ns")
-
         ttk.Button(frame, text="Back", command=self.setup_patient_dashboard).grid(
             row=2, column=0, pady=10
         )
 
+    def show_load_error(self, error: Exception):
+        messagebox.showerror("Error", f"Failed to load records: {str(error)}")
+
     def setup_manage_access_page(self):
         self.clear_window()
 
@@ -443,8 +587,8 @@ class HealthcareApp:
         permissions_frame = ttk.Frame(frame)
         permissions_frame.grid(row=4, column=0, columnspan=2, pady=10)
 
-        current_permissions = self.blockchain.access_permissions.get(
-            self.current_user, []
+        current_permissions = sorted(
+            self.blockchain.access_permissions.get(self.current_user, ())
         )
         for i, provider in enumerate(current_permissions):
             ttk.Label(permissions_frame, text=provider).grid(row=i, column=0, pady=2)
@@ -470,8 +614,7 @@ class HealthcareApp:
             messagebox.showerror("Error", "Failed to grant access")
 
     def revoke_access(self, provider: str):
-        if provider in self.blockchain.access_permissions[self.current_user]:
-            self.blockchain.access_permissions[self.current_user].remove(provider)
+        if self.blockchain.revoke_access(self.current_user, provider):
             messagebox.showinfo("Success", f"Access revoked for {provider}")
             self.setup_manage_access_page()
         else:
@@ -490,12 +633,7 @@ class HealthcareApp:
         # Patient selection
         ttk.Label(frame, text="Select Patient:").grid(row=1, column=0, pady=5)
         patient_var = tk.StringVar()
-        patients = [
-            user
-            for user, data in self.blockchain.users.items()
-            if data["type"] == "patient"
-            and self.blockchain.has_access(user, self.current_user)
-        ]
+        patients = self.blockchain.patients_visible_to(self.current_user)
         patient_combo = ttk.Combobox(frame, textvariable=patient_var, values=patients)
         patient_combo.grid(row=1, column=1, pady=5)
 
@@ -505,38 +643,19 @@ class HealthcareApp:
                 messagebox.showerror("Error", "Please select a patient")
                 return
 
-            records = self.blockchain.get_patient_records(patient, self.current_user)
-
             # Clear previous records if any
             for widget in frame.winfo_children():
-                if isinstance(widget, ttk.Treeview):
+                if isinstance(widget, (ttk.Treeview, ttk.Scrollbar)):
                     widget.destroy()
 
-            # Create Treeview for records
-            tree = ttk.Treeview(
-                frame,
-                columns=("Date", "Diagnosis", "Treatment", "Notes"),
-                show="headings",
+            record_list = RecordList(self.root, frame)
+            record_list.grid(row=3, column=0, columnspan=2, pady=10)
+            record_list.load(
+                lambda: self.blockchain.iter_patient_records(
+                    patient, self.current_user
+                ),
+                on_error=self.show_load_error,
             )
-            tree.heading("Date", text="Date")
-            tree.heading("Diagnosis", text="Diagnosis")
-            tree.heading("Treatment", text="Treatment")
-            tree.heading("Notes", text="Notes")
-
-            for record in records:
-                medical_data = record
-                tree.insert(
-                    "",
-                    "end",
-                    values=(
-                        medical_data["date"],
-                        medical_data["diagnosis"],
-                        medical_data["treatment"],
-                        medical_data["notes"],
-                    ),
-                )
-
-            tree.grid(row=3, column=0, columnspan=2, pady=10)
 
         ttk.Button(frame, text="View Records", command=show_patient_records).grid(
             row=2, column=0, columnspan=2, pady=10
@@ -558,11 +677,11 @@ class HealthcareApp:
 
         ttk.Label(frame, text="Select Patient:").grid(row=1, column=0, pady=5)
         patient_var = tk.StringVar()
+        visible = self.blockchain.permissions.patients_of(self.current_user)
         patients = [
             user
             for user, data in self.blockchain.users.items()
-            if data["type"] == "patient"
-            and not self.blockchain.has_access(user, self.current_user)
+            if data["type"] == "patient" and user not in visible
         ]
         patient_combo = ttk.Combobox(frame, textvariable=patient_var, values=patients)
         patient_combo.grid(row=1, column=1, pady=5)
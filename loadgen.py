@@ -0,0 +1,566 @@
+"""Synthetic population and workload generator for load testing.
+
+generate_population writes patients, providers, an access-grant graph and
+medical records straight through Database/HealthcareBlockchain at bulk
+speed: users and grants with one executemany each, records chained in
+batches like bulk_import. Activity is skewed with Zipf weights, so with
+skew=1.0 a few patients hold most records while most have a handful; a
+skew of 0 is uniform. The same seed always produces the same users, grants
+and record contents (block timestamps and hashes still differ per run).
+Every generated user shares one password, hashed once, so generation is
+not bound by the KDF.
+
+replay drives a seeded mix of reads, writes, grants and logins against a
+node, either in process or over HTTP (see service.py), at a fixed target
+rate. Operations are scheduled open loop and latency is measured from each
+operation's scheduled start, so a node that falls behind shows it in the
+percentiles instead of silently lowering the offered rate.
+
+Usage:
+    python loadgen.py populate [--db ...] [--patients 1000] [--providers 100]
+                               [--records 100000] [--skew 1.0] [--seed 42]
+    python loadgen.py replay [--db ...] [--url http://127.0.0.1:8080]
+                             [--rate 200] [--ops 10000] [--workers 1]
+                             [--mix read=0.75,write=0.2,grant=0.04,login=0.01]
+"""
+import argparse
+import bisect
+import http.client
+import itertools
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from auth import hash_password
+from blockchain import HealthcareBlockchain
+from bulk_import import chain_batch
+from user_manager import UserManager
+
+DIAGNOSES = [
+    "Hypertension",
+    "Type 2 diabetes",
+    "Asthma",
+    "Migraine",
+    "Iron deficiency anemia",
+    "Seasonal influenza",
+    "Osteoarthritis",
+    "Hypothyroidism",
+]
+TREATMENTS = [
+    "Lifestyle changes and follow-up",
+    "Metformin 500mg twice daily",
+    "Inhaled corticosteroid",
+    "Rest and fluids",
+    "Iron supplements",
+    "Physiotherapy",
+    "Levothyroxine 50mcg daily",
+]
+NOTES = ["", "Stable", "Review in 3 months", "Referred to specialist"]
+
+DEFAULT_MIX = {"read": 0.75, "write": 0.2, "grant": 0.04, "login": 0.01}
+DEFAULT_PASSWORD = "password"
+
+
+def zipf_cum_weights(count: int, skew: float) -> List[float]:
+    """Cumulative weights for rank i (0-based) proportional to 1/(i+1)^skew"""
+    return list(
+        itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(count))
+    )
+
+
+def _pick(rng: random.Random, items: List[str], cum_weights: List[float]) -> str:
+    position = bisect.bisect_right(cum_weights, rng.random() * cum_weights[-1])
+    return items[min(position, len(items) - 1)]
+
+
+def synthetic_record(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "diagnosis": rng.choice(DIAGNOSES),
+        "treatment": rng.choice(TREATMENTS),
+        "notes": rng.choice(NOTES),
+        "date": (
+            f"{rng.randint(2015, 2024)}-{rng.randint(1, 12):02}-"
+            f"{rng.randint(1, 28):02} {rng.randint(8, 17):02}:00:00"
+        ),
+    }
+
+
+def generate_population(
+    blockchain: HealthcareBlockchain,
+    patients: int = 1000,
+    providers: int = 100,
+    records: int = 100000,
+    grants_per_patient: int = 2,
+    skew: float = 1.0,
+    seed: int = 42,
+    password: str = DEFAULT_PASSWORD,
+    batch_size: int = 10000,
+) -> Dict[str, Any]:
+    """Write a synthetic population and return its users, grants and timings.
+
+    Patients are named patient0000000, patient0000001, ... in order of
+    activity, so the first are the heavy ones. Each patient grants access to
+    between 0 and 2 * grants_per_patient providers, drawn with the same skew
+    so a few providers see many patients. Raises ValueError if a generated
+    username is already taken.
+    """
+    rng = random.Random(seed)
+    db = blockchain.db
+    started = time.perf_counter()
+
+    patient_names = [f"patient{i:07d}" for i in range(patients)]
+    # Every tenth provider is a hospital
+    provider_names = [
+        f"{'hospital' if i % 10 == 9 else 'doctor'}{i:06d}" for i in range(providers)
+    ]
+    password_hash = hash_password(password)
+    users = [(name, password_hash, "patient") for name in patient_names] + [
+        (name, password_hash, name.rstrip("0123456789")) for name in provider_names
+    ]
+    if not db.add_users(users):
+        raise ValueError("Generated usernames are already taken")
+
+    provider_weights = zipf_cum_weights(providers, skew)
+    grants: Dict[str, Set[str]] = {}
+    for patient in patient_names:
+        wanted = min(rng.randint(0, 2 * grants_per_patient), providers)
+        chosen: Set[str] = set()
+        while len(chosen) < wanted:
+            chosen.add(_pick(rng, provider_names, provider_weights))
+        grants[patient] = chosen
+    if not db.add_access_permissions(
+        [
+            (patient, provider)
+            for patient in patient_names
+            for provider in sorted(grants[patient])
+        ]
+    ):
+        raise ValueError("Failed to save access grants")
+    blockchain.reload_users()
+    users_seconds = time.perf_counter() - started
+
+    patient_weights = zipf_cum_weights(patients, skew)
+    latest = db.get_latest_block()
+    next_index = latest["index"] + 1
+    previous_hash = latest["hash"]
+    written = 0
+    while written < records:
+        batch = [
+            (_pick(rng, patient_names, patient_weights), synthetic_record(rng))
+            for _ in range(min(batch_size, records - written))
+        ]
+        blocks, record_rows, errors = chain_batch(
+            blockchain, batch, next_index, previous_hash
+        )
+        if errors:
+            raise ValueError(f"Generated record rejected: {errors[0][1]}")
+        with db.transaction():
+            if not db.add_blocks(blocks):
+                raise ValueError("Failed to save blocks to database")
+            if not db.insert_medical_records(record_rows):
+                raise ValueError("Failed to save medical records to database")
+        next_index = blocks[-1].index + 1
+        previous_hash = blocks[-1].hash
+        written += len(blocks)
+    # The chain and its indexes were extended behind the in-memory view
+    blockchain.reload_chain()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "patients": patient_names,
+        "providers": provider_names,
+        "grants": grants,
+        "records": written,
+        "users_seconds": users_seconds,
+        "seconds": elapsed,
+        "records_per_second": written / (elapsed - users_seconds),
+    }
+
+
+def discover_population(blockchain: HealthcareBlockchain) -> Dict[str, Any]:
+    """Rebuild the users and grants generate_population returns from a node's
+    database, for replaying against a population made earlier"""
+    patients = sorted(
+        name for name, user in blockchain.users.items() if user["type"] == "patient"
+    )
+    providers = sorted(
+        name for name, user in blockchain.users.items() if user["type"] != "patient"
+    )
+    grants = {
+        patient: set(blockchain.access_permissions.get(patient, ()))
+        for patient in patients
+    }
+    return {"patients": patients, "providers": providers, "grants": grants}
+
+
+def generate_workload(
+    population: Dict[str, Any],
+    count: int,
+    mix: Optional[Dict[str, float]] = None,
+    skew: float = 1.0,
+    seed: int = 7,
+    password: str = DEFAULT_PASSWORD,
+) -> Iterator[Tuple[str, tuple]]:
+    """Yield count (operation, args) pairs; the same seed yields the same run.
+
+    Patients are chosen with the population's skew. Reads come from one of
+    the patient's providers, or the patient when nobody was granted access.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    operations = list(mix)
+    operation_weights = list(itertools.accumulate(mix[name] for name in operations))
+    patients = population["patients"]
+    providers = population["providers"]
+    grants = population["grants"]
+    patient_weights = zipf_cum_weights(len(patients), skew)
+
+    for _ in range(count):
+        operation = _pick(rng, operations, operation_weights)
+        patient = _pick(rng, patients, patient_weights)
+        if operation == "read":
+            granted = sorted(grants.get(patient, ()))
+            yield operation, (patient, rng.choice(granted) if granted else patient)
+        elif operation == "write":
+            yield operation, (patient, synthetic_record(rng))
+        elif operation == "grant":
+            yield operation, (patient, rng.choice(providers))
+        elif operation == "login":
+            yield operation, (patient, password)
+        else:
+            raise ValueError(f"Unknown operation: {operation}")
+
+
+class LocalTarget:
+    """Runs workload operations on an in-process HealthcareBlockchain.
+
+    Writes are serialized like the service's single write executor; reads
+    may run concurrently on the database's reader pool.
+    """
+
+    def __init__(
+        self, blockchain: HealthcareBlockchain, users: Optional[UserManager] = None
+    ):
+        self.blockchain = blockchain
+        self.users = users or UserManager(blockchain.db)
+        self._write_lock = threading.Lock()
+
+    def read(self, patient_id: str, requester_id: str) -> bool:
+        self.blockchain.get_patient_records(patient_id, requester_id)
+        return True
+
+    def write(self, patient_id: str, record: Dict[str, Any]) -> bool:
+        with self._write_lock:
+            return self.blockchain.add_medical_record(patient_id, record)
+
+    def grant(self, patient_id: str, provider_id: str) -> bool:
+        with self._write_lock:
+            return self.blockchain.grant_access(patient_id, provider_id)
+
+    def login(self, username: str, password: str) -> bool:
+        return self.users.authenticate_user(username, password)[0]
+
+    def close(self):
+        self.users.auth.close()
+
+
+class HttpTarget:
+    """Runs workload operations against service.py over keep-alive HTTP,
+    with one connection per worker thread.
+
+    Each operation acts as its user through a session token, logged in with
+    password on first use and again if the session expires, so a user's first
+    operation also pays for a password hash.
+    """
+
+    def __init__(
+        self, url: str, password: str = DEFAULT_PASSWORD, timeout: float = 30.0
+    ):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[http.client.HTTPConnection] = []
+        self._tokens: Dict[str, str] = {}
+        self._tokens_lock = threading.Lock()
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[Dict[str, Any]] = None,
+        token: Optional[str] = None,
+    ) -> Tuple[int, Dict[str, Any]]:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+            self._local.conn = conn
+            self._connections.append(conn)
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        if token is not None:
+            headers["Authorization"] = f"Bearer {token}"
+        try:
+            conn.request(method, path, body=data, headers=headers)
+            response = conn.getresponse()
+            payload = json.loads(response.read() or b"{}")
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request
+            conn.close()
+            self._local.conn = None
+            raise
+        return response.status, payload
+
+    def _session(self, username: str, renew: bool = False) -> Optional[str]:
+        with self._tokens_lock:
+            token = None if renew else self._tokens.get(username)
+        if token is None:
+            status, payload = self._request(
+                "POST", "/login", {"username": username, "password": self.password}
+            )
+            token = payload.get("token") if status == 200 else None
+            if token is not None:
+                with self._tokens_lock:
+                    self._tokens[username] = token
+        return token
+
+    def _request_as(
+        self,
+        username: str,
+        method: str,
+        path: str,
+        body: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[int, Dict[str, Any]]:
+        token = self._session(username)
+        if token is None:
+            return 401, {}
+        status, payload = self._request(method, path, body, token)
+        if status == 401:
+            token = self._session(username, renew=True)
+            if token is not None:
+                status, payload = self._request(method, path, body, token)
+        return status, payload
+
+    def read(self, patient_id: str, requester_id: str) -> bool:
+        query = urlencode({"patient_id": patient_id, "limit": 100})
+        status, _ = self._request_as(requester_id, "GET", f"/records?{query}")
+        return status == 200
+
+    def write(self, patient_id: str, record: Dict[str, Any]) -> bool:
+        status, payload = self._request_as(
+            patient_id, "POST", "/records", {"patient_id": patient_id, "record": record}
+        )
+        return status == 200 and payload.get("ok", False)
+
+    def grant(self, patient_id: str, provider_id: str) -> bool:
+        status, payload = self._request_as(
+            patient_id, "POST", "/access/grant", {"provider_id": provider_id}
+        )
+        return status == 200 and payload.get("ok", False)
+
+    def login(self, username: str, password: str) -> bool:
+        status, payload = self._request(
+            "POST", "/login", {"username": username, "password": password}
+        )
+        return status == 200 and payload.get("ok", False)
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, Any]:
+    """Latency percentiles (nearest rank) of timed samples. Throughput is left
+    to the caller, which knows the wall-clock time the samples spanned"""
+    ordered = sorted(seconds)
+    count = len(ordered)
+    if not count:
+        return {"samples": 0}
+
+    def percentile(p: float) -> float:
+        return ordered[min(count - 1, int(p / 100 * count))] * 1000
+
+    total = sum(ordered)
+    return {
+        "samples": count,
+        "mean_ms": total / count * 1000,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def replay(
+    target, workload: Iterator[Tuple[str, tuple]], rate: float, workers: int = 1
+) -> Dict[str, Any]:
+    """Issue workload operations at rate per second and report the outcome.
+
+    Operation i is due at start + i / rate whatever happened before it. With
+    one worker operations run inline, so a slow one delays those after it;
+    more workers let them overlap.
+    """
+    latencies: Dict[str, List[float]] = {}
+    failed: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def run(operation: str, args: tuple, due: float):
+        try:
+            ok = getattr(target, operation)(*args)
+        except Exception as e:
+            ok = None
+            with lock:
+                if not errors:
+                    print(f"Error running {operation}: {str(e)}")
+                errors[operation] = errors.get(operation, 0) + 1
+        finished = time.perf_counter()
+        with lock:
+            latencies.setdefault(operation, []).append(finished - due)
+            if ok is False:
+                failed[operation] = failed.get(operation, 0) + 1
+
+    pool = ThreadPoolExecutor(workers) if workers > 1 else None
+    started = time.perf_counter()
+    issued = 0
+    for issued, (operation, args) in enumerate(workload, start=1):
+        due = started + (issued - 1) / rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        if pool is None:
+            run(operation, args, due)
+        else:
+            pool.submit(run, operation, args, due)
+    if pool is not None:
+        pool.shutdown()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [s for samples in latencies.values() for s in samples]
+    return {
+        "operations": issued,
+        "seconds": elapsed,
+        "target_rate": rate,
+        "achieved_rate": issued / elapsed if elapsed else 0.0,
+        "failed": failed,
+        "errors": errors,
+        "latency": latency_summary(all_latencies),
+        "by_operation": {
+            operation: latency_summary(samples)
+            for operation, samples in sorted(latencies.items())
+        },
+    }
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Parse "read=0.75,write=0.2" into operation weights"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic population and load")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    populate = commands.add_parser("populate", help="write a synthetic population")
+    populate.add_argument("--db", default="healthcare_blockchain.db")
+    populate.add_argument("--patients", type=int, default=1000)
+    populate.add_argument("--providers", type=int, default=100)
+    populate.add_argument("--records", type=int, default=100000)
+    populate.add_argument("--grants", type=int, default=2)
+    populate.add_argument("--skew", type=float, default=1.0)
+    populate.add_argument("--seed", type=int, default=42)
+    populate.add_argument("--password", default=DEFAULT_PASSWORD)
+    populate.add_argument("--block-store", choices=["sqlite", "log"])
+
+    run = commands.add_parser("replay", help="replay a mixed workload")
+    run.add_argument("--db", default="healthcare_blockchain.db")
+    run.add_argument("--url", help="service.py node to target instead of --db")
+    run.add_argument("--rate", type=float, default=200.0)
+    run.add_argument("--ops", type=int, default=10000)
+    run.add_argument("--workers", type=int, default=1)
+    run.add_argument(
+        "--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items())
+    )
+    run.add_argument("--skew", type=float, default=1.0)
+    run.add_argument("--seed", type=int, default=7)
+    run.add_argument("--password", default=DEFAULT_PASSWORD)
+    run.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.command == "populate":
+        blockchain = HealthcareBlockchain(args.db, block_store=args.block_store)
+        try:
+            stats = generate_population(
+                blockchain,
+                args.patients,
+                args.providers,
+                args.records,
+                args.grants,
+                args.skew,
+                args.seed,
+                args.password,
+            )
+        except ValueError as e:
+            print(f"Error generating population: {str(e)}")
+            return
+        print(
+            f"Wrote {len(stats['patients'])} patients, "
+            f"{len(stats['providers'])} providers, "
+            f"{sum(len(g) for g in stats['grants'].values())} grants and "
+            f"{stats['records']} records in {stats['seconds']:.1f}s "
+            f"({stats['records_per_second']:.0f} rec/s)"
+        )
+        return
+
+    # The node's database tells the workload who exists and who may read what
+    blockchain = HealthcareBlockchain(args.db)
+    population = discover_population(blockchain)
+    if not population["patients"]:
+        print("No patients found; run loadgen.py populate first")
+        return
+    target = (
+        HttpTarget(args.url, args.password) if args.url else LocalTarget(blockchain)
+    )
+    workload = generate_workload(
+        population, args.ops, parse_mix(args.mix), args.skew, args.seed, args.password
+    )
+    try:
+        results = replay(target, workload, args.rate, args.workers)
+    finally:
+        target.close()
+
+    print(
+        f"{results['operations']} operations in {results['seconds']:.1f}s: "
+        f"{results['achieved_rate']:.1f}/s of {args.rate:.1f}/s target, "
+        f"{sum(results['failed'].values())} failed, "
+        f"{sum(results['errors'].values())} errors"
+    )
+    print(f"{'operation':<10} {'count':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for operation, stats in [("all", results["latency"])] + list(
+        results["by_operation"].items()
+    ):
+        if not stats["samples"]:
+            continue
+        print(
+            f"{operation:<10} {stats['samples']:>8} {stats['p50_ms']:>9.2f} "
+            f"{stats['p90_ms']:>9.2f} {stats['p99_ms']:>9.2f}"
+        )
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""Counters, latency histograms and in-flight gauges for the hot paths.
+
+Instrumented calls (see instrumented and instrument_class) record into
+three families labelled by operation:
+
+    medichain_operation_seconds         histogram of call latency
+    medichain_operation_failures_total  calls that raised (or returned False,
+                                        where the operation opts in)
+    medichain_operation_in_flight       calls currently running
+
+Recording is off unless MEDICHAIN_METRICS is set to a non-zero value or
+enable() is called; while off, an instrumented call costs one global check
+on top of the call itself. REGISTRY exports everything as Prometheus text
+or as a JSON snapshot with estimated percentiles.
+"""
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+# Latency bucket bounds in seconds, 10us to 10s
+DEFAULT_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+_enabled = os.environ.get("MEDICHAIN_METRICS", "") not in ("", "0")
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Value:
+    """One counter or gauge series"""
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def reset(self):
+        self.set(0.0)
+
+
+class _Buckets:
+    """One histogram series"""
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # counts[i] holds observations in (bounds[i - 1], bounds[i]]; the last
+        # slot holds those above every bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        position = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+            self.count += 1
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.sum = 0.0
+            self.count = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by interpolating inside its bucket"""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for position, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if position == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[position - 1] if position else 0.0
+                upper = self.bounds[position]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+class Metric:
+    """A named family of series, one per combination of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_series(self):
+        return _Value()
+
+    def labels(self, *values: str):
+        """The series for these label values, created on first use"""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}")
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def series(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return sorted(self._series.items())
+
+    def reset(self):
+        # Zeroed in place: instrumented functions hold on to their series
+        for _, series in self.series():
+            series.reset()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _Buckets(self.buckets)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"{metric.name} is already a {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def reset(self):
+        """Zero every series, keeping the registered families"""
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def prometheus_text(self) -> str:
+        """Render every family in the Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for values, series in metric.series():
+                labels = _format_labels(metric.label_names, values)
+                if not isinstance(metric, Histogram):
+                    lines.append(f"{name}{labels} {_format_value(series.value)}")
+                    continue
+                names = metric.label_names + ("le",)
+                cumulative = 0
+                bounds = metric.buckets + (float("inf"),)
+                for bound, count in zip(bounds, series.counts):
+                    cumulative += count
+                    le = _format_labels(names, values + (_format_value(bound),))
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                lines.append(f"{name}_sum{labels} {_format_value(series.sum)}")
+                lines.append(f"{name}_count{labels} {series.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Every series as JSON-ready data, plus a per-operation summary"""
+        families = {}
+        for name, metric in sorted(self._metrics.items()):
+            entries = []
+            for values, series in metric.series():
+                entry: Dict[str, Any] = {
+                    "labels": dict(zip(metric.label_names, values))
+                }
+                if isinstance(metric, Histogram):
+                    entry.update(
+                        count=series.count,
+                        sum=series.sum,
+                        buckets=dict(
+                            zip(
+                                [_format_value(b) for b in metric.buckets] + ["+Inf"],
+                                series.counts,
+                            )
+                        ),
+                    )
+                else:
+                    entry["value"] = series.value
+                entries.append(entry)
+            families[name] = {
+                "type": metric.kind,
+                "help": metric.help,
+                "series": entries,
+            }
+        return {
+            "enabled": _enabled,
+            "operations": operation_summary(),
+            "metrics": families,
+        }
+
+
+REGISTRY = Registry()
+OPERATION_SECONDS = REGISTRY.histogram(
+    "medichain_operation_seconds", "Latency of instrumented calls", ("operation",)
+)
+OPERATION_FAILURES = REGISTRY.counter(
+    "medichain_operation_failures_total",
+    "Instrumented calls that raised or reported failure",
+    ("operation",),
+)
+OPERATION_IN_FLIGHT = REGISTRY.gauge(
+    "medichain_operation_in_flight",
+    "Instrumented calls currently running",
+    ("operation",),
+)
+
+
+def operation_summary() -> Dict[str, Dict[str, Any]]:
+    """Calls, failures, in-flight count and latency estimates per operation"""
+    failures = {values[0]: s.value for values, s in OPERATION_FAILURES.series()}
+    in_flight = {values[0]: s.value for values, s in OPERATION_IN_FLIGHT.series()}
+    summary = {}
+    for (operation,), series in OPERATION_SECONDS.series():
+        if not series.count:
+            continue
+        summary[operation] = {
+            "calls": series.count,
+            "failures": int(failures.get(operation, 0)),
+            "in_flight": int(in_flight.get(operation, 0)),
+            "mean_ms": series.sum / series.count * 1000,
+            "p50_ms": series.quantile(0.5) * 1000,
+            "p90_ms": series.quantile(0.9) * 1000,
+            "p99_ms": series.quantile(0.99) * 1000,
+        }
+    return summary
+
+
+def instrumented(operation: str, false_is_failure: bool = False):
+    """Decorate a function to record its latency, failures and concurrency
+    under operation while metrics are enabled.
+
+    Only exceptions count as failures unless false_is_failure is set, since
+    many calls (permission checks, duplicate inserts) return False as an
+    ordinary answer."""
+
+    def decorate(fn):
+        seconds = OPERATION_SECONDS.labels(operation)
+        failures = OPERATION_FAILURES.labels(operation)
+        in_flight = OPERATION_IN_FLIGHT.labels(operation)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            in_flight.inc()
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                failures.inc()
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - started)
+                in_flight.dec()
+            if false_is_failure and result is False:
+                failures.inc()
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def instrument_class(
+    prefix: str, exclude: Iterable[str] = (), false_is_failure: Iterable[str] = ()
+):
+    """Class decorator applying instrumented("<prefix>.<method>") to every
+    public method. Generators and context managers are skipped, since timing
+    the call would only time their creation. Methods named in
+    false_is_failure also count a False return as a failure."""
+    skipped = set(exclude)
+    reports_failure = set(false_is_failure)
+
+    def decorate(cls):
+        for name, value in list(vars(cls).items()):
+            if (
+                name.startswith("_")
+                or name in skipped
+                or not inspect.isfunction(value)
+                or inspect.isgeneratorfunction(value)
+            ):
+                continue
+            wrapped = instrumented(f"{prefix}.{name}", name in reports_failure)
+            setattr(cls, name, wrapped(value))
+        return cls
+
+    return decorate
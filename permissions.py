@@ -0,0 +1,73 @@
+import threading
+from typing import Dict, Set
+
+from database import Database
+
+
+class PermissionStore:
+    """In-memory view of the access_permissions table, indexed both ways.
+
+    by_patient maps a patient to the providers they granted access to and
+    by_provider maps a provider to the patients they can see, so either side
+    is a single set lookup. Every change is written to the database first and
+    only then applied to both indexes.
+    """
+
+    def __init__(self, database: Database):
+        self.db = database
+        self.by_patient: Dict[str, Set[str]] = {}
+        self.by_provider: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def add_patient(self, patient_id: str):
+        self.by_patient.setdefault(patient_id, set())
+
+    def load(self):
+        """Rebuild both indexes from the access_permissions table"""
+        with self._lock:
+            for providers in self.by_patient.values():
+                providers.clear()
+            self.by_provider.clear()
+            for patient_id, provider_id in self.db.get_access_permissions():
+                # Grants for users that are not known patients are ignored
+                if patient_id in self.by_patient:
+                    self._add(patient_id, provider_id)
+
+    def _add(self, patient_id: str, provider_id: str):
+        self.by_patient[patient_id].add(provider_id)
+        self.by_provider.setdefault(provider_id, set()).add(patient_id)
+
+    def grant(self, patient_id: str, provider_id: str) -> bool:
+        with self._lock:
+            if patient_id not in self.by_patient:
+                return False
+            if provider_id in self.by_patient[patient_id]:
+                return False
+            # Add to database first
+            if not self.db.add_access_permission(patient_id, provider_id):
+                return False
+            self._add(patient_id, provider_id)
+            return True
+
+    def revoke(self, patient_id: str, provider_id: str) -> bool:
+        with self._lock:
+            if provider_id not in self.by_patient.get(patient_id, ()):
+                return False
+            if not self.db.remove_access_permission(patient_id, provider_id):
+                return False
+            self.by_patient[patient_id].discard(provider_id)
+            patients = self.by_provider.get(provider_id)
+            if patients is not None:
+                patients.discard(patient_id)
+                if not patients:
+                    del self.by_provider[provider_id]
+            return True
+
+    def has_access(self, patient_id: str, provider_id: str) -> bool:
+        return provider_id in self.by_patient.get(patient_id, ())
+
+    def providers_of(self, patient_id: str) -> Set[str]:
+        return set(self.by_patient.get(patient_id, ()))
+
+    def patients_of(self, provider_id: str) -> Set[str]:
+        return set(self.by_provider.get(provider_id, ()))
@@ -0,0 +1,359 @@
+"""Opt-in slow-query log and query-plan capture for the SQLite layer.
+
+With diagnostics on (Database(diagnostics=...) or MEDICHAIN_SQL_DIAGNOSTICS
+set to a threshold in milliseconds), every connection of the pool is opened
+as a DiagnosticConnection, which:
+
+- times each statement from execute to its last fetch and aggregates
+  calls, time and slow executions per statement shape, which is the SQL
+  with literals and parameter lists collapsed to "?";
+- logs each execution over the threshold with its parameters redacted to
+  their types, printed or appended as JSON lines to log_path;
+- runs EXPLAIN QUERY PLAN the first time a shape is seen and flags plans
+  that scan a whole table;
+- counts SQLite VM work per shape through the progress handler, and
+  through the trace callback records statements that bypass cursors, such
+  as the implicit BEGIN/COMMIT of the sqlite3 module.
+
+SQLite's trace and progress callbacks carry no durations, so timing is
+taken around the cursor calls themselves. The trace callback receives SQL
+with bound values inlined; it is only ever reduced to its shape.
+"""
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"[xX]'[0-9a-fA-F]*'|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAMETER_LISTS = re.compile(r"\?(?:\s*,\s*\?)+")
+_PLANNED = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+
+@functools.lru_cache(maxsize=4096)
+def statement_shape(sql: str) -> str:
+    """Normalize SQL so executions that differ only in values group together"""
+    shape = _WHITESPACE.sub(" ", sql).strip()
+    shape = _LITERALS.sub("?", shape)
+    return _PARAMETER_LISTS.sub("?, ...", shape)
+
+
+def redact(parameters: Any) -> Any:
+    """Describe bound parameters by type and size, never by value"""
+
+    def describe(value: Any) -> str:
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}({len(value)})"
+        return type(value).__name__
+
+    if isinstance(parameters, dict):
+        return {name: describe(value) for name, value in parameters.items()}
+    return [describe(value) for value in parameters or ()]
+
+
+def full_scans(shape: str, plan: Optional[List[str]]) -> List[str]:
+    """The plan steps that read every row of a table.
+
+    A scan in index order under LIMIT stops early (e.g. the latest block),
+    so it only counts when the rows are sorted first in a temp b-tree.
+    """
+    if not plan:
+        return []
+    steps = [line.strip() for line in plan]
+    if " LIMIT " in shape.upper() and not any("TEMP B-TREE" in s for s in steps):
+        return []
+    return [
+        step
+        for step in steps
+        if step.startswith("SCAN")
+        and "USING" not in step
+        and "VIRTUAL TABLE" not in step
+    ]
+
+
+class QueryDiagnostics:
+    """Aggregates statement timings, slow executions and query plans"""
+
+    def __init__(
+        self,
+        threshold_ms: float = 100.0,
+        log_path: Optional[str] = None,
+        progress_steps: int = 1000,
+    ):
+        self.threshold = threshold_ms / 1000
+        self.log_path = log_path
+        # The progress handler fires every progress_steps VM instructions
+        self.progress_steps = progress_steps
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self.plans: Dict[str, Optional[List[str]]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["QueryDiagnostics"]:
+        threshold = os.environ.get("MEDICHAIN_SQL_DIAGNOSTICS")
+        if not threshold:
+            return None
+        return cls(float(threshold), os.environ.get("MEDICHAIN_SQL_LOG") or None)
+
+    def _entry(self, shape: str) -> Dict[str, Any]:
+        entry = self.stats.get(shape)
+        if entry is None:
+            entry = self.stats[shape] = {
+                "calls": 0,
+                "untimed_calls": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "slow": 0,
+                "vm_steps": 0,
+            }
+        return entry
+
+    def needs_plan(self, shape: str) -> bool:
+        return shape not in self.plans and shape.upper().startswith(_PLANNED)
+
+    def capture_plan(self, conn: sqlite3.Connection, sql: str, parameters: Any):
+        """Record EXPLAIN QUERY PLAN for the first execution of a shape"""
+        shape = statement_shape(sql)
+        with self._lock:
+            if shape in self.plans:
+                return
+            self.plans[shape] = None
+        try:
+            rows = sqlite3.Cursor(conn).execute(
+                "EXPLAIN QUERY PLAN " + sql, parameters
+            )
+            depth = {0: -1}
+            plan = []
+            for node, parent, _, detail in rows:
+                depth[node] = depth.get(parent, -1) + 1
+                plan.append("  " * depth[node] + detail)
+        except sqlite3.Error:
+            return
+        with self._lock:
+            self.plans[shape] = plan
+        scans = full_scans(shape, plan)
+        if scans:
+            print(f"Query plan scans a full table ({', '.join(scans)}): {shape}")
+
+    def record(self, shape: str, seconds: float, ticks: int, parameters: Any):
+        with self._lock:
+            entry = self._entry(shape)
+            entry["calls"] += 1
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["vm_steps"] += ticks * self.progress_steps
+            slow = seconds >= self.threshold
+            if slow:
+                entry["slow"] += 1
+        if slow:
+            self._log_slow(shape, seconds, parameters)
+
+    def record_untimed(self, shape: str):
+        """Count a statement seen only through the trace callback"""
+        with self._lock:
+            self._entry(shape)["untimed_calls"] += 1
+
+    def _log_slow(self, shape: str, seconds: float, parameters: Any):
+        entry = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "ms": round(seconds * 1000, 3),
+            "statement": shape,
+            "parameters": redact(parameters),
+        }
+        if self.log_path is None:
+            print(
+                f"Slow query ({entry['ms']:.1f} ms): {shape} "
+                f"parameters={entry['parameters']}"
+            )
+            return
+        with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def report(self, limit: Optional[int] = 20) -> List[Dict[str, Any]]:
+        """Statement shapes by total time, with their plans"""
+        with self._lock:
+            items = [(shape, dict(entry)) for shape, entry in self.stats.items()]
+            plans = dict(self.plans)
+        items.sort(key=lambda item: item[1]["total_seconds"], reverse=True)
+        rows = []
+        for shape, entry in items[:limit]:
+            plan = plans.get(shape)
+            rows.append(
+                {
+                    "statement": shape,
+                    "calls": entry["calls"],
+                    "untimed_calls": entry["untimed_calls"],
+                    "total_ms": entry["total_seconds"] * 1000,
+                    "mean_ms": (
+                        entry["total_seconds"] / entry["calls"] * 1000
+                        if entry["calls"]
+                        else None
+                    ),
+                    "max_ms": entry["max_seconds"] * 1000,
+                    "slow": entry["slow"],
+                    "vm_steps": entry["vm_steps"],
+                    "full_scan": bool(full_scans(shape, plan)),
+                    "plan": plan,
+                }
+            )
+        return rows
+
+    def print_report(self, limit: int = 10):
+        rows = self.report(limit)
+        if not rows:
+            return
+        print(f"{'total ms':>10} {'calls':>8} {'mean ms':>9} {'slow':>5}  statement")
+        for row in rows:
+            mean = f"{row['mean_ms']:.3f}" if row["mean_ms"] is not None else "-"
+            scan = " [full scan]" if row["full_scan"] else ""
+            print(
+                f"{row['total_ms']:>10.1f} {row['calls']:>8} {mean:>9} "
+                f"{row['slow']:>5}  {row['statement'][:100]}{scan}"
+            )
+
+    def connect(self, *args, **kwargs) -> "DiagnosticConnection":
+        """sqlite3.connect, returning a connection that reports to self"""
+        conn = sqlite3.connect(*args, factory=DiagnosticConnection, **kwargs)
+        conn.attach(self)
+        return conn
+
+
+class DiagnosticCursor(sqlite3.Cursor):
+    """Cursor that times a statement from execute through its last fetch"""
+
+    def _begin(self, sql: str, parameters: Any):
+        self._finish()
+        conn = self.connection
+        diagnostics = conn.diagnostics
+        self._shape = statement_shape(sql)
+        self._parameters = parameters
+        self._seconds = 0.0
+        self._ticks = 0
+        if diagnostics.needs_plan(self._shape):
+            conn.in_diagnostics = True
+            try:
+                diagnostics.capture_plan(conn, sql, parameters)
+            finally:
+                conn.in_diagnostics = False
+
+    def _timed(self, call, *args):
+        conn = self.connection
+        ticks = conn.ticks
+        conn.in_cursor = True
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            self._seconds += time.perf_counter() - started
+            self._ticks += conn.ticks - ticks
+            conn.in_cursor = False
+
+    def _finish(self):
+        shape = getattr(self, "_shape", None)
+        if shape is not None:
+            self._shape = None
+            self.connection.diagnostics.record(
+                shape, self._seconds, self._ticks, self._parameters
+            )
+
+    def execute(self, sql: str, parameters: Any = ()):
+        self._begin(sql, parameters)
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            # Nothing to fetch, so the statement is complete
+            self._finish()
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters):
+        rows = list(seq_of_parameters)
+        # Plans and the slow log use the first row's parameters
+        self._begin(sql, rows[0] if rows else ())
+        try:
+            self._timed(super().executemany, sql, rows)
+        finally:
+            self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        rows = self._timed(super().fetchmany, size or self.arraysize)
+        if len(rows) < (size or self.arraysize):
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        try:
+            return self._timed(super().fetchall)
+        finally:
+            self._finish()
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Lookups such as get_user fetch one row and drop the cursor
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class DiagnosticConnection(sqlite3.Connection):
+    """Connection whose cursors report to a QueryDiagnostics (see attach)"""
+
+    def attach(self, diagnostics: QueryDiagnostics):
+        self.diagnostics = diagnostics
+        self.ticks = 0
+        self.in_cursor = False
+        self.in_diagnostics = False
+        self.set_progress_handler(self._progress, diagnostics.progress_steps)
+        self.set_trace_callback(self._trace)
+
+    def _progress(self) -> int:
+        self.ticks += 1
+        return 0  # non-zero would abort the statement
+
+    def _trace(self, sql: str):
+        # Statements run through a cursor are recorded by the cursor; trigger
+        # bodies are traced as "-- ..." comments
+        if self.in_diagnostics or (self.in_cursor and not sql.startswith("--")):
+            return
+        self.diagnostics.record_untimed(statement_shape(sql))
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or DiagnosticCursor)
+
+    # Connection.execute and friends do not go through cursor()
+    def execute(self, sql: str, parameters: Any = ()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if not self.in_transaction:
+            return super().commit()
+        started = time.perf_counter()
+        self.in_cursor = True
+        try:
+            super().commit()
+        finally:
+            self.in_cursor = False
+        self.diagnostics.record("COMMIT", time.perf_counter() - started, 0, ())
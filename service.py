@@ -0,0 +1,341 @@
+"""Headless HTTP/JSON service in front of HealthcareBlockchain.
+
+Runs on asyncio with a small HTTP/1.1 front end (keep-alive, JSON bodies) so
+many clients can share one node. SQLite and hashing work is offloaded: every
+write goes through a single-thread executor, which keeps chain appends in
+order, while reads run on a thread pool over the database's read connections.
+
+Endpoints:
+    POST /register      {"username", "password", "user_type"}
+    POST /login         {"username", "password"} -> {"ok", "user_type", "token"}
+    POST /logout
+    POST /records       {"patient_id", "record": {"diagnosis", "treatment", ...}}
+    POST /access/grant  {"provider_id"}
+    GET  /records?patient_id=...[&limit=N&cursor=...]
+    GET  /search?q=...[&limit=N&cursor=...]   503 if records are encrypted
+    GET  /diagnostics/sql         slowest statements (MEDICHAIN_SQL_DIAGNOSTICS)
+    GET  /auth/metrics
+    GET  /metrics[?format=json]   Prometheus text, or a JSON snapshot
+
+Every endpoint but /register, /login and the two metrics routes needs an
+"Authorization: Bearer <token>" header with a token from /login, and acts as
+that session's user; identities in the body or query string are never
+trusted. Sessions are checked with a dict lookup, while password hashing
+runs on the authenticator's own pool. A record may be added by its patient
+or a provider the patient granted access, and only a patient grants access
+to their own records.
+
+Operation metrics (see metrics.py) are recorded with --metrics or when
+MEDICHAIN_METRICS is set.
+
+Usage: python service.py [--host 127.0.0.1] [--port 8080] [--db ...] [--metrics]
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, NamedTuple, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from blockchain import HealthcareBlockchain
+from database import SearchUnavailableError
+from user_manager import UserManager
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    500: "Server Error",
+    503: "Service Unavailable",
+}
+MAX_BODY = 1 << 20
+# Largest page a paginated endpoint returns, whatever limit asks for
+MAX_PAGE_SIZE = 1000
+# Routes served without a session
+PUBLIC_ROUTES = {
+    ("POST", "/register"),
+    ("POST", "/login"),
+    ("GET", "/auth/metrics"),
+    ("GET", "/metrics"),
+}
+
+
+class Session(NamedTuple):
+    """The authenticated user a request acts as"""
+
+    username: str
+    user_type: str
+    token: str
+
+
+class HealthcareService:
+    def __init__(self, blockchain: HealthcareBlockchain, read_workers: int = 8):
+        self.blockchain = blockchain
+        self.user_manager = UserManager(blockchain.db)
+        self.auth = self.user_manager.auth
+        self._writes = ThreadPoolExecutor(1, thread_name_prefix="medichain-write")
+        self._reads = ThreadPoolExecutor(
+            read_workers, thread_name_prefix="medichain-read"
+        )
+        self.routes = {
+            ("POST", "/register"): self.register,
+            ("POST", "/login"): self.login,
+            ("POST", "/logout"): self.logout,
+            ("POST", "/records"): self.add_record,
+            ("POST", "/access/grant"): self.grant_access,
+            ("GET", "/records"): self.get_records,
+            ("GET", "/search"): self.search_records,
+            ("GET", "/auth/metrics"): self.auth_metrics,
+            ("GET", "/metrics"): self.operation_metrics,
+            ("GET", "/diagnostics/sql"): self.sql_diagnostics,
+        }
+
+    async def _write(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._writes, fn, *args)
+
+    async def _read(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._reads, fn, *args)
+
+    async def register(
+        self, body: Dict[str, Any], session: Optional[Session]
+    ) -> Tuple[int, Dict[str, Any]]:
+        username = body["username"]
+        user_type = body["user_type"]
+        if user_type not in ("patient", "doctor", "hospital"):
+            return 400, {"error": "Unknown user type"}
+        password_hash = await asyncio.wrap_future(
+            self.auth.hash_async(body["password"])
+        )
+        if password_hash is None:
+            return 500, {"error": "Authentication is overloaded"}
+        ok = await self._write(
+            self.blockchain.add_user,
+            username,
+            user_type,
+            body["password"],
+            password_hash,
+        )
+        return 200, {"ok": ok}
+
+    async def login(
+        self, body: Dict[str, Any], session: Optional[Session]
+    ) -> Tuple[int, Dict[str, Any]]:
+        username = body["username"]
+        ok, user_type = await asyncio.wrap_future(
+            self.auth.authenticate_async(username, body["password"])
+        )
+        token = self.auth.create_session(username, user_type) if ok else None
+        return 200, {"ok": ok, "user_type": user_type, "token": token}
+
+    async def logout(
+        self, body: Dict[str, Any], session: Session
+    ) -> Tuple[int, Dict[str, Any]]:
+        self.auth.end_session(session.token)
+        return 200, {"ok": True}
+
+    async def auth_metrics(
+        self, query: Dict[str, Any], session: Optional[Session]
+    ) -> Tuple[int, Dict[str, Any]]:
+        return 200, self.auth.metrics()
+
+    async def operation_metrics(
+        self, query: Dict[str, Any], session: Optional[Session]
+    ) -> Tuple[int, Union[Dict, str]]:
+        if query.get("format") == "json":
+            return 200, metrics.REGISTRY.snapshot()
+        return 200, metrics.REGISTRY.prometheus_text()
+
+    async def sql_diagnostics(
+        self, query: Dict[str, Any], session: Session
+    ) -> Tuple[int, Dict]:
+        limit = int(query.get("limit", 20))
+        statements = await self._read(self.blockchain.db.query_report, limit)
+        return 200, {"statements": statements}
+
+    async def add_record(
+        self, body: Dict[str, Any], session: Session
+    ) -> Tuple[int, Dict[str, Any]]:
+        patient_id = body["patient_id"]
+        if patient_id != session.username and not self.blockchain.has_access(
+            patient_id, session.username
+        ):
+            return 403, {"error": "No access to this patient's records"}
+        ok = await self._write(
+            self.blockchain.add_medical_record, patient_id, body["record"]
+        )
+        return 200, {"ok": ok}
+
+    async def grant_access(
+        self, body: Dict[str, Any], session: Session
+    ) -> Tuple[int, Dict[str, Any]]:
+        # The grant is always made by the session's patient for their records
+        if body.get("patient_id", session.username) != session.username:
+            return 403, {"error": "Only a patient can grant access to their records"}
+        ok = await self._write(
+            self.blockchain.grant_access, session.username, body["provider_id"]
+        )
+        return 200, {"ok": ok}
+
+    async def get_records(
+        self, query: Dict[str, Any], session: Session
+    ) -> Tuple[int, Dict[str, Any]]:
+        patient_id = query.get("patient_id", session.username)
+        if "limit" not in query:
+            records = await self._read(
+                self.blockchain.get_patient_records, patient_id, session.username
+            )
+            return 200, {"records": records}
+
+        rows, next_cursor = await self._read(
+            self.blockchain.get_patient_records_page,
+            patient_id,
+            session.username,
+            min(int(query["limit"]), MAX_PAGE_SIZE),
+            query.get("cursor"),
+        )
+        return 200, {"records": [dict(row) for row in rows], "cursor": next_cursor}
+
+    async def search_records(
+        self, query: Dict[str, Any], session: Session
+    ) -> Tuple[int, Dict]:
+        try:
+            rows, next_cursor = await self._read(
+                self.blockchain.search_records,
+                session.username,
+                query["q"],
+                min(int(query.get("limit", 20)), MAX_PAGE_SIZE),
+                query.get("cursor"),
+            )
+        except SearchUnavailableError as e:
+            return 503, {"error": f"Search is unavailable: {str(e)}"}
+        return 200, {"records": rows, "cursor": next_cursor}
+
+    async def dispatch(
+        self,
+        method: str,
+        target: str,
+        body: bytes,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, Union[Dict[str, Any], str]]:
+        """Route a request; handlers answer with a JSON-ready dict, or a str
+        sent as plain text"""
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            return 404, {"error": f"No route for {method} {url.path}"}
+        session = None
+        if (method, url.path) not in PUBLIC_ROUTES:
+            scheme, _, token = (headers or {}).get("authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not token.strip():
+                return 401, {"error": "Authentication required"}
+            user = self.auth.validate_session(token.strip())
+            if user is None:
+                return 401, {"error": "Invalid or expired session"}
+            session = Session(user[0], user[1], token.strip())
+        try:
+            if method == "GET":
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                return await handler(query, session)
+            return await handler(json.loads(body or b"{}"), session)
+        except (KeyError, TypeError, ValueError) as e:
+            return 400, {"error": f"Bad request: {str(e)}"}
+        except Exception as e:
+            print(f"Error handling {method} {url.path}: {str(e)}")
+            return 500, {"error": "Internal error"}
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY:
+                    status, payload = 400, {"error": "Request body too large"}
+                    body = b""
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.dispatch(
+                        method, target, body, headers
+                    )
+
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    and version == "HTTP/1.1"
+                )
+                if isinstance(payload, str):
+                    data = payload.encode()
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    data = json.dumps(payload).encode()
+                    content_type = "application/json"
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                        f"Content-Type: {content_type}\r\n"
+                        f"Content-Length: {len(data)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                        "\r\n"
+                    ).encode()
+                    + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"MediChain service listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self._writes.shutdown()
+        self._reads.shutdown()
+        self.auth.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MediChain HTTP/JSON service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default="healthcare_blockchain.db")
+    parser.add_argument("--read-workers", type=int, default=8)
+    parser.add_argument("--block-store", choices=["sqlite", "log"])
+    parser.add_argument(
+        "--metrics", action="store_true", help="record operation metrics"
+    )
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable()
+    blockchain = HealthcareBlockchain(args.db, block_store=args.block_store)
+    service = HealthcareService(blockchain, args.read_workers)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
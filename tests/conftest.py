@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blockchain import HealthcareBlockchain  # noqa: E402
+
+
+def make_record(diagnosis: str = "flu", date: str = "2024-01-01"):
+    return {"diagnosis": diagnosis, "treatment": "rest", "date": date}
+
+
+@pytest.fixture
+def blockchain(tmp_path):
+    chain = HealthcareBlockchain(str(tmp_path / "chain.db"))
+    chain.add_user("alice", "patient", "pw")
+    yield chain
+    chain.db.close()
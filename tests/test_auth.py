@@ -0,0 +1,64 @@
+import pytest
+
+import auth
+from auth import Authenticator
+
+
+@pytest.fixture
+def authenticator(blockchain):
+    authenticator = Authenticator(blockchain.db, workers=1)
+    assert authenticator.register("bob", "secret", "doctor")
+    yield authenticator
+    authenticator.close()
+
+
+def test_login_checks_the_password(authenticator):
+    assert authenticator.authenticate("bob", "secret") == (True, "doctor")
+    assert authenticator.authenticate("bob", "wrong") == (False, None)
+
+
+def test_unknown_users_are_checked_against_a_dummy_hash(authenticator, monkeypatch):
+    checked = []
+    check_password = auth._check_password
+
+    def recording_check(password, stored, kdf):
+        checked.append(stored)
+        return check_password(password, stored, kdf)
+
+    monkeypatch.setattr(auth, "_check_password", recording_check)
+    assert authenticator.authenticate("nobody", "secret") == (False, None)
+    assert checked == [authenticator._dummy_hash]
+    # The dummy hash matches no password, not even its own text
+    assert not auth.verify_password(authenticator._dummy_hash, checked[0])
+
+
+def test_expired_sessions_are_dropped_when_new_ones_are_created(blockchain):
+    authenticator = Authenticator(
+        blockchain.db, workers=1, session_ttl=0.0, purge_interval=0.0
+    )
+    try:
+        tokens = [authenticator.create_session("bob", "doctor") for _ in range(3)]
+        assert authenticator.metrics()["active_sessions"] == 1
+        assert authenticator.validate_session(tokens[-1]) is None
+    finally:
+        authenticator.close()
+
+
+def test_sessions_are_swept_at_most_once_per_interval(blockchain):
+    authenticator = Authenticator(
+        blockchain.db, workers=1, session_ttl=0.0, purge_interval=3600.0
+    )
+    try:
+        for _ in range(3):
+            authenticator.create_session("bob", "doctor")
+        assert authenticator.metrics()["active_sessions"] == 3
+        assert authenticator.purge_sessions() == 3
+        assert authenticator.metrics()["active_sessions"] == 0
+    finally:
+        authenticator.close()
+
+
+def test_live_sessions_survive_a_sweep(authenticator):
+    token = authenticator.create_session("bob", "doctor")
+    assert authenticator.purge_sessions() == 0
+    assert authenticator.validate_session(token) == ("bob", "doctor")
@@ -0,0 +1,110 @@
+import pytest
+
+from blockchain import Block, Blockchain, HealthcareBlockchain, check_block, merkle_root
+from conftest import make_record
+
+
+@pytest.fixture
+def batched(tmp_path):
+    chain = HealthcareBlockchain(str(tmp_path / "batched.db"), batch_size=3)
+    chain.add_user("alice", "patient", "pw")
+    yield chain
+    chain.db.close()
+
+
+def stored_diagnoses(chain):
+    return sorted(r["diagnosis"] for r in chain.db.get_patient_records("alice"))
+
+
+@pytest.mark.parametrize(
+    "record",
+    [
+        {"diagnosis": "flu", "treatment": "rest"},
+        {**make_record(), "date": 20240101},
+        {**make_record(), "notes": {"not": "text"}},
+        {**make_record(), "extra": {1, 2}},
+    ],
+)
+def test_invalid_records_are_refused_before_queueing(batched, record):
+    assert batched.add_medical_record("alice", make_record("a"))
+    assert not batched.add_medical_record("alice", record)
+    assert len(batched.pending_transactions) == 1
+
+    assert batched.add_medical_record("alice", make_record("b"))
+    assert batched.add_medical_record("alice", make_record("c"))
+    assert batched.pending_transactions == []
+    assert stored_diagnoses(batched) == ["a", "b", "c"]
+
+
+def test_failed_flush_keeps_valid_records_queued(batched, monkeypatch):
+    insert = batched.db.add_medical_records
+    calls = []
+
+    def fails_once(*args, **kwargs):
+        calls.append(args)
+        return False if len(calls) == 1 else insert(*args, **kwargs)
+
+    monkeypatch.setattr(batched.db, "add_medical_records", fails_once)
+    assert batched.add_medical_record("alice", make_record("a"))
+    assert batched.add_medical_record("alice", make_record("b"))
+    # The record that triggered the failed flush is not queued
+    assert not batched.add_medical_record("alice", make_record("c"))
+    assert len(batched.pending_transactions) == 2
+
+    assert batched.add_medical_record("alice", make_record("c"))
+    assert batched.pending_transactions == []
+    assert stored_diagnoses(batched) == ["a", "b", "c"]
+    assert batched.verify_blockchain_integrity(True)
+
+
+def test_flush_drops_records_that_can_never_succeed(batched):
+    assert batched.add_medical_record("alice", make_record("a"))
+    # Queued directly, bypassing add_medical_record's validation
+    batched.add_transaction(
+        {
+            "username": "alice",
+            "medical_data": {"diagnosis": "undated", "treatment": "rest"},
+            "record_type": "medical_record",
+        }
+    )
+    assert not batched.flush_pending()
+    assert len(batched.pending_transactions) == 1
+    assert batched.flush_pending()
+    assert stored_diagnoses(batched) == ["a"]
+
+
+def test_merkle_root_commits_to_the_transaction_count():
+    a, b, c = ({"n": n} for n in range(3))
+    assert merkle_root([a, b, c]) != merkle_root([a, b, c, c])
+    assert merkle_root([a, b]) != merkle_root([a, b, b])
+    assert merkle_root([a]) != merkle_root([a, a])
+
+
+def sealed_batch():
+    chain = Blockchain()
+    for n in range(3):
+        chain.add_transaction(
+            {"username": "alice", "medical_data": make_record(f"d{n}")}
+        )
+    return chain.chain[0], chain.seal_pending_transactions()
+
+
+def test_sealed_batches_pass_validation():
+    genesis, batch = sealed_batch()
+    assert check_block(batch, genesis)
+
+
+def test_tampered_batch_transaction_is_rejected():
+    genesis, batch = sealed_batch()
+    batch.data["transactions"][1]["medical_data"]["diagnosis"] = "forged"
+    assert not check_block(batch, genesis)
+    # Re-hashing the block over the forged data still leaves the stale root
+    forged = Block(batch.index, batch.timestamp, batch.data, batch.previous_hash)
+    assert not check_block(forged, genesis)
+
+
+def test_batch_with_a_dropped_transaction_is_rejected():
+    genesis, batch = sealed_batch()
+    batch.data["transactions"].pop()
+    forged = Block(batch.index, batch.timestamp, batch.data, batch.previous_hash)
+    assert not check_block(forged, genesis)
@@ -0,0 +1,73 @@
+import pytest
+
+from blob_store import BlobStore
+from conftest import make_record
+
+TRAVERSAL = "../../../../../../etc/passwd"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+@pytest.mark.parametrize(
+    "digest", [TRAVERSAL, "A" * 64, "a" * 63, "a" * 65, "g" * 64, None, 42]
+)
+def test_malformed_digests_are_rejected(store, digest):
+    assert not store.is_valid_digest(digest)
+    assert not store.exists(digest)
+    with pytest.raises(ValueError):
+        store.path_for(digest)
+
+
+def test_digest_length_follows_the_hash(tmp_path):
+    assert BlobStore(str(tmp_path / "b"), "blake2b").is_valid_digest("a" * 128)
+    assert not BlobStore(str(tmp_path / "s"), "sha512").is_valid_digest("a" * 64)
+
+
+def test_stored_blobs_round_trip(store):
+    ref = store.put_bytes(b"scan")
+    assert store.is_valid_digest(ref["digest"])
+    assert store.get_bytes(ref["digest"]) == b"scan"
+
+
+@pytest.mark.parametrize(
+    "attachment",
+    [
+        {"digest": TRAVERSAL, "size": 10},
+        {"digest": "A" * 64, "size": 10},
+        {"digest": "a" * 64, "size": 10},
+    ],
+)
+def test_records_with_malformed_attachments_are_refused(blockchain, attachment):
+    record = {**make_record(), "attachments": [attachment]}
+    assert not blockchain.add_medical_record("alice", record)
+    assert blockchain.db.get_patient_records("alice") == []
+
+
+def test_open_attachment_refuses_malformed_digests(blockchain):
+    assert blockchain.open_attachment("alice", "alice", TRAVERSAL) is None
+
+
+def test_attachment_size_comes_from_the_store(blockchain, tmp_path):
+    scan = tmp_path / "scan.bin"
+    scan.write_bytes(b"x" * 100)
+    ref = dict(blockchain.attach_file(str(scan)), size=1)
+    record = {**make_record(), "attachments": [ref]}
+    assert blockchain.add_medical_record("alice", record)
+    [stored] = blockchain.get_patient_attachments("alice", "alice")
+    assert stored["size"] == 100
+
+
+def test_verify_reports_missing_blobs(store):
+    assert not store.verify("a" * 64)
+    assert store.verify(store.put_bytes(b"scan")["digest"])
+
+
+def test_small_reads_return_the_whole_blob(store):
+    data = bytes(range(256)) * 40
+    with store.open(store.put_bytes(data)["digest"]) as reader:
+        pieces = iter(lambda: reader.read(7), b"")
+        assert b"".join(pieces) == data
+        assert reader.verified
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from blockchain import Block, HealthcareBlockchain
+from conftest import make_record
+from database import Database
+
+
+@pytest.fixture
+def logged(tmp_path):
+    chain = HealthcareBlockchain(str(tmp_path / "logged.db"), block_store="log")
+    chain.add_user("alice", "patient", "pw")
+    assert chain.add_medical_record("alice", make_record())
+    yield chain
+    chain.db.close()
+
+
+def next_block(index, previous_hash):
+    return Block(index, time.time(), {"index": index}, previous_hash)
+
+
+def test_savepoint_rollback_discards_appended_blocks(logged):
+    db = logged.db
+    latest = db.get_latest_block_index()
+    with pytest.raises(RuntimeError, match="outer"):
+        with db.transaction():
+            outer = next_block(latest + 1, db.get_latest_block()["hash"])
+            assert db.add_block(outer)
+            with pytest.raises(RuntimeError, match="inner"):
+                with db.transaction():
+                    assert db.add_block(next_block(latest + 2, outer.hash))
+                    raise RuntimeError("inner")
+            assert db.get_latest_block_index() == latest + 1
+            raise RuntimeError("outer")
+    assert db.get_latest_block_index() == latest
+    assert db.get_block(latest + 1) is None
+
+
+def test_uncommitted_blocks_are_hidden_from_other_threads(logged):
+    db = logged.db
+    latest = db.get_latest_block_index()
+    seen = {}
+
+    def read_in_thread(label):
+        def read():
+            seen[label] = db.get_latest_block_index()
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join()
+
+    with db.transaction():
+        assert db.add_block(next_block(latest + 1, db.get_latest_block()["hash"]))
+        read_in_thread("during")
+        assert db.get_latest_block_index() == latest + 1
+    read_in_thread("after")
+    assert seen == {"during": latest, "after": latest + 1}
+
+
+def test_committed_blocks_cannot_be_rolled_back(logged):
+    with pytest.raises(ValueError):
+        logged.db.block_log.rollback_to(1)
+
+
+def test_committed_blocks_survive_reopening(logged, tmp_path):
+    latest = logged.db.get_latest_block_index()
+    logged.db.close()
+    reopened = Database(str(tmp_path / "logged.db"))
+    try:
+        assert reopened.get_latest_block_index() == latest
+    finally:
+        reopened.close()
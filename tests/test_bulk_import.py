@@ -0,0 +1,41 @@
+import json
+
+from bulk_import import import_records
+from conftest import make_record
+
+
+def write_lines(path, lines):
+    with open(path, "a", encoding="utf-8") as f:
+        for line in lines:
+            f.write((line if isinstance(line, str) else json.dumps(line)) + "\n")
+
+
+def row(diagnosis):
+    return {"username": "alice", **make_record(diagnosis)}
+
+
+def stored_diagnoses(blockchain):
+    return sorted(r["diagnosis"] for r in blockchain.db.get_patient_records("alice"))
+
+
+def test_malformed_lines_are_counted_and_skipped(blockchain, tmp_path):
+    source = tmp_path / "records.jsonl"
+    write_lines(source, [row("a"), "{not json", "[1, 2]", '"text"', row("b")])
+
+    stats = import_records(blockchain, str(source), batch_size=2)
+    assert (stats["imported"], stats["invalid"]) == (2, 3)
+    assert stored_diagnoses(blockchain) == ["a", "b"]
+    assert blockchain.verify_blockchain_integrity(True)
+
+
+def test_import_resumes_after_a_malformed_line(blockchain, tmp_path):
+    source = tmp_path / "records.jsonl"
+    write_lines(source, [row("a"), "{not json"])
+    stats = import_records(blockchain, str(source), batch_size=1)
+    assert (stats["imported"], stats["invalid"]) == (1, 1)
+
+    write_lines(source, [row("b")])
+    stats = import_records(blockchain, str(source), batch_size=1)
+    assert stats["resumed_at"] == 2
+    assert (stats["imported"], stats["invalid"]) == (1, 0)
+    assert stored_diagnoses(blockchain) == ["a", "b"]
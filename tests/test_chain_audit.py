@@ -0,0 +1,22 @@
+import json
+import sqlite3
+
+from chain_audit import verify_chain_parallel
+from conftest import make_record
+
+
+def test_parallel_audit_matches_the_stored_chain(blockchain):
+    for day in range(1, 8):
+        assert blockchain.add_medical_record("alice", make_record(f"d{day}"))
+    tail = blockchain.db.get_latest_block_index()
+
+    result = verify_chain_parallel(blockchain.db_name, 0, tail + 1, chunk_size=3)
+    assert result == {"first_invalid": None, "last": (tail, blockchain.chain[-1].hash)}
+
+    conn = sqlite3.connect(blockchain.db_name)
+    data = json.dumps({"record_type": "medical_record", "username": "mallory"})
+    conn.execute("UPDATE blocks SET block_data = ? WHERE block_index = 4", (data,))
+    conn.commit()
+    conn.close()
+    result = verify_chain_parallel(blockchain.db_name, 0, tail + 1, chunk_size=3)
+    assert result["first_invalid"] == 4
@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import make_record
+from database import SearchUnavailableError
+
+
+@pytest.fixture
+def records(blockchain):
+    for day in range(1, 6):
+        assert blockchain.add_medical_record(
+            "alice", make_record(f"d{day}", f"2024-01-0{day}")
+        )
+    return blockchain
+
+
+@pytest.mark.parametrize("page_size", [0, -1])
+def test_page_sizes_below_one_raise(records, page_size):
+    with pytest.raises(ValueError):
+        records.db.get_patient_records_page("alice", page_size)
+    with pytest.raises(ValueError):
+        records.search_records("alice", "d1", page_size)
+
+
+def test_pages_cover_every_record_once(records):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = records.get_patient_records_page("alice", "alice", 2, cursor)
+        seen.extend(row["diagnosis"] for row in rows)
+        if cursor is None:
+            break
+    assert seen == ["d5", "d4", "d3", "d2", "d1"]
+
+
+def test_search_finds_usernames_without_word_characters(blockchain):
+    blockchain.add_user("!!!", "patient", "pw")
+    assert blockchain.add_medical_record("!!!", make_record("metformin"))
+    rows, cursor = blockchain.search_records("!!!", "metformin")
+    assert [row["username"] for row in rows] == ["!!!"]
+    assert cursor is None
+
+
+def test_search_refuses_to_answer_over_encrypted_records(records):
+    records.db.cipher = object()
+    with pytest.raises(SearchUnavailableError):
+        records.search_records("alice", "d1")
@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import make_record
+from service import MAX_PAGE_SIZE, HealthcareService
+
+
+@pytest.fixture
+def service(blockchain):
+    service = HealthcareService(blockchain, read_workers=2)
+    for username, user_type in [("mallory", "doctor"), ("bob", "doctor")]:
+        status, _ = call(
+            service,
+            "POST",
+            "/register",
+            {"username": username, "password": "pw", "user_type": user_type},
+        )
+        assert status == 200
+    yield service
+    service.close()
+
+
+def call(service, method, target, body=None, token=None):
+    headers = {"authorization": f"Bearer {token}"} if token else {}
+    payload = json.dumps(body).encode() if body is not None else b""
+    return asyncio.run(service.dispatch(method, target, payload, headers))
+
+
+def login(service, username):
+    status, body = call(
+        service, "POST", "/login", {"username": username, "password": "pw"}
+    )
+    assert status == 200
+    return body["token"]
+
+
+@pytest.mark.parametrize(
+    "method,target,body",
+    [
+        ("POST", "/access/grant", {"patient_id": "alice", "provider_id": "bob"}),
+        ("POST", "/records", {"patient_id": "alice", "record": make_record()}),
+        ("GET", "/records?patient_id=alice&requester_id=alice", None),
+        ("GET", "/search?q=flu", None),
+        ("POST", "/logout", None),
+        ("GET", "/diagnostics/sql", None),
+    ],
+)
+def test_protected_routes_need_a_session(service, method, target, body):
+    assert call(service, method, target, body)[0] == 401
+    assert call(service, method, target, body, token="not-a-token")[0] == 401
+
+
+def test_public_routes_need_no_session(service):
+    assert call(service, "GET", "/metrics")[0] == 200
+    assert call(service, "GET", "/auth/metrics")[0] == 200
+
+
+def test_only_the_patient_can_grant_access(service, blockchain):
+    mallory = login(service, "mallory")
+    status, _ = call(
+        service,
+        "POST",
+        "/access/grant",
+        {"patient_id": "alice", "provider_id": "mallory"},
+        mallory,
+    )
+    assert status == 403
+    assert not blockchain.has_access("alice", "mallory")
+
+    alice = login(service, "alice")
+    status, body = call(service, "POST", "/access/grant", {"provider_id": "bob"}, alice)
+    assert (status, body) == (200, {"ok": True})
+    assert blockchain.has_access("alice", "bob")
+
+
+def test_records_are_added_by_the_patient_or_an_authorized_provider(service):
+    alice, bob, mallory = (login(service, u) for u in ("alice", "bob", "mallory"))
+    record = {"patient_id": "alice", "record": make_record()}
+
+    assert call(service, "POST", "/records", record, mallory)[0] == 403
+    assert call(service, "POST", "/records", record, bob)[0] == 403
+    assert call(service, "POST", "/records", record, alice) == (200, {"ok": True})
+
+    call(service, "POST", "/access/grant", {"provider_id": "bob"}, alice)
+    assert call(service, "POST", "/records", record, bob) == (200, {"ok": True})
+
+
+def test_records_are_read_as_the_session_user(service):
+    alice, mallory = login(service, "alice"), login(service, "mallory")
+    record = {"patient_id": "alice", "record": make_record()}
+    call(service, "POST", "/records", record, alice)
+
+    # requester_id in the query is ignored; the session decides
+    target = "/records?patient_id=alice&requester_id=alice"
+    assert call(service, "GET", target, token=mallory)[1]["records"] == []
+    assert len(call(service, "GET", target, token=alice)[1]["records"]) == 1
+
+
+def test_logout_ends_the_session(service):
+    alice = login(service, "alice")
+    assert call(service, "POST", "/logout", token=alice)[0] == 200
+    assert call(service, "GET", "/records", token=alice)[0] == 401
+
+
+@pytest.mark.parametrize("target", ["/records?limit=0", "/search?q=flu&limit=-1"])
+def test_page_sizes_below_one_are_rejected(service, target):
+    alice = login(service, "alice")
+    assert call(service, "GET", target, token=alice)[0] == 400
+
+
+def test_page_sizes_are_capped(service, blockchain, monkeypatch):
+    alice = login(service, "alice")
+    page_sizes = []
+    get_page = blockchain.get_patient_records_page
+
+    def recording_page(patient_id, requester_id, page_size, cursor=None):
+        page_sizes.append(page_size)
+        return get_page(patient_id, requester_id, page_size, cursor)
+
+    monkeypatch.setattr(blockchain, "get_patient_records_page", recording_page)
+    assert call(service, "GET", "/records?limit=1000000", token=alice)[0] == 200
+    assert page_sizes == [MAX_PAGE_SIZE]
+
+
+def test_search_over_encrypted_records_is_an_error(service, blockchain):
+    alice = login(service, "alice")
+    blockchain.db.cipher = object()
+    assert call(service, "GET", "/search?q=flu", token=alice)[0] == 503
@@ -1,22 +1,20 @@
-import hashlib
 from typing import Optional, Tuple
+from auth import Authenticator
 from database import Database
 
 
 class UserManager:
-    def __init__(self, database: Database):
+    def __init__(
+        self, database: Database, authenticator: Optional[Authenticator] = None
+    ):
         self.db = database
+        # Password hashing runs on the authenticator's worker pool
+        self.auth = authenticator or Authenticator(database)
 
     def register_user(self, username: str, password: str, user_type: str) -> bool:
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        return self.db.add_user(username, hashed_password, user_type)
+        return self.auth.register(username, password, user_type)
 
     def authenticate_user(
         self, username: str, password: str
     ) -> Tuple[bool, Optional[str]]:
-        user = self.db.get_user(username)
-        if user:
-            hashed_password = hashlib.sha256(password.encode()).hexdigest()
-            if user[1] == hashed_password:
-                return True, user[2]
-        return False, None
+        return self.auth.authenticate(username, password)